@@ -0,0 +1,153 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import random
+import time
+
+from denovonear.weights import WeightedChoice
+
+from severity.simulation import analyse, analyse_stratified
+from severity.weights import weights as WEIGHTS
+
+def get_options():
+    parser = argparse.ArgumentParser(description='benchmark the alias table '
+        'sampler against the binary search through cumulative rates, or '
+        'simple simulations against stratified simulations.')
+    parser.add_argument('--sizes', type=int, nargs='+',
+        default=[1000, 10000, 100000, 300000, 500000],
+        help='numbers of site/allele entries to benchmark.')
+    parser.add_argument('--iterations', type=int, default=1000000,
+        help='number of simulations to time per gene size.')
+    parser.add_argument('--count', type=int, default=1,
+        help='number of de novos sampled per simulation.')
+    parser.add_argument('--seed', type=int, default=0,
+        help='seed for the randomly generated rates and severity scores.')
+    parser.add_argument('--stratified', default=False, action='store_true',
+        help='compare simple and stratified simulations, run until the '
+            'p-values are equally precise, rather than comparing samplers.')
+    parser.add_argument('--truncating', type=float, default=0.1,
+        help='proportion of sites which are truncating, and share a constant '
+            'severity score, for --stratified.')
+    
+    return parser.parse_args()
+
+def make_gene(size):
+    ''' make a gene with random mutation rates and severity scores per site
+    
+    Args:
+        size: number of site/allele entries
+    
+    Returns:
+        tuple of WeightedChoice for the rates, and list of severity scores
+    '''
+    rates = WeightedChoice()
+    for pos in range(size):
+        rates.add_choice(pos, random.uniform(1e-10, 1e-7), 'A', 'G')
+    
+    severity = [ random.uniform(0, 40) for x in range(size) ]
+    
+    return rates, severity
+
+def make_strata(severity, proportion):
+    ''' assign sites to missense or truncating strata
+    
+    Truncating sites get the single truncating weight, as with the weighted
+    severity scores.
+    
+    Args:
+        severity: list of severity scores per site
+        proportion: proportion of sites to make truncating
+    
+    Returns:
+        tuple of stratum labels per site (1 for truncating), and list of
+        severity scores, where truncating sites have the truncating weight.
+    '''
+    strata = [ int(random.random() < proportion) for x in severity ]
+    severity = [ WEIGHTS['truncating'] if label else score
+        for label, score in zip(strata, severity) ]
+    
+    return strata, severity
+
+def benchmark_stratified(args):
+    ''' time simple and stratified simulations run to the same precision
+    
+    The stratified simulations sample fewer sites per simulation, and have less
+    variance per simulation, so we compare the effective simulations (the
+    number of simple simulations with the same precision) per second.
+    '''
+    print('size\tmethod\tseconds\tp_value\tdraws\teffective\teffective_per_second')
+    for size in args.sizes:
+        rates, severity = make_gene(size)
+        strata, severity = make_strata(severity, args.truncating)
+        
+        # set the observed score in the upper tail of the null distribution
+        observed = 30.0 * args.count
+        
+        for method in ['simple', 'stratified']:
+            start = time.time()
+            if method == 'simple':
+                result = analyse(rates, severity, observed, args.count,
+                    max_iterations=args.iterations, seed=args.seed,
+                    full_output=True)
+                draws = result['iterations'] * args.count
+                effective = result['iterations']
+            else:
+                result = analyse_stratified(rates, severity, strata, observed,
+                    args.count, max_iterations=args.iterations, seed=args.seed,
+                    full_output=True)
+                draws = result['draws']
+                effective = result['effective_iterations']
+            delta = time.time() - start
+            
+            print('{}\t{}\t{:.3f}\t{:.3g}\t{}\t{:.0f}\t{:.0f}'.format(size,
+                method, delta, result['p_value'], draws, effective,
+                effective / delta))
+
+def main():
+    args = get_options()
+    random.seed(args.seed)
+    
+    if args.stratified:
+        benchmark_stratified(args)
+        return
+    
+    print('size\tcumulative_seconds\talias_seconds\tspeedup')
+    for size in args.sizes:
+        rates, severity = make_gene(size)
+        
+        # set the observed score near the median of the null distribution
+        observed = 20.0 * args.count
+        
+        timings = {}
+        for sampler in ['cumulative', 'alias']:
+            start = time.time()
+            analyse(rates, severity, observed, args.count,
+                min_iterations=args.iterations, max_iterations=args.iterations,
+                sampler=sampler)
+            timings[sampler] = time.time() - start
+        
+        speedup = timings['cumulative'] / timings['alias']
+        print('{}\t{:.3f}\t{:.3f}\t{:.2f}'.format(size, timings['cumulative'],
+            timings['alias'], speedup))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+
+from denovonear.ensembl_requester import EnsemblRequest
+
+from severity.regional_constraint import (load_regional_constraint,
+    build_constraint_index)
+
+def get_options():
+    parser = argparse.ArgumentParser(description='Precompute the constrained '
+        'regions for all genes, in chromosome coordinates.')
+    parser.add_argument('--constraint', required=True,
+        help='Path to table of regional constraint.')
+    parser.add_argument('--cache', default='cache',
+        help='Path to cache transcript coordinates and sequence from Ensembl.')
+    parser.add_argument('--genome-build', default='grch37',
+        help='Genome build for coordinates from Ensembl.')
+    parser.add_argument('--threshold', type=float, default=1e-4,
+        help='P-value threshold for regions to count as constrained.')
+    parser.add_argument('--ratio-threshold', type=float, default=1.0,
+        help='Regions with higher observed/expected ratios than this are '
+            'not constrained.')
+    parser.add_argument('-o', '--output', required=True,
+        help='Path to write the constraint index to.')
+    
+    return parser.parse_args()
+
+def main():
+    args = get_options()
+    
+    ensembl = EnsemblRequest(args.cache, args.genome_build)
+    constraint = load_regional_constraint(args.constraint)
+    build_constraint_index(ensembl, constraint, args.output, args.threshold,
+        args.ratio_threshold)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+
+import pysam
+
+from severity.cadd_store import convert_cadd
+
+def get_options():
+    parser = argparse.ArgumentParser(description='Convert genome-wide CADD '
+        'scores into memory-mapped arrays, for the regions we analyse.')
+    parser.add_argument('--cadd', required=True,
+        help='Path to tabix-indexed CADD scores for all SNVs.')
+    parser.add_argument('--regions', required=True,
+        help='Path to BED file of regions to keep, e.g. coding exons.')
+    parser.add_argument('--padding', type=int, default=10,
+        help='Number of bases to add either side of each region, to include '
+            'the splice sites flanking coding exons.')
+    parser.add_argument('-o', '--output', required=True,
+        help='Path to folder to write the converted scores to.')
+    
+    return parser.parse_args()
+
+def open_regions(path, padding):
+    ''' load regions from a BED file
+    
+    Args:
+        path: path to BED file
+        padding: number of bases to extend regions by on either side
+    
+    Returns:
+        dict of lists of (start, end) tuples, with 1-based inclusive
+        coordinates, indexed by chromosome
+    '''
+    
+    regions = {}
+    with open(path) as handle:
+        for line in handle:
+            if line.startswith(('#', 'track', 'browser')):
+                continue
+            
+            chrom, start, end = line.split('\t')[:3]
+            chrom = chrom.replace('chr', '')
+            if chrom not in regions:
+                regions[chrom] = []
+            
+            start = max(1, int(start) + 1 - padding)
+            regions[chrom].append((start, int(end) + padding))
+    
+    return regions
+
+def main():
+    args = get_options()
+    
+    regions = open_regions(args.regions, args.padding)
+    convert_cadd(pysam.TabixFile(args.cadd), regions, args.output)
+
+if __name__ == '__main__':
+    main()
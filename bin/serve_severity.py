@@ -0,0 +1,77 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+
+from severity.server import AnalysisService, make_server
+from severity.service import make_analyser
+
+def get_options():
+    parser = argparse.ArgumentParser(description='Serve severity analyses '
+        'over HTTP on localhost, keeping the reference data loaded between '
+        'requests. POST a JSON object with "symbol" and "de_novos" (a list of '
+        'objects with chrom, pos, ref, alt and consequence) to /analyse. GET '
+        '/stats for request latency and throughput.')
+    parser.add_argument('--cadd',
+        default='/lustre/scratch113/projects/ddd/users/ps14/CADD/whole_genome_SNVs.tsv.gz',
+        help='Path to tabix-indexed CADD scores for all SNVs, or to a folder '
+            'of scores converted with convert_cadd.py.')
+    parser.add_argument('--constraint',
+        help='Path to table of regional constraint, or to an index built with '
+            'build_constraint_index.py.')
+    parser.add_argument('--cache', default='cache',
+        help='Path to cache transcript coordinates and sequence from Ensembl.')
+    parser.add_argument('--site-cache',
+        help='Path to folder of cached per-gene site tables.')
+    parser.add_argument('--max-genes', type=int, default=1000,
+        help='Number of per-gene site tables to hold in memory.')
+    parser.add_argument('--genome-build', default='grch37',
+        help='Genome build for coordinates from Ensembl.')
+    parser.add_argument('--workers', type=int, default=4,
+        help='Number of genes to analyse concurrently.')
+    parser.add_argument('--host', default='127.0.0.1',
+        help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8765,
+        help='Port to listen on.')
+    
+    return parser.parse_args()
+
+def main():
+    args = get_options()
+    
+    analyse, site_cache = make_analyser(args)
+    hooks = {'site_cache_hits': lambda: site_cache.hits,
+        'site_cache_misses': lambda: site_cache.misses,
+        'site_cache_genes': lambda: len(site_cache)}
+    service = AnalysisService(analyse, args.workers, hooks)
+    
+    server = make_server(service, args.host, args.port)
+    print('listening on {}:{}'.format(*server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == '__main__':
+    main()
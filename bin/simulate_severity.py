@@ -20,6 +20,9 @@ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import argparse
+import os
+import sys
+from multiprocessing import Pool
 
 import pysam
 
@@ -27,8 +30,13 @@ from denovonear.ensembl_requester import EnsemblRequest
 from denovonear.load_mutation_rates import load_mutation_rates
 
 from severity.open_mutations import open_mutations
-from severity.regional_constraint import load_regional_constraint
+from severity.regional_constraint import open_constraint
+from severity.cadd_store import CaddStore
 from severity.check_gene import analyse_gene
+from severity.site_cache import SiteCache, file_signature
+from severity.null_cache import NullCache
+from severity.runner import schedule, gene_seed, load_completed, HEADER
+from severity.simulation import get_seed
 from severity.weights import weights as WEIGHTS
 
 def get_options():
@@ -39,43 +47,162 @@ def get_options():
             'named chrom, pos, ref, alt, symbol, and consequence.'),
     parser.add_argument('--cadd',
         default='/lustre/scratch113/projects/ddd/users/ps14/CADD/whole_genome_SNVs.tsv.gz',
-        help='Path to tabix-indexed CADD scores for all SNVs.')
+        help='Path to tabix-indexed CADD scores for all SNVs, or to a folder '
+            'of scores converted with convert_cadd.py.')
+    parser.add_argument('--cadd-gap', type=int, default=1000,
+        help='Largest gap (in bp) between sites to read through in the CADD '
+            'file, rather than seeking to the next site. Larger gaps mean '
+            'fewer seeks, but more lines read.')
     parser.add_argument('--constraint',
-        help='Path to table of regional constraint.')
+        help='Path to table of regional constraint, or to an index built with '
+            'build_constraint_index.py.')
     parser.add_argument('--cache', default='cache',
         help='Path to cache transcript coordinates and sequence from Ensembl.')
+    parser.add_argument('--site-cache',
+        help='Path to folder to cache per-gene site rates and CADD scores in. '
+            'Later runs load genes from here, rather than rebuilding them.')
+    parser.add_argument('--null-cache',
+        help='Path to sqlite database to store exact null distributions in, '
+            'for reuse in later runs. Only used with --method exact.')
+    parser.add_argument('--null-cache-size', type=float, default=1.0,
+        help='Largest size (in GB) for the stored null distributions. The '
+            'least recently used are removed beyond this.')
     parser.add_argument('--genome-build', default='grch37',
         help='Genome build for coordinates from Ensembl.')
+    parser.add_argument('--method', default='simulate',
+        choices=['simulate', 'stratified', 'exact', 'importance'],
+        help='How to calculate p-values. "stratified" simulates within '
+            'consequence classes, which needs fewer sampled sites, "exact" '
+            'uses the exact null distribution, and "importance" uses '
+            'importance sampling, which is better for extremely low p-values.')
+    parser.add_argument('--alpha', type=float,
+        help='Significance threshold. Simulations for a gene stop early once '
+            'the p-value clearly cannot reach this.')
+    parser.add_argument('--weighted', default=False, action='store_true',
+        help='Reweight CADD scores by consequence, CADD score and regional '
+            'constraint, rather than using the raw CADD scores.')
+    parser.add_argument('--threads', type=int, default=1,
+        help='Number of threads to run simulations for each gene with.')
+    parser.add_argument('--workers', type=int, default=1,
+        help='Number of processes to analyse genes in parallel with.')
+    parser.add_argument('--seed', type=int,
+        help='Seed to derive per-gene seeds from. Defaults to a random seed. '
+            'Per-gene seeds are written to the output, for reproducibility.')
+    parser.add_argument('--resume', default=False, action='store_true',
+        help='Skip genes already in the output file, from an earlier run.')
     
     parser.add_argument('-o', '--output', default='results.txt',
         help='Path to write output results to.')
     
     return parser.parse_args()
 
+# per-process resources for analysing genes, these are set up once per worker
+RESOURCES = {}
+
+def init_resources(args):
+    ''' open the resources needed to analyse genes within the current process
+    
+    Worker processes call this once as they start, so each worker opens the
+    CADD file, and loads the mutation rates and regional constraint once,
+    rather than once per gene.
+    
+    Args:
+        args: command line arguments
+    '''
+    
+    RESOURCES['args'] = args
+    RESOURCES['ensembl'] = EnsemblRequest(args.cache, args.genome_build)
+    if os.path.isdir(args.cadd):
+        RESOURCES['cadd'] = CaddStore(args.cadd)
+    else:
+        RESOURCES['cadd'] = pysam.TabixFile(args.cadd)
+    RESOURCES['constraint'] = open_constraint(args.constraint)
+    RESOURCES['mut_dict'] = load_mutation_rates()
+    
+    RESOURCES['null_cache'] = None
+    if args.null_cache is not None:
+        RESOURCES['null_cache'] = NullCache(args.null_cache,
+            int(args.null_cache_size * 2**30))
+    
+    RESOURCES['site_cache'] = None
+    if args.site_cache is not None:
+        inputs = [RESOURCES['mut_dict'], file_signature(args.cadd),
+            file_signature(args.constraint)]
+        RESOURCES['site_cache'] = SiteCache(args.site_cache, args.genome_build,
+            inputs)
+
+def run_gene(job):
+    ''' analyse a single gene, using the resources for the current process
+    
+    Args:
+        job: tuple of HGNC symbol and list of de novos in the gene
+    
+    Returns:
+        tuple of HGNC symbol and dict of results, with the p-value, the seed
+        and the number of iterations run.
+    '''
+    
+    symbol, de_novos = job
+    args = RESOURCES['args']
+    result = analyse_gene(RESOURCES['ensembl'], RESOURCES['mut_dict'],
+        RESOURCES['cadd'], symbol, de_novos, RESOURCES['constraint'], WEIGHTS,
+        method=args.method, alpha=args.alpha, threads=args.threads,
+        seed=gene_seed(args.seed, symbol), full_output=True,
+        site_cache=RESOURCES['site_cache'], max_gap=args.cadd_gap,
+        weighted=args.weighted, null_cache=RESOURCES['null_cache'])
+    
+    return symbol, result
+
 def main():
     args = get_options()
     
-    ensembl = EnsemblRequest(args.cache, args.genome_build)
-    cadd = pysam.TabixFile(args.cadd)
+    # pick the run seed before starting any workers, so they all share it
+    args.seed = get_seed(args.seed)
     
-    constraint = load_regional_constraint(args.constraint)
+    completed = set()
+    if args.resume:
+        try:
+            completed = load_completed(args.output)
+        except ValueError as error:
+            sys.exit('error: {}'.format(error))
     
-    # open de novo mutations
+    # open de novo mutations, and skip genes which have already been analysed
     all_de_novos = open_mutations(args.de_novos)
+    for symbol in completed & set(all_de_novos):
+        del all_de_novos[symbol]
     
-    mut_dict = load_mutation_rates()
+    pool = None
+    if args.workers > 1:
+        constraint = open_constraint(args.constraint)
+        jobs = schedule(all_de_novos, constraint)
+        pool = Pool(args.workers, initializer=init_resources, initargs=(args, ))
+        
+        # results come back in the scheduled order, as each gene completes
+        results = pool.imap(run_gene, jobs)
+    else:
+        init_resources(args)
+        jobs = schedule(all_de_novos, RESOURCES['constraint'])
+        results = ( run_gene(job) for job in jobs )
     
-    output = open(args.output, 'w')
-    output.write('symbol\tseverity_p_value\n')
-    for symbol in all_de_novos:
-        if symbol in ['', '.']:
-            continue
+    mode = 'a' if completed else 'w'
+    with open(args.output, mode) as output:
+        if not completed:
+            output.write(HEADER)
         
-        print(symbol)
-        de_novos = all_de_novos[symbol]
-        p_value = analyse_gene(ensembl, mut_dict, cadd, symbol, de_novos, constraint, WEIGHTS)
-        line = '{}\t{}\n'.format(symbol, p_value)
-        output.write(line)
+        for symbol, result in results:
+            print(symbol)
+            line = '{}\t{}\t{}\t{}\n'.format(symbol, result['p_value'],
+                result['seed'], result['iterations'])
+            
+            # write each gene as a single complete line, and make sure it hits
+            # the disk, so we can resume from here if the job dies
+            output.write(line)
+            output.flush()
+            os.fsync(output.fileno())
+    
+    if pool is not None:
+        pool.close()
+        pool.join()
 
 if __name__ == '__main__':
     main()
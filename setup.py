@@ -24,7 +24,8 @@ from setuptools import setup
 from distutils.core import Extension
 from Cython.Build import cythonize
 
-EXTRA_COMPILE_ARGS = ["-std=c++11"]
+EXTRA_COMPILE_ARGS = ["-std=c++11", "-pthread"]
+EXTRA_LINK_ARGS = ["-pthread"]
 
 if sys.platform == "darwin":
     EXTRA_COMPILE_ARGS = ["-stdlib=libc++"]
@@ -32,8 +33,12 @@ if sys.platform == "darwin":
 severity = cythonize([
     Extension("severity.simulation",
         extra_compile_args=EXTRA_COMPILE_ARGS,
+        extra_link_args=EXTRA_LINK_ARGS,
         sources=["severity/simulation.pyx",
             "src/simulate.cpp",
+            "src/exact.cpp",
+            "src/importance.cpp",
+            "src/stratified.cpp",
             "src/weighted_choice.cpp"],
         include_dirs=["src/"],
         language="c++"),
@@ -48,6 +53,7 @@ setup (name="severity",
         packages=["severity", "severity.simulation"],
         install_requires=["intervaltree >= 2.1.0",
                           "denovonear >= 0.4.1",
+                          "numpy",
         ],
         classifiers=[
             "Development Status :: 3 - Alpha",
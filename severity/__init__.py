@@ -1,3 +1,4 @@
-from pkg_resources import get_distribution
-
-__version__ = get_distribution('severity').version
+# the version is set here rather than looked up from the installed package
+# metadata, since pkg_resources scans every installed distribution, which is
+# slow in large environments. Keep this in sync with setup.py.
+__version__ = '1.0.0'
@@ -0,0 +1,176 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import json
+import os
+
+import numpy
+
+BASES = 'ACGTN'
+
+# allele codes, where indels and unknown alleles are coded as N, which has no
+# scores
+BASE_CODES = dict( (x, i) for i, x in enumerate(BASES) )
+
+# convert allele codes to the column for the alt allele. Each position holds
+# scores for the three alts which differ from the reference, in ACGT order.
+# Rows and columns follow BASES, so N alleles map to -1 (no score).
+ALT_COLUMNS = numpy.array([[-1, 0, 1, 2, -1],
+    [0, -1, 1, 2, -1],
+    [0, 1, -1, 2, -1],
+    [0, 1, 2, -1, -1],
+    [-1, -1, -1, -1, -1]], dtype=numpy.int8)
+
+def merge_regions(regions):
+    ''' merge overlapping or adjacent regions
+    
+    Args:
+        regions: list of (start, end) tuples, with inclusive 1-based coordinates
+    
+    Returns:
+        sorted list of non-overlapping (start, end) tuples
+    '''
+    
+    merged = []
+    for start, end in sorted(regions):
+        if len(merged) > 0 and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    
+    return [ tuple(x) for x in merged ]
+
+def convert_cadd(cadd, regions, folder):
+    ''' convert CADD scores for a set of regions into a binary score store
+    
+    Args:
+        cadd: pysam.TabixFile for the genome-wide CADD scores
+        regions: dict of lists of (start, end) tuples (inclusive, 1-based),
+            indexed by chromosome. These would typically be the coding regions
+            plus the flanking splice sites.
+        folder: path to folder to write the store into
+    '''
+    
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    
+    for chrom in sorted(regions):
+        merged = merge_regions(regions[chrom])
+        starts = numpy.array([ x[0] for x in merged ], dtype=numpy.int64)
+        ends = numpy.array([ x[1] for x in merged ], dtype=numpy.int64)
+        offsets = numpy.concatenate([[0], numpy.cumsum(ends - starts + 1)])
+        
+        refs = numpy.full(offsets[-1], BASES.index('N'), dtype=numpy.uint8)
+        scores = numpy.full((offsets[-1], 3), numpy.nan, dtype=numpy.float32)
+        
+        for start, end, offset in zip(starts, ends, offsets):
+            for line in cadd.fetch(chrom, start - 1, end):
+                _, pos, ref, alt, _, score = line.split('\t')
+                row = offset + int(pos) - start
+                ref, alt = BASES.index(ref), BASES.index(alt)
+                refs[row] = ref
+                if ALT_COLUMNS[ref, alt] >= 0:
+                    scores[row, ALT_COLUMNS[ref, alt]] = float(score)
+        
+        prefix = os.path.join(folder, chrom)
+        numpy.save(prefix + '.starts.npy', starts)
+        numpy.save(prefix + '.ends.npy', ends)
+        numpy.save(prefix + '.offsets.npy', offsets[:-1])
+        numpy.save(prefix + '.refs.npy', refs)
+        numpy.save(prefix + '.scores.npy', scores)
+    
+    with open(os.path.join(folder, 'meta.json'), 'w') as handle:
+        json.dump({'chroms': sorted(regions)}, handle)
+
+class CaddStore(object):
+    ''' memory-mapped CADD scores, as written by convert_cadd()
+    
+    Each chromosome has the start, end and row offset for every region, plus
+    one row per position in the regions, with the reference allele and the
+    scores for the three alternate alleles. Scores are found by a binary search
+    for the region, then direct indexing into the rows. Since the arrays are
+    memory-mapped, processes share the scores via the page cache.
+    '''
+    
+    def __init__(self, folder):
+        self.folder = folder
+        
+        with open(os.path.join(folder, 'meta.json')) as handle:
+            self.chroms = json.load(handle)['chroms']
+        
+        self.arrays = {}
+    
+    def load(self, chrom):
+        ''' get the arrays for a chromosome, and memory-map them on first use
+        '''
+        if chrom not in self.arrays:
+            prefix = os.path.join(self.folder, chrom)
+            self.arrays[chrom] = dict( (key,
+                numpy.load('{}.{}.npy'.format(prefix, key), mmap_mode='r'))
+                for key in ['starts', 'ends', 'offsets', 'refs', 'scores'] )
+        
+        return self.arrays[chrom]
+    
+    def lookup(self, chrom, positions, alts):
+        ''' get the CADD scores for specific alleles
+        
+        Args:
+            chrom: chromosome
+            positions: list of chromosomal positions
+            alts: list of alternate alleles, one per position
+        
+        Returns:
+            numpy array of scores, in the same order as the positions
+        
+        Raises:
+            KeyError if any allele is missing from the store
+        '''
+        
+        if chrom not in self.chroms:
+            raise KeyError('chromosome not in CADD store: {}'.format(chrom))
+        
+        data = self.load(chrom)
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        alleles = list(alts)
+        alts = numpy.array([ BASE_CODES.get(x, BASES.index('N'))
+            for x in alleles ], dtype=numpy.uint8)
+        
+        idx = numpy.searchsorted(data['starts'], positions, side='right') - 1
+        inside = (idx >= 0) & (positions <= data['ends'][idx])
+        if not inside.all():
+            pos = positions[~inside][0]
+            raise KeyError('position not in CADD store: {}:{}'.format(chrom, pos))
+        
+        rows = data['offsets'][idx] + positions - data['starts'][idx]
+        columns = ALT_COLUMNS[data['refs'][rows], alts]
+        
+        scores = numpy.full(len(positions), numpy.nan, dtype=numpy.float32)
+        valid = columns >= 0
+        scores[valid] = data['scores'][rows[valid], columns[valid]]
+        
+        if numpy.isnan(scores).any():
+            missing = numpy.isnan(scores)
+            first = numpy.flatnonzero(missing)[0]
+            pos, alt = positions[first], alleles[first]
+            raise KeyError('no CADD score for {}:{} {}'.format(chrom, pos, alt))
+        
+        return scores
@@ -3,9 +3,16 @@ from denovonear.load_gene import load_gene
 from denovonear.site_specific_rates import SiteRates
 from denovonear.weights import WeightedChoice
 
-from severity.open_severity import get_severity
-from severity.simulation import analyse
+from severity.open_mutations import LOF_CQ
+from severity.open_severity import (get_severity, get_positions, fetch_scores,
+    weight_scores)
+from severity.simulation import (analyse, analyse_exact, analyse_importance,
+    analyse_stratified, exact_null_distribution, null_tail_probability,
+    get_seed)
 from severity.regional_constraint import get_constrained_positions
+from severity.cadd_store import CaddStore
+from severity.site_cache import (CONSEQUENCES, build_site_table,
+    table_to_rates, table_to_constrained, lookup_scores)
 
 def get_site_sampler(transcripts, mut_dict):
     ''' get per position and alt allele mutation probability sampler.
@@ -47,13 +54,16 @@ def get_site_sampler(transcripts, mut_dict):
     
     return all_rates
 
-def analyse_gene(ensembl, mut_dict, cadd, symbol, de_novos, constraint, weights):
+def analyse_gene(ensembl, mut_dict, cadd, symbol, de_novos, constraint, weights,
+        method='simulate', alpha=None, threads=1, seed=None, full_output=False,
+        site_cache=None, max_gap=1000, weighted=False, null_cache=None):
     ''' analyse the severity of de novos found in a gene
     
     Args:
         ensembl: EnsemblRequest object, for transcript coordinates and sequence
         mut_dict: list of sequence-context mutation probabilities.
-        cadd: pysam.TabixFile object for CADD scores (SNVs only)
+        cadd: pysam.TabixFile object for CADD scores (SNVs only), or a
+            CaddStore object for scores converted with convert_cadd().
         symbol: HGNC symbol for current gene
         de_novos: list of de novo mutations observed in current gene. Each entry
             is a dict with 'position', 'ref', 'alt', and 'consequence' keys.
@@ -61,36 +71,122 @@ def analyse_gene(ensembl, mut_dict, cadd, symbol, de_novos, constraint, weights)
             different weights for protein-truncating and protein-altering
             variants, and within the protein-altering variants, different
             weights for variants in constrained and unconstrained regions.
+        method: how to calculate the p-value. 'simulate' runs simulations
+            until the p-value is precise, 'stratified' runs simulations
+            stratified by consequence class, which need fewer sampled sites,
+            'exact' calculates the p-value from the exact null distribution,
+            and 'importance' uses importance sampling, which is better for
+            extremely low p-values.
+        alpha: significance threshold, simulations stop early once the gene
+            clearly cannot reach this. None runs until the p-value is precise.
+        threads: number of threads to run simulations with.
+        seed: seed for the simulations, or None for a random seed.
+        full_output: whether to return details of the analysis, rather than
+            just the p-value.
+        site_cache: SiteCache object, to load the per site rates and severity
+            scores for the gene from disk, rather than rebuilding them. Genes
+            missing from the cache are added to it. None skips the cache.
+        max_gap: largest gap between sites to read through in the CADD file,
+            rather than starting a new fetch.
+        weighted: whether to reweight the CADD scores by consequence, CADD
+            score and regional constraint (using the weights), rather than use
+            the raw CADD scores.
+        null_cache: NullCache object, to store the exact null distributions
+            for genes, and reuse them for later analyses with the same inputs
+            and de novo count. Only used with the 'exact' method.
     
     Returns:
         p-value for the observed total severity with respect to a null
-        distribution of severities for the gene.
+        distribution of severities for the gene. If full_output is True, this
+        returns a dict with the 'p_value', the number of 'iterations' run, and
+        the 'seed' used for the simulations.
     '''
     
+    seed = get_seed(seed)
+    result = {'p_value': 'NA', 'iterations': 0, 'seed': seed}
+    
     sites = [ x['pos'] for x in de_novos ]
     try:
         # create gene/transcript for de novo mutations
         transcripts = load_gene(ensembl, symbol, sites)
     except IndexError:
-        return 'NA'
+        return result if full_output else result['p_value']
+    
+    table, scores = None, None
+    if site_cache is not None:
+        table = site_cache.load(symbol, transcripts)
+    
+    if table is None:
+        # get per site/allele mutation rates
+        rates_by_cq = get_site_sampler(transcripts, mut_dict)
+        
+        chrom = transcripts[0].get_chrom()
+        
+        # fetch CADD scores for all the sites in one pass, including the de
+        # novos, which can sit outside the sampled sites. The scores can be
+        # looked up directly from a CaddStore, without a fetch.
+        if not isinstance(cadd, CaddStore):
+            positions = get_positions(rates_by_cq) | get_positions(de_novos)
+            scores = fetch_scores(cadd, chrom, positions, max_gap)
+        
+        # get per site/allele severity scores, weighted by enrichment of missense
+        # in known dominant at different severity thresholds
+        constrained = get_constrained_positions(ensembl, constraint, symbol)
+        severity = get_severity(cadd, chrom, rates_by_cq, weights, constrained,
+            scores=scores)
+        
+        table = build_site_table(rates_by_cq, chrom, severity, constrained)
+        if site_cache is not None:
+            site_cache.save(symbol, transcripts, table)
     
-    # get per site/allele mutation rates
-    rates_by_cq = get_site_sampler(transcripts, mut_dict)
+    # convert the table of rates per site to a site sampler
+    rates = table_to_rates(table)
+    severity = table['cadd']
+    chrom = table['chrom']
+    constrained = table_to_constrained(table)
     
-    chrom = transcripts[0].get_chrom()
+    # get scores for the observed de novos, only going to the CADD file for
+    # de novos without a score in the site table
+    observed = lookup_scores(table, de_novos)
+    missing = [ x for x, score in zip(de_novos, observed) if score is None ]
+    if len(missing) > 0:
+        fetched = iter(get_severity(cadd, chrom, missing, weights, constrained,
+            scores=scores, max_gap=max_gap))
+        observed = [ next(fetched) if x is None else x for x in observed ]
     
-    # get per site/allele severity scores, weighted by enrichment of missense
-    # in known dominant at different severity thresholds
-    constrained = get_constrained_positions(ensembl, constraint, symbol)
-    severity = get_severity(cadd, chrom, rates_by_cq, weights, constrained)
+    if weighted:
+        truncating = table['cq'] != CONSEQUENCES.index('missense')
+        severity = weight_scores(severity, table['pos'], truncating, weights,
+            constrained)
+        observed = weight_scores(observed, [ x['pos'] for x in de_novos ],
+            [ x['consequence'] in LOF_CQ for x in de_novos ], weights,
+            constrained)
     
-    # convert the rates per site per consequence to rates per site
-    rates = WeightedChoice()
-    for cq in sorted(rates_by_cq):
-        rates.append(rates_by_cq[cq])
+    severity = severity.tolist()
+    observed = sum(observed)
     
-    # get summed score for observed de novos
-    observed = sum(( get_severity(cadd, chrom, de_novos, weights, constrained) ))
+    if method == 'exact' and null_cache is not None:
+        key = null_cache.key(table['rate'], severity, len(de_novos), 0.01)
+        null = null_cache.get(key)
+        if null is None:
+            null = exact_null_distribution(rates, severity, len(de_novos))
+            null_cache.put(key, null, symbol)
+        result['p_value'], _, _ = null_tail_probability(null, observed)
+    elif method == 'exact':
+        result['p_value'], _, _ = analyse_exact(rates, severity, observed,
+            len(de_novos))
+    elif method == 'stratified':
+        result = analyse_stratified(rates, severity, table['cq'].tolist(),
+            observed, len(de_novos), alpha=alpha, threads=threads, seed=seed,
+            full_output=True)
+    elif method == 'importance':
+        result['iterations'] = 100000
+        result['p_value'], _ = analyse_importance(rates, severity, observed,
+            len(de_novos), iterations=result['iterations'], threads=threads,
+            seed=seed)
+    else:
+        # simulate distribution of summed scores within transcript
+        result = analyse(rates, severity, observed, len(de_novos), alpha=alpha,
+            threads=threads, seed=seed, full_output=True)
     
-    # simulate distribution of summed scores within transcript
-    return analyse(rates, severity, observed, len(de_novos), 1000000)
+    return result if full_output else result['p_value']
@@ -0,0 +1,142 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import hashlib
+import sqlite3
+import time
+import zlib
+
+import numpy
+
+class NullCache(object):
+    ''' on-disk cache of exact null distributions, with LRU eviction
+    
+    The null distribution of summed severity only depends on the site rates,
+    the severity scores and the number of de novos, so re-analysing a gene with
+    the same inputs and de novo count (e.g. in a new cohort) only needs the
+    observed total checked against the stored distribution.
+    
+    Distributions are stored compressed in a sqlite database. Once the stored
+    distributions exceed the size cap, the least recently used are removed.
+    '''
+    
+    def __init__(self, path, max_bytes=2**30):
+        '''
+        Args:
+            path: path to the sqlite database
+            max_bytes: largest total size of compressed distributions to keep
+        '''
+        self.path = path
+        self.max_bytes = max_bytes
+        self.db = None
+    
+    def connect(self):
+        ''' open the database on first use, so forked workers each get their
+        own connection.
+        '''
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, timeout=60)
+            self.db.execute('CREATE TABLE IF NOT EXISTS nulls (key TEXT '
+                'PRIMARY KEY, symbol TEXT, offset REAL, step REAL, count '
+                'INTEGER, max_error REAL, pmf BLOB, size INTEGER, last_used '
+                'REAL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS nulls_last_used ON '
+                'nulls (last_used)')
+            self.db.commit()
+        return self.db
+    
+    def key(self, rates, severity, count, resolution):
+        ''' get the key for a null distribution from its inputs
+        
+        Args:
+            rates: array of mutation rates for each site/allele
+            severity: array of severity scores, index-aligned with the rates
+            count: number of de novos
+            resolution: grid resolution for the exact distribution
+        
+        Returns:
+            checksum of the inputs, as a hex string
+        '''
+        digest = hashlib.md5()
+        digest.update(numpy.ascontiguousarray(rates, dtype=numpy.float64).tobytes())
+        digest.update(numpy.ascontiguousarray(severity, dtype=numpy.float64).tobytes())
+        digest.update('{}:{!r}'.format(count, resolution).encode('utf8'))
+        return digest.hexdigest()
+    
+    def get(self, key):
+        ''' get a null distribution from the cache, or None if not stored
+        '''
+        db = self.connect()
+        rows = db.execute('SELECT offset, step, count, max_error, pmf FROM '
+            'nulls WHERE key=?', (key, )).fetchall()
+        if len(rows) == 0:
+            return None
+        
+        db.execute('UPDATE nulls SET last_used=? WHERE key=?', (time.time(), key))
+        db.commit()
+        
+        offset, step, count, max_error, pmf = rows[0]
+        pmf = numpy.frombuffer(zlib.decompress(pmf), dtype=numpy.float64)
+        
+        return {'offset': offset, 'step': step, 'count': count,
+            'max_error': max_error, 'pmf': pmf}
+    
+    def put(self, key, null, symbol=None):
+        ''' store a null distribution, then evict old entries if over the cap
+        
+        Args:
+            key: key from NullCache.key()
+            null: dict for a null distribution, from exact_null_distribution()
+            symbol: HGNC symbol for the gene, only stored for reference
+        '''
+        pmf = zlib.compress(numpy.ascontiguousarray(null['pmf'],
+            dtype=numpy.float64).tobytes())
+        
+        db = self.connect()
+        db.execute('INSERT OR REPLACE INTO nulls VALUES (?, ?, ?, ?, ?, ?, ?, '
+            '?, ?)', (key, symbol, null['offset'], null['step'], null['count'],
+            null['max_error'], sqlite3.Binary(pmf), len(pmf), time.time()))
+        db.commit()
+        
+        self.evict()
+    
+    def evict(self):
+        ''' remove the least recently used entries, until under the size cap
+        '''
+        db = self.connect()
+        total = db.execute('SELECT SUM(size) FROM nulls').fetchone()[0] or 0
+        if total <= self.max_bytes:
+            return
+        
+        keys = []
+        for key, size in db.execute('SELECT key, size FROM nulls ORDER BY '
+                'last_used'):
+            if total <= self.max_bytes:
+                break
+            keys.append((key, ))
+            total -= size
+        
+        db.executemany('DELETE FROM nulls WHERE key=?', keys)
+        db.commit()
+    
+    def __len__(self):
+        return self.connect().execute('SELECT COUNT(*) FROM nulls').fetchone()[0]
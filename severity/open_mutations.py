@@ -19,6 +19,10 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import gzip
+
+import numpy
+
 MISSENSE_CQ = set(["missense_variant", "stop_lost", "inframe_deletion",
     "inframe_insertion", "coding_sequence_variant", "protein_altering_variant"])
 
@@ -26,6 +30,19 @@ LOF_CQ = set(["stop_gained", "splice_acceptor_variant",
     "splice_donor_variant", "frameshift_variant", "initiator_codon_variant",
     "start_lost", "conserved_exon_terminus_variant"])
 
+CODING_CQ = MISSENSE_CQ | LOF_CQ
+
+def open_file(path):
+    ''' open a text file, which can be uncompressed, gzipped, or bgzipped
+    '''
+    with open(path, 'rb') as handle:
+        magic = handle.read(2)
+    
+    if magic == b'\x1f\x8b':
+        return gzip.open(path, 'rt')
+    
+    return open(path)
+
 def parse_header(header):
     ''' parse the column positions of required fields from the header
     
@@ -47,6 +64,11 @@ def parse_header(header):
     return {'chrom': chrom, 'pos': pos, 'ref': ref, 'alt': alt, 'symbol': symbol,
         'cq': cq}
 
+def split_line(line):
+    ''' split a variant line into fields
+    '''
+    return line.strip().split('\t')
+
 def parse(line, indices):
     ''' parse a variant line
     
@@ -57,46 +79,145 @@ def parse(line, indices):
     Returns:
         tuple of chrom, pos, ref, alt, symbol and consequence
     '''
-    line = line.strip().split('\t')
+    return parse_fields(split_line(line), indices)
+
+def parse_fields(fields, indices):
+    ''' parse the fields from a variant line
     
-    chrom = line[indices['chrom']]
-    pos = int(line[indices['pos']])
-    ref = line[indices['ref']]
-    alt = line[indices['alt']]
-    symbol = line[indices['symbol']]
-    cq = line[indices['cq']]
+    Args:
+        fields: list of fields from split_line()
+        indices: dictionary of column positions for various required fields
+    
+    Returns:
+        tuple of chrom, pos, ref, alt, symbol and consequence
+    '''
+    chrom = fields[indices['chrom']]
+    pos = int(fields[indices['pos']])
+    ref = fields[indices['ref']]
+    alt = fields[indices['alt']]
+    symbol = fields[indices['symbol']]
+    cq = fields[indices['cq']]
     
     return chrom, pos, ref, alt, symbol, cq
 
-def open_mutations(path, indels=False):
-    ''' load mutations from a file.
+def iter_mutations(path, indels=False):
+    ''' iterate through the protein-altering mutations in a file
     
     Args:
-        path: path to table of de novo mutations.
+        path: path to table of de novo mutations, optionally gzipped or bgzipped
         indels: whether to include indels or not.
     
-    Returns:
-        list of de novo mutations observed in current gene. Each entry is a
-        dict with 'chrom', 'position', 'ref', 'alt', and 'consequence' keys.
+    Yields:
+        tuples of (symbol, chrom, pos, ref, alt, consequence)
     '''
     
-    genes = {}
-    with open(path) as handle:
+    with open_file(path) as handle:
         indices = parse_header(handle.readline())
+        cq_idx = indices['cq']
         for line in handle:
-            chrom, pos, ref, alt, symbol, cq = parse(line, indices)
-            
-            # ignore noncoding
-            if cq not in MISSENSE_CQ | LOF_CQ:
+            # check the consequence before parsing the rest of the line, since
+            # most rows in large tables are noncoding
+            fields = split_line(line)
+            if fields[cq_idx] not in CODING_CQ:
                 continue
             
+            chrom, pos, ref, alt, symbol, cq = parse_fields(fields, indices)
+            
             if not indels and (len(ref) > 1 or len(alt) > 1):
                 continue
             
-            if symbol not in genes:
-                genes[symbol] = []
-            
-            genes[symbol].append({'chrom': chrom, 'pos': pos, 'ref': ref,
-                'alt': alt, 'consequence': cq})
+            yield symbol, chrom, pos, ref, alt, cq
+
+def to_dicts(rows):
+    ''' convert mutation tuples to a list of dicts
+    '''
+    return [ {'chrom': chrom, 'pos': pos, 'ref': ref, 'alt': alt,
+        'consequence': cq} for chrom, pos, ref, alt, cq in rows ]
+
+def to_array(rows):
+    ''' convert mutation tuples to a numpy structured array
+    
+    Records in the array can be indexed by field name, in the same way as the
+    dicts from to_dicts().
+    
+    Args:
+        rows: list of (chrom, pos, ref, alt, consequence) tuples
+    
+    Returns:
+        numpy structured array, with chrom, pos, ref, alt and consequence fields
+    '''
+    
+    def width(i):
+        return max([1] + [ len(x[i]) for x in rows ])
+    
+    dtype = [('chrom', 'U{}'.format(width(0))), ('pos', numpy.int64),
+        ('ref', 'U{}'.format(width(2))), ('alt', 'U{}'.format(width(3))),
+        ('consequence', 'U{}'.format(width(4)))]
+    
+    return numpy.array(rows, dtype=dtype)
+
+def iter_genes(path, indels=False, as_array=False):
+    ''' iterate through the mutations in a file, one gene at a time
+    
+    This only holds the mutations for a single gene in memory, but the file
+    must have all the mutations for a gene on consecutive lines, e.g. sorted by
+    symbol.
+    
+    Args:
+        path: path to table of de novo mutations, optionally gzipped or bgzipped
+        indels: whether to include indels or not.
+        as_array: whether to give the mutations for each gene as a numpy
+            structured array, rather than a list of dicts.
+    
+    Yields:
+        tuples of (symbol, mutations)
+    
+    Raises:
+        ValueError if a gene's mutations are not on consecutive lines
+    '''
+    
+    convert = to_array if as_array else to_dicts
+    
+    seen = set()
+    current, rows = None, []
+    for row in iter_mutations(path, indels):
+        symbol = row[0]
+        if symbol != current:
+            if current is not None:
+                yield current, convert(rows)
+            if symbol in seen:
+                raise ValueError('mutations are not grouped by gene, {} is on '
+                    'non-consecutive lines'.format(symbol))
+            seen.add(symbol)
+            current, rows = symbol, []
+        
+        rows.append(row[1:])
+    
+    if current is not None:
+        yield current, convert(rows)
+
+def open_mutations(path, indels=False, as_array=False):
+    ''' load mutations from a file.
+    
+    Args:
+        path: path to table of de novo mutations, optionally gzipped or bgzipped
+        indels: whether to include indels or not.
+        as_array: whether to give the mutations for each gene as a numpy
+            structured array, rather than a list of dicts.
+    
+    Returns:
+        dict of de novo mutations per gene, indexed by symbol. Each entry is a
+        list of dicts with 'chrom', 'pos', 'ref', 'alt', and 'consequence' keys,
+        or a structured array with the same fields.
+    '''
+    
+    genes = {}
+    for row in iter_mutations(path, indels):
+        symbol = row[0]
+        if symbol not in genes:
+            genes[symbol] = []
+        genes[symbol].append(row[1:])
+    
+    convert = to_array if as_array else to_dicts
     
-    return genes
+    return dict( (symbol, convert(rows)) for symbol, rows in genes.items() )
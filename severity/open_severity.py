@@ -19,13 +19,77 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-from itertools import groupby, count
+import numpy
 
 from severity.open_mutations import LOF_CQ
+from severity.cadd_store import CaddStore
 
-def as_range(g):
-    l = list(g)
-    return l[0], l[-1]
+def get_spans(positions, max_gap=1000):
+    ''' group positions into spans to fetch from the CADD file
+    
+    Each tabix fetch costs a seek (slow on network filesystems), whereas
+    reading through a short gap between positions is cheap, so positions
+    closer than max_gap are merged into a single span.
+    
+    Args:
+        positions: iterable of chromosomal positions
+        max_gap: largest gap between positions to read through, rather than
+            starting a new fetch. 1 only merges contiguous positions.
+    
+    Returns:
+        list of (start, end) tuples for the spans, in position order
+    '''
+    
+    spans = []
+    for pos in sorted(set(positions)):
+        if len(spans) > 0 and pos - spans[-1][1] <= max_gap:
+            spans[-1][1] = pos
+        else:
+            spans.append([pos, pos])
+    
+    return [ tuple(x) for x in spans ]
+
+def fetch_scores(cadd, chrom, positions, max_gap=1000):
+    ''' load CADD scores for all alleles at a set of positions
+    
+    Args:
+        cadd: pysam.TabixFile for quick fetching of CADD scores
+        chrom: chromosome
+        positions: iterable of chromosomal positions
+        max_gap: largest gap between positions to read through, rather than
+            starting a new fetch.
+    
+    Returns:
+        dict of CADD scores, indexed by (position, alt) tuples
+    '''
+    
+    positions = set(positions)
+    
+    scores = {}
+    for start, end in get_spans(positions, max_gap):
+        for line in cadd.fetch(chrom, start-1, end):
+            _, pos, _, alt, _, score = line.split('\t')
+            pos = int(pos)
+            if pos in positions:
+                scores[(pos, alt)] = float(score)
+    
+    return scores
+
+def get_positions(rates):
+    ''' get the positions for all the sites in a rates object
+    
+    Args:
+        rates: WeightedChoice object, a dict of WeightedChoice objects, or a
+            list of dicts with 'pos' keys
+    
+    Returns:
+        set of positions
+    '''
+    
+    if type(rates) == dict:
+        return set([ x['pos'] for cq in rates for x in rates[cq] ])
+    
+    return set([ x['pos'] for x in rates ])
 
 def weight_site(site, consequence, scores, weights, constrained):
     ''' convert CADD score to the reweighted score
@@ -55,35 +119,124 @@ def weight_site(site, consequence, scores, weights, constrained):
         for x in weights['altering'][constraint][score]:
             return x.data
 
-def get_severity(cadd, chrom, rates, weights, constrained):
+def get_bins(tree):
+    ''' get the bin starts and weights from an IntervalTree of score bins
+    
+    Args:
+        tree: IntervalTree of non-overlapping score bins, with weights as data
+    
+    Returns:
+        tuple of numpy arrays for the bin starts, ends and weights, sorted by
+        start
+    '''
+    
+    bins = sorted(tree)
+    starts = numpy.array([ x.begin for x in bins ], dtype=numpy.float64)
+    ends = numpy.array([ x.end for x in bins ], dtype=numpy.float64)
+    values = numpy.array([ x.data for x in bins ], dtype=numpy.float64)
+    
+    return starts, ends, values
+
+def in_regions(positions, regions):
+    ''' find which positions fall within a set of regions
+    
+    Args:
+        positions: numpy array of chromosomal positions
+        regions: IntervalTree of regions (with half-open intervals)
+    
+    Returns:
+        numpy boolean array, True where the position is within a region
+    '''
+    
+    # merge overlapping regions, so each position can only be in the region
+    # with the closest start
+    merged = []
+    for start, end in sorted( (x.begin, x.end) for x in regions ):
+        if len(merged) > 0 and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    
+    if len(merged) == 0:
+        return numpy.zeros(len(positions), dtype=bool)
+    
+    starts = numpy.array([ x[0] for x in merged ])
+    ends = numpy.array([ x[1] for x in merged ])
+    
+    idx = numpy.searchsorted(starts, positions, side='right') - 1
+    
+    return (idx >= 0) & (positions < ends[idx])
+
+def weight_scores(scores, positions, truncating, weights, constrained):
+    ''' convert CADD scores to reweighted scores, for many sites at once
+    
+    This gives the same weights as weight_site(), but finds the score bins with
+    a binary search over arrays, rather than an IntervalTree query per site.
+    
+    Args:
+        scores: array of CADD scores
+        positions: array of chromosomal positions, matching the scores
+        truncating: boolean array, True for protein-truncating sites
+        weights: dict of weights for different consequence types and CADD
+            thresholds.
+        constrained: IntervalTree defining ranges within regional constraint for
+            a gene.
+    
+    Returns:
+        numpy array of reweighted scores. Sites with scores outside the bins get
+        NaN.
+    '''
+    
+    scores = numpy.asarray(scores, dtype=numpy.float64)
+    positions = numpy.asarray(positions, dtype=numpy.int64)
+    truncating = numpy.asarray(truncating, dtype=bool)
+    
+    in_constraint = in_regions(positions, constrained)
+    
+    weighted = numpy.full(len(scores), numpy.nan)
+    for constraint, mask in [('constrained', in_constraint),
+            ('unconstrained', ~in_constraint)]:
+        starts, ends, values = get_bins(weights['altering'][constraint])
+        idx = numpy.searchsorted(starts, scores[mask], side='right') - 1
+        inside = (idx >= 0) & (scores[mask] < ends[idx])
+        weighted[mask] = numpy.where(inside, values[idx], numpy.nan)
+    
+    weighted[truncating] = weights['truncating']
+    
+    return weighted
+
+def get_severity(cadd, chrom, rates, weights, constrained, scores=None,
+        max_gap=1000):
     ''' get CADD scores for a specific alt at a specific site
     
     See downloadable CADD files here: http://cadd.gs.washington.edu/download
     
     Args:
-        cadd: pysam.TabixFile for quick fetching of CADD scores
+        cadd: pysam.TabixFile for quick fetching of CADD scores, or a CaddStore
+            object, for scores preconverted into memory-mapped arrays.
         chrom: chromosome
         rates: Weighted Choice object for all sites in a gene
         weights:
         constrained: IntervalTree object for ranges under regional constraint
+        scores: dict of CADD scores, indexed by (position, alt) tuples, from
+            fetch_scores(). If None, the scores are fetched from the CADD file.
+        max_gap: largest gap between positions to read through when fetching
+            CADD scores, rather than starting a new fetch.
     
     Returns:
         list of weighted score at the given site for the given alt allele
     '''
     
-    if type(rates) == dict:
-        positions = sorted(set([ x['pos'] for cq in rates for x in rates[cq] ]))
-    else:
-        positions = sorted(set([ x['pos'] for x in rates ]))
+    if scores is None and isinstance(cadd, CaddStore):
+        if type(rates) == dict:
+            sites = [ x for cq in sorted(rates) for x in rates[cq] ]
+        else:
+            sites = list(rates)
+        return cadd.lookup(chrom, [ x['pos'] for x in sites ],
+            [ x['alt'] for x in sites ]).tolist()
     
-    scores = {}
-    for _, g in groupby(positions, key=lambda n, c=count(): n-next(c)):
-        # define the start and end of a continuous set of positions, so we can
-        # load cadd scores by iterating through the cadd file efficiently
-        start, end = as_range(g)
-        for line in cadd.fetch(chrom, start-1, end):
-            _, pos, _, alt, _, score = line.split('\t')
-            scores[(int(pos), alt)] = float(score)
+    if scores is None:
+        scores = fetch_scores(cadd, chrom, get_positions(rates), max_gap)
     
     # match the cadd scores to the order of sites in the rates object
     if type(rates) == dict:
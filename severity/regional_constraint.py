@@ -20,12 +20,17 @@ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
 import gzip
+import logging
+import math
+import os
+import tempfile
 
-from scipy.stats import chi2
 from intervaltree import IntervalTree
 
 from denovonear.load_gene import construct_gene_object
 
+logger = logging.getLogger(__name__)
+
 def parse_header(header):
     header = header.strip().split('\t')
     
@@ -87,10 +92,26 @@ def aa_to_chrom(tx, region):
     
     return tx.get_position_on_chrom(start), tx.get_position_on_chrom(end)
 
+def chisq_sf(chisq):
+    ''' get the upper tail probability for a chi-squared value with one degree
+    of freedom.
+    
+    This is equivalent to scipy.stats.chi2.sf(chisq, df=1), but avoids the
+    slow scipy import.
+    '''
+    return math.erfc(math.sqrt(max(chisq, 0) / 2))
+
 def get_constrained_positions(ensembl, constraint, symbol, threshold=1e-4, ratio_threshold=1.0):
     ''' get the positions in the constrained regions
+    
+    The constraint can be the dictionary from load_regional_constraint(), or a
+    ConstraintIndex, which has the regions precomputed, so the threshold
+    arguments are ignored for those.
     '''
     
+    if isinstance(constraint, ConstraintIndex):
+        return constraint.regions(symbol)
+    
     regions = IntervalTree()
     
     if symbol not in constraint:
@@ -100,7 +121,7 @@ def get_constrained_positions(ensembl, constraint, symbol, threshold=1e-4, ratio
     tx = construct_gene_object(ensembl, data['tx'])
     
     for region in data['regions']:
-        p_value = chi2.sf(region['chisq'], df=1)
+        p_value = chisq_sf(region['chisq'])
         if p_value > threshold:
             continue
         
@@ -114,3 +135,159 @@ def get_constrained_positions(ensembl, constraint, symbol, threshold=1e-4, ratio
         regions[start:end + 1] = True
     
     return regions
+
+def build_constraint_index(ensembl, constraint, path, threshold=1e-4,
+        ratio_threshold=1.0):
+    ''' precompute the constrained regions for all genes into an index file
+    
+    This converts the regions to chromosome coordinates, and evaluates their
+    significance once, so analyses don't need to parse the full constraint
+    table, or construct transcripts for every gene.
+    
+    Args:
+        ensembl: EnsemblRequest object, for transcript coordinates
+        constraint: dictionary of regional constraint data, indexed by symbol,
+            from load_regional_constraint()
+        path: path to write the sqlite index to
+        threshold: p-value threshold for regions to count as constrained
+        ratio_threshold: regions with a higher observed/expected ratio than this
+            aren't constrained
+    
+    Genes whose transcript can't be fetched or built, or whose regions don't
+    map onto the transcript, are logged and left out of the index.
+    '''
+    
+    genes = {}
+    for symbol in constraint:
+        data = constraint[symbol]
+        try:
+            ends = [ int(x['pos'].split('-')[-1]) for x in data['regions'] ]
+            regions = get_constrained_positions(ensembl, constraint, symbol,
+                threshold, ratio_threshold)
+        except (ValueError, IndexError, KeyError) as error:
+            logger.warning('skipping {}: {}'.format(symbol, error))
+            continue
+        
+        genes[symbol] = {'chrom': data['chrom'], 'cds_length': max(ends) * 3,
+            'regions': regions}
+    
+    write_constraint_index(genes, path)
+
+def write_constraint_index(genes, path):
+    ''' write constrained regions to a sqlite index
+    
+    Args:
+        genes: dict of gene data, indexed by symbol. Each entry is a dict with
+            'chrom', 'cds_length' and 'regions' (an IntervalTree) keys.
+        path: path to write the sqlite index to
+    
+    The index is written to a temporary file, then renamed into place, so a
+    failed build never leaves a partial index behind.
+    '''
+    import sqlite3
+    
+    handle, temp = tempfile.mkstemp(suffix='.db',
+        dir=os.path.dirname(os.path.abspath(path)))
+    os.close(handle)
+    
+    db = sqlite3.connect(temp)
+    try:
+        db.execute('CREATE TABLE genes (symbol TEXT PRIMARY KEY, chrom TEXT, '
+            'cds_length INTEGER)')
+        db.execute('CREATE TABLE regions (symbol TEXT, start INTEGER, '
+            'end INTEGER)')
+        
+        for symbol in sorted(genes):
+            data = genes[symbol]
+            db.execute('INSERT INTO genes VALUES (?, ?, ?)',
+                (symbol, data['chrom'], data['cds_length']))
+            db.executemany('INSERT INTO regions VALUES (?, ?, ?)',
+                [ (symbol, x.begin, x.end) for x in sorted(data['regions']) ])
+        
+        db.execute('CREATE INDEX regions_symbol ON regions (symbol)')
+        db.commit()
+    except Exception:
+        db.close()
+        os.remove(temp)
+        raise
+    
+    db.close()
+    os.replace(temp, path)
+
+def is_constraint_index(path):
+    ''' check if a path is a constraint index, rather than a constraint table
+    '''
+    with open(path, 'rb') as handle:
+        return handle.read(16) == b'SQLite format 3\x00'
+
+def open_constraint(path):
+    ''' open regional constraint from either a constraint table or index
+    
+    Args:
+        path: path to the gzipped regional constraint table, or to an index
+            from build_constraint_index()
+    
+    Returns:
+        ConstraintIndex for an index, otherwise a dictionary of regional
+        constraint data, indexed by symbol.
+    '''
+    
+    if is_constraint_index(path):
+        return ConstraintIndex(path)
+    
+    return load_regional_constraint(path)
+
+class ConstraintIndex(object):
+    ''' precomputed constrained regions, loaded one gene at a time
+    
+    The sqlite connection is only opened on first use, so an index made before
+    forking worker processes doesn't share a connection between processes.
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.cache = {}
+    
+    def query(self, sql, args):
+        if self.db is None:
+            import sqlite3
+            self.db = sqlite3.connect(self.path)
+        return self.db.execute(sql, args).fetchall()
+    
+    def __contains__(self, symbol):
+        return len(self.query('SELECT 1 FROM genes WHERE symbol=?',
+            (symbol, ))) > 0
+    
+    def cds_length(self, symbol, default=1500):
+        ''' get the coding length of a gene, or the default if not indexed
+        '''
+        rows = self.query('SELECT cds_length FROM genes WHERE symbol=?',
+            (symbol, ))
+        return rows[0][0] if len(rows) > 0 else default
+    
+    def intervals(self, symbol):
+        ''' get the constrained regions for a gene
+        
+        Args:
+            symbol: HGNC symbol for the gene
+        
+        Returns:
+            tuple of numpy arrays of the region starts and ends (half-open),
+            sorted by start. These are empty for genes without constraint.
+        '''
+        if symbol not in self.cache:
+            import numpy
+            rows = self.query('SELECT start, end FROM regions WHERE symbol=? '
+                'ORDER BY start', (symbol, ))
+            starts = numpy.array([ x[0] for x in rows ], dtype=numpy.int64)
+            ends = numpy.array([ x[1] for x in rows ], dtype=numpy.int64)
+            self.cache[symbol] = (starts, ends)
+        
+        return self.cache[symbol]
+    
+    def regions(self, symbol):
+        ''' get the constrained regions for a gene as an IntervalTree
+        '''
+        starts, ends = self.intervals(symbol)
+        return IntervalTree.from_tuples(zip(starts.tolist(), ends.tolist()))
@@ -0,0 +1,141 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import hashlib
+import os
+import tempfile
+
+from severity.regional_constraint import ConstraintIndex
+
+# columns written to the results file
+HEADER = 'symbol\tseverity_p_value\tseed\titerations\n'
+
+def cds_length(constraint, symbol, default=1500):
+    ''' estimate the coding length of a gene from its regional constraint
+    
+    The regional constraint regions span the full protein, so the last amino
+    acid gives the coding length, without needing the transcript.
+    
+    Args:
+        constraint: dictionary of regional constraint data, indexed by symbol,
+            or a ConstraintIndex
+        symbol: HGNC symbol for the gene
+        default: coding length to use for genes without regional constraint
+    
+    Returns:
+        estimated coding length in base pairs
+    '''
+    
+    if isinstance(constraint, ConstraintIndex):
+        return constraint.cds_length(symbol, default)
+    
+    if symbol not in constraint:
+        return default
+    
+    ends = [ int(x['pos'].split('-')[-1]) for x in constraint[symbol]['regions'] ]
+    
+    return max(ends) * 3
+
+def schedule(all_de_novos, constraint):
+    ''' order genes so the slowest genes run first
+    
+    The cost to analyse a gene grows with the number of de novos, and with the
+    length of the gene. Starting the slowest genes first means a single long
+    gene doesn't run on its own at the end of a parallel run.
+    
+    Args:
+        all_de_novos: dictionary of de novo lists, indexed by symbol
+        constraint: dictionary of regional constraint data, indexed by symbol
+    
+    Returns:
+        list of (symbol, de_novos) tuples, sorted by descending estimated cost,
+        with ties sorted by symbol, so the order is deterministic.
+    '''
+    
+    jobs = [ (symbol, all_de_novos[symbol]) for symbol in all_de_novos
+        if symbol not in ['', '.'] ]
+    
+    def cost(job):
+        symbol, de_novos = job
+        return (-len(de_novos) * cds_length(constraint, symbol), symbol)
+    
+    return sorted(jobs, key=cost)
+
+def gene_seed(seed, symbol):
+    ''' derive a seed for a gene from the seed for the run
+    
+    Args:
+        seed: seed for the run
+        symbol: HGNC symbol for the gene
+    
+    Returns:
+        64-bit integer seed, which is the same for a given run seed and gene
+    '''
+    
+    key = '{}:{}'.format(seed, symbol).encode('utf8')
+    
+    return int(hashlib.md5(key).hexdigest()[:16], 16)
+
+def load_completed(path, header=HEADER):
+    ''' find the genes already analysed in an output file from an earlier run
+    
+    If the earlier run died partway through writing a line, the incomplete
+    line is removed, so that gene gets analysed again. The complete lines are
+    written to a temporary file, which then replaces the output file, so the
+    earlier results can't be lost if we die partway through.
+    
+    Args:
+        path: path to the output file
+        header: header line for the output file. Results with a different
+            header have different columns, so can't be resumed.
+    
+    Returns:
+        set of HGNC symbols for the genes with results
+    
+    Raises:
+        ValueError if the output file has a different header
+    '''
+    
+    if not os.path.exists(path):
+        return set()
+    
+    with open(path, 'rb') as handle:
+        data = handle.read()
+    
+    first = data[:data.find(b'\n') + 1].decode('utf8')
+    if first != '' and first != header:
+        raise ValueError('cannot resume {}, since it has different columns. '
+            'Expected header: {!r}, found: {!r}'.format(path, header, first))
+    
+    complete = data.rfind(b'\n') + 1
+    if complete < len(data):
+        folder = os.path.dirname(os.path.abspath(path))
+        handle, temp = tempfile.mkstemp(dir=folder)
+        with os.fdopen(handle, 'wb') as output:
+            output.write(data[:complete])
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(temp, path)
+    
+    lines = data[:complete].decode('utf8').splitlines()
+    
+    return set( x.split('\t')[0] for x in lines[1:] )
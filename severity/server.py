@@ -0,0 +1,187 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+class Stats(object):
+    ''' track the latency and throughput of analysis requests
+    '''
+    
+    def __init__(self, window=1000):
+        '''
+        Args:
+            window: number of recent requests to find latency quantiles from
+        '''
+        self.started = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.latencies = deque(maxlen=window)
+        self.lock = threading.Lock()
+    
+    def add(self, latency, error=False):
+        with self.lock:
+            self.requests += 1
+            self.errors += error
+            self.busy += latency
+            self.latencies.append(latency)
+    
+    def summary(self):
+        ''' get a dict of summary statistics for the requests so far
+        '''
+        with self.lock:
+            uptime = time.time() - self.started
+            latencies = sorted(self.latencies)
+            stats = {'uptime': uptime, 'requests': self.requests,
+                'errors': self.errors,
+                'throughput': self.requests / uptime if uptime > 0 else 0.0,
+                'mean_latency': self.busy / self.requests if self.requests else None}
+        
+        for name, quantile in [('median_latency', 0.5), ('p95_latency', 0.95)]:
+            stats[name] = None
+            if len(latencies) > 0:
+                rank = int(math.ceil(quantile * len(latencies))) - 1
+                stats[name] = latencies[rank]
+        
+        return stats
+
+class AnalysisService(object):
+    ''' run analysis requests on a fixed pool of worker threads
+    
+    The workers are long-lived, so each worker can hold its own open resources
+    (such as CADD file handles) across requests. The simulations release the
+    GIL, so genes are analysed concurrently.
+    '''
+    
+    def __init__(self, analyse, workers=1, stats_hooks=None):
+        '''
+        Args:
+            analyse: function which takes a request dict, and returns a
+                JSON-serialisable dict of results.
+            workers: number of worker threads
+            stats_hooks: optional dict of functions returning extra stats, such
+                as cache hit counts, indexed by name.
+        '''
+        self.analyse = analyse
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.stats = Stats()
+        self.stats_hooks = stats_hooks or {}
+    
+    def run(self, request):
+        ''' analyse a request on the worker pool, and record the latency
+        
+        Args:
+            request: dict of request data, passed to the analyse function
+        
+        Returns:
+            dict of results from the analyse function
+        '''
+        start = time.time()
+        try:
+            result = self.pool.submit(self.analyse, request).result()
+        except Exception:
+            self.stats.add(time.time() - start, error=True)
+            raise
+        
+        self.stats.add(time.time() - start)
+        return result
+    
+    def summary(self):
+        stats = self.stats.summary()
+        for name, hook in self.stats_hooks.items():
+            stats[name] = hook()
+        return stats
+    
+    def shutdown(self):
+        self.pool.shutdown()
+
+class Handler(BaseHTTPRequestHandler):
+    ''' handle HTTP requests for the analysis service
+    
+    POST /analyse with a JSON body runs an analysis, GET /stats gives the
+    latency and throughput stats, so far.
+    '''
+    
+    def send_json(self, status, data):
+        body = json.dumps(data, default=float).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.server.service.summary())
+        else:
+            self.send_json(404, {'error': 'unknown path: {}'.format(self.path)})
+    
+    def do_POST(self):
+        if self.path != '/analyse':
+            self.send_json(404, {'error': 'unknown path: {}'.format(self.path)})
+            return
+        
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf8'))
+        except ValueError as error:
+            self.send_json(400, {'error': 'invalid request: {}'.format(error)})
+            return
+        
+        try:
+            result = self.server.service.run(request)
+        except Exception as error:
+            self.send_json(500, {'error': '{}: {}'.format(type(error).__name__,
+                error)})
+            return
+        
+        self.send_json(200, result)
+    
+    def log_message(self, format, *args):
+        # don't log every request to stderr
+        pass
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def make_server(service, host='127.0.0.1', port=8765):
+    ''' construct a HTTP server for an AnalysisService
+    
+    Args:
+        service: AnalysisService object
+        host: address to listen on, this defaults to localhost only
+        port: port to listen on, or 0 to pick a free port
+    
+    Returns:
+        HTTP server, which answers requests once serve_forever() is called
+    '''
+    server = Server((host, port), Handler)
+    server.service = service
+    return server
@@ -0,0 +1,89 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+import threading
+
+from denovonear.ensembl_requester import EnsemblRequest
+from denovonear.load_mutation_rates import load_mutation_rates
+
+from severity.cadd_store import CaddStore
+from severity.check_gene import analyse_gene
+from severity.regional_constraint import open_constraint, ConstraintIndex
+from severity.site_cache import SiteCache, MemorySiteCache, file_signature
+from severity.weights import weights as WEIGHTS
+
+def open_cadd(path):
+    ''' open CADD scores from a tabix file, or a folder from convert_cadd()
+    
+    pysam is only needed for tabix files, so it is imported here, rather than
+    with the module.
+    '''
+    if os.path.isdir(path):
+        return CaddStore(path)
+    
+    import pysam
+    return pysam.TabixFile(path)
+
+def make_analyser(args):
+    ''' get a function to analyse requests, with resources kept open
+    
+    File handles and the Ensembl requester are opened once per worker thread,
+    since they aren't safe to share between threads. The mutation rates, the
+    regional constraint table and the in-memory site tables are shared.
+    
+    Args:
+        args: command line arguments, with cadd, constraint, cache, site_cache,
+            max_genes and genome_build attributes
+    
+    Returns:
+        tuple of the analyse function, and the MemorySiteCache it uses
+    '''
+    
+    mut_dict = load_mutation_rates()
+    constraint = open_constraint(args.constraint)
+    
+    backing = None
+    if args.site_cache is not None:
+        inputs = [mut_dict, file_signature(args.cadd),
+            file_signature(args.constraint)]
+        backing = SiteCache(args.site_cache, args.genome_build, inputs)
+    site_cache = MemorySiteCache(args.max_genes, backing)
+    
+    local = threading.local()
+    
+    def analyse(request):
+        if not hasattr(local, 'ensembl'):
+            local.ensembl = EnsemblRequest(args.cache, args.genome_build)
+            local.cadd = open_cadd(args.cadd)
+            local.constraint = constraint
+            if isinstance(constraint, ConstraintIndex):
+                local.constraint = ConstraintIndex(constraint.path)
+        
+        return analyse_gene(local.ensembl, mut_dict, local.cadd,
+            request['symbol'], request['de_novos'], local.constraint, WEIGHTS,
+            method=request.get('method', 'simulate'),
+            alpha=request.get('alpha'), seed=request.get('seed'),
+            full_output=True, site_cache=site_cache,
+            weighted=request.get('weighted', False))
+    
+    return analyse, site_cache
@@ -19,23 +19,442 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+from random import SystemRandom
 
+import warnings
+
+import numpy
+
+from libc.stdint cimport int32_t, uint8_t, uint64_t
 from libcpp.vector cimport vector
 from cython.operator cimport dereference as deref
 
 from denovonear.weights cimport WeightedChoice, Chooser
 
 cdef extern from "simulate.h":
-    double _analyse(Chooser, vector[double], double, int, int) except +
+    cdef cppclass Histogram:
+        double lower
+        double upper
+        vector[long long] counts
+    
+    cdef struct SimulationResult:
+        double p_value
+        int iterations
+    
+    cdef cppclass GeneJob:
+        Chooser * choices
+        vector[double] severity
+        double observed
+        int count
+        unsigned long long seed
+    
+    SimulationResult _analyse(Chooser, vector[double], double, int, int, int,
+        double, double, double, int, bint, unsigned long long) except + nogil
+    vector[vector[SimulationResult]] _analyse_multi(Chooser, vector[vector[double]],
+        vector[vector[double]], int, int, int, double, double, double, int,
+        bint, unsigned long long) except + nogil
+    vector[SimulationResult] _analyse_genes(vector[GeneJob] &, int, int, double,
+        double, double, int, bint) except + nogil
+    Histogram _null_histogram(Chooser, vector[double], int, int, int, int, bint,
+        unsigned long long) except + nogil
+
+cdef extern from "weighted_choice.h":
+    void chooser_from_arrays(Chooser &, const int32_t *, const uint8_t *,
+        const uint8_t *, const double *, const int32_t *, int) except +
+    void chooser_to_arrays(const Chooser &, int32_t *, uint8_t *, uint8_t *,
+        double *, int32_t *)
+    void seed_chooser(Chooser &, uint64_t)
+
+cdef extern from "importance.h":
+    cdef struct ImportanceResult:
+        double p_value
+        double std_error
+    
+    ImportanceResult _analyse_importance(Chooser, vector[double], double, int,
+        int, int, unsigned long long) except + nogil
+
+cdef extern from "stratified.h":
+    cdef struct StratifiedResult:
+        double p_value
+        long long iterations
+        long long draws
+        double effective
+    
+    StratifiedResult _analyse_stratified(Chooser, vector[double], vector[int],
+        double, int, int, int, double, double, double, int, bint,
+        unsigned long long) except + nogil
+
+cdef extern from "exact.h":
+    cdef struct ExactResult:
+        double p_value
+        double lower
+        double upper
+    
+    cdef cppclass NullDistribution:
+        double offset
+        double step
+        int count
+        double max_error
+        vector[double] pmf
+    
+    NullDistribution exact_null(Chooser, vector[double], int, double) except +
+    ExactResult tail_probability(NullDistribution, double)
+    ExactResult _analyse_exact(Chooser, vector[double], double, int, double) except +
+
+def get_seed(seed=None):
+    ''' get a seed for the simulations, picking a random seed if none is given
+    '''
+    if seed is None:
+        seed = SystemRandom().getrandbits(64)
+    
+    return seed
+
+def set_seed(WeightedChoice choices, seed):
+    ''' seed the random number generator within a WeightedChoice object
+    
+    WeightedChoice objects seed themselves randomly, so draws from choice()
+    differ between runs unless they are seeded. This doesn't affect the
+    simulations, which use their own seeded generators.
+    
+    Args:
+        choices: WeightedChoice object
+        seed: integer seed for the generator
+    '''
+    seed_chooser(deref(choices.thisptr), seed)
+
+def from_arrays(positions, refs, alts, rates, offsets=None, seed=None):
+    ''' construct a WeightedChoice object from arrays of per-site data
+    
+    This is much quicker than calling add_choice() for each site, since the
+    arrays are read directly (without copying, if they already have the right
+    types), and the sampler is only set up once, after all sites are added.
+    
+    Args:
+        positions: array of chromosomal positions for each site
+        refs: array of reference allele codes, as indices into 'ACGTN'
+        alts: array of alternate allele codes, as indices into 'ACGTN'
+        rates: array of mutation rates for each site
+        offsets: array of distances from the nearest coding position for each
+            site, or None for all zero.
+        seed: seed for the object's random number generator (see set_seed), or
+            None to leave it randomly seeded.
+    
+    Returns:
+        WeightedChoice object, with sites in the same order as the arrays
+    '''
+    
+    if offsets is None:
+        offsets = numpy.zeros(len(positions), dtype=numpy.int32)
+    
+    cdef const int32_t[::1] pos_view = numpy.ascontiguousarray(positions, dtype=numpy.int32)
+    cdef const uint8_t[::1] ref_view = numpy.ascontiguousarray(refs, dtype=numpy.uint8)
+    cdef const uint8_t[::1] alt_view = numpy.ascontiguousarray(alts, dtype=numpy.uint8)
+    cdef const double[::1] rate_view = numpy.ascontiguousarray(rates, dtype=numpy.float64)
+    cdef const int32_t[::1] offset_view = numpy.ascontiguousarray(offsets, dtype=numpy.int32)
+    
+    cdef int length = len(pos_view)
+    if (ref_view.shape[0] != length or alt_view.shape[0] != length or
+            rate_view.shape[0] != length or offset_view.shape[0] != length):
+        raise ValueError('per-site arrays have different lengths')
+    
+    cdef WeightedChoice choices = WeightedChoice()
+    if length > 0:
+        chooser_from_arrays(deref(choices.thisptr), &pos_view[0], &ref_view[0],
+            &alt_view[0], &rate_view[0], &offset_view[0], length)
+    
+    if seed is not None:
+        set_seed(choices, seed)
+    
+    return choices
+
+def to_arrays(WeightedChoice choices):
+    ''' get arrays of the per-site data from a WeightedChoice object
+    
+    This is the reverse of from_arrays(), and is much quicker than iterating
+    through the sites, since no python objects are made for each site.
+    
+    Args:
+        choices: WeightedChoice object
+    
+    Returns:
+        tuple of numpy arrays for the positions, reference allele codes,
+        alternate allele codes (as indices into 'ACGTN'), mutation rates and
+        offsets of every site, in the same order as the sites.
+    '''
+    
+    length = choices.thisptr.len()
+    positions = numpy.zeros(length, dtype=numpy.int32)
+    refs = numpy.zeros(length, dtype=numpy.uint8)
+    alts = numpy.zeros(length, dtype=numpy.uint8)
+    rates = numpy.zeros(length, dtype=numpy.float64)
+    offsets = numpy.zeros(length, dtype=numpy.int32)
+    
+    cdef int32_t[::1] pos_view = positions
+    cdef uint8_t[::1] ref_view = refs
+    cdef uint8_t[::1] alt_view = alts
+    cdef double[::1] rate_view = rates
+    cdef int32_t[::1] offset_view = offsets
+    
+    if length > 0:
+        chooser_to_arrays(deref(choices.thisptr), &pos_view[0], &ref_view[0],
+            &alt_view[0], &rate_view[0], &offset_view[0])
+    
+    return positions, refs, alts, rates, offsets
 
 def analyse(WeightedChoice choices, severity, observed, count,
-        iterations=100000000):
+        min_iterations=1000, max_iterations=100000000, z=2.575829,
+        precision=0.05, alpha=None, threads=1, sampler='alias', seed=None,
+        full_output=False, iterations=None):
     ''' analyse the severity score of de novo mutations in a gene
     
     estimate the chance of observing a total severity euqal to or greater than
     the summed scores for the observed de novos in a gene, given the same number
     of de novo mutations.
     
+    We check whether to stop after min_iterations, and after each doubling of
+    the iterations from then on. We stop once the p-value is sufficiently
+    precise, or once it clearly can't reach the alpha significance threshold.
+    
+    The simulation runs without the GIL, and doesn't modify the choices object,
+    so other python threads can analyse genes concurrently.
+    
+    Severity can also be a list of K severity score lists (e.g. from K
+    weighting schemes), with a list of K observed totals. Each set of sampled
+    sites is then scored under every scheme, so the K p-values cost little
+    more than one. Each p-value halts independently.
+    
+    Args:
+        choices: WeightedChoice object of mutation rates per position and alt
+            allele for all possible SNVs within a gene.
+        severity: list of severity scores, matching the same position and alt
+            allele order as for the choices object, or a list of K such lists.
+        observed: summed severity score across the observed de novo mutations,
+            or a list of K summed scores, if severity has K lists.
+        count: number of observed de novo mutations.
+        min_iterations: number of iterations to run before the first check.
+        max_iterations: maximum number of iterations to run.
+        z: standard normal deviate for the confidence interval around the
+            p-value, the default is for a 99% confidence interval.
+        precision: stop once the confidence interval width (either side of the
+            p-value) is below this proportion of the p-value.
+        alpha: significance threshold, stop once the confidence interval lower
+            bound exceeds this. None disables this check.
+        threads: number of threads to split the iterations across. Iterations
+            run in blocks, and each block has an independent random number
+            stream, derived from the seed and the block number.
+        sampler: how to sample sites. 'alias' builds a Walker/Vose alias table,
+            which samples in constant time, while 'cumulative' uses a binary
+            search through the cumulative rates of the choices object.
+        seed: seed for the random number generators. Results are reproducible
+            for the same seed, whatever the number of threads. A random seed is
+            used if this is None.
+        full_output: whether to return details of the simulations, rather than
+            just the p-value.
+        iterations: deprecated alias for min_iterations.
+    
+    Returns:
+        probability of getting the observed severity score (or greater) under
+        the null distribution. If full_output is True, this returns a dict with
+        the 'p_value', and the number of 'iterations' run, and the 'seed' used.
+        For K severity lists, this gives a list of K p-values, or with
+        full_output, lists of K p-values and K iteration counts.
+    '''
+    
+    if iterations is not None:
+        warnings.warn('iterations is deprecated, use min_iterations instead',
+            DeprecationWarning, stacklevel=2)
+        min_iterations = iterations
+    
+    if sampler not in ['alias', 'cumulative']:
+        raise ValueError('unknown sampler: {}'.format(sampler))
+    
+    seed = get_seed(seed)
+    
+    if len(severity) > 0 and hasattr(severity[0], '__len__'):
+        return _analyse_many(choices, severity, observed, count, min_iterations,
+            max_iterations, z, precision, alpha, threads, sampler, seed,
+            full_output)
+    
+    cdef Chooser * rates = choices.thisptr
+    cdef vector[double] scores = severity
+    cdef double total = observed
+    cdef int n = count
+    cdef int min_iters = min_iterations
+    cdef int max_iters = max_iterations
+    cdef double deviate = z
+    cdef double prec = precision
+    cdef double threshold = alpha if alpha is not None else 0.0
+    cdef int n_threads = threads
+    cdef bint alias = sampler == 'alias'
+    cdef unsigned long long seed_value = seed
+    cdef SimulationResult result
+    
+    with nogil:
+        result = _analyse(deref(rates), scores, total, n, min_iters, max_iters,
+            deviate, prec, threshold, n_threads, alias, seed_value)
+    
+    if full_output:
+        return {'p_value': result.p_value, 'iterations': result.iterations,
+            'seed': seed}
+    
+    return result.p_value
+
+def analyse_genes(genes, min_iterations=1000, max_iterations=100000000,
+        z=2.575829, precision=0.05, alpha=None, threads=1, sampler='alias',
+        seed=None, full_output=False):
+    ''' analyse the severity of de novos in many genes, in a single call
+    
+    All the genes are simulated without returning to python, across a pool of
+    threads, where each thread analyses one gene at a time. This avoids the
+    per-gene python overhead, which can exceed the simulation cost for genes
+    with one or two de novos. See analyse() for the shared arguments.
+    
+    Args:
+        genes: list of (choices, severity, observed, count) tuples, one per
+            gene, as for the arguments to analyse().
+        threads: number of threads to analyse genes with.
+        seed: seed for the random number generators. Each gene gets the seed
+            plus its index in the gene list, so the p-value for a gene matches
+            analyse() with that seed. A random seed is used if this is None.
+        full_output: whether to return details of the simulations, rather than
+            just the p-values.
+    
+    Returns:
+        numpy array of p-values, in the same order as the genes. If full_output
+        is True, this returns a dict with arrays for the 'p_value', the number
+        of 'iterations' and the 'seed' for each gene.
+    '''
+    
+    if sampler not in ['alias', 'cumulative']:
+        raise ValueError('unknown sampler: {}'.format(sampler))
+    
+    seed = get_seed(seed)
+    seeds = [ (seed + i) % 2**64 for i in range(len(genes)) ]
+    
+    cdef vector[GeneJob] jobs
+    cdef GeneJob job
+    cdef WeightedChoice choices
+    for (choices, severity, observed, count), job_seed in zip(genes, seeds):
+        job.choices = choices.thisptr
+        job.severity = severity
+        job.observed = observed
+        job.count = count
+        job.seed = job_seed
+        jobs.push_back(job)
+    
+    cdef int min_iters = min_iterations
+    cdef int max_iters = max_iterations
+    cdef double deviate = z
+    cdef double prec = precision
+    cdef double threshold = alpha if alpha is not None else 0.0
+    cdef int n_threads = threads
+    cdef bint alias = sampler == 'alias'
+    cdef vector[SimulationResult] results
+    
+    with nogil:
+        results = _analyse_genes(jobs, min_iters, max_iters, deviate, prec,
+            threshold, n_threads, alias)
+    
+    p_values = numpy.array([ x.p_value for x in results ], dtype=numpy.float64)
+    if full_output:
+        iterations = numpy.array([ x.iterations for x in results ],
+            dtype=numpy.int64)
+        return {'p_value': p_values, 'iterations': iterations,
+            'seed': numpy.array(seeds, dtype=numpy.uint64)}
+    
+    return p_values
+
+def _analyse_many(WeightedChoice choices, severity, observed, count,
+        min_iterations, max_iterations, z, precision, alpha, threads, sampler,
+        seed, full_output):
+    ''' analyse K severity score lists from one set of simulations
+    
+    See analyse() for the arguments.
+    '''
+    
+    if len(severity) != len(observed):
+        raise ValueError('need one observed total per severity list')
+    
+    cdef Chooser * rates = choices.thisptr
+    cdef vector[vector[double]] scores = [ list(x) for x in severity ]
+    cdef vector[vector[double]] totals = [ [x] for x in observed ]
+    cdef int n = count
+    cdef int min_iters = min_iterations
+    cdef int max_iters = max_iterations
+    cdef double deviate = z
+    cdef double prec = precision
+    cdef double threshold = alpha if alpha is not None else 0.0
+    cdef int n_threads = threads
+    cdef bint alias = sampler == 'alias'
+    cdef unsigned long long seed_value = seed
+    cdef vector[vector[SimulationResult]] results
+    
+    with nogil:
+        results = _analyse_multi(deref(rates), scores, totals, n, min_iters,
+            max_iters, deviate, prec, threshold, n_threads, alias, seed_value)
+    
+    p_values = [ x[0].p_value for x in results ]
+    if full_output:
+        return {'p_value': p_values,
+            'iterations': [ x[0].iterations for x in results ], 'seed': seed}
+    
+    return p_values
+
+def null_histogram(WeightedChoice choices, severity, count, iterations=1000000,
+        bins=100, threads=1, sampler='alias', seed=None):
+    ''' simulate the null distribution of summed severity, for diagnostics
+    
+    Args:
+        choices: WeightedChoice object of mutation rates per position and alt
+            allele for all possible SNVs within a gene.
+        severity: list of severity scores, matching the same position and alt
+            allele order as for the choices object.
+        count: number of de novo mutations to sum severity across.
+        iterations: number of simulations to run.
+        bins: number of equal width bins, spanning the lowest and highest
+            possible summed severity.
+        threads: number of threads to split the simulations across.
+        sampler: how to sample sites, either 'alias' or 'cumulative'.
+        seed: seed for the random number generators, or None for a random seed.
+    
+    Returns:
+        tuple of (edges, counts), where edges is a list of the bin boundaries
+        (one longer than the counts), and counts is a list of the number of
+        simulated totals within each bin.
+    '''
+    
+    if sampler not in ['alias', 'cumulative']:
+        raise ValueError('unknown sampler: {}'.format(sampler))
+    
+    cdef Chooser * rates = choices.thisptr
+    cdef vector[double] scores = severity
+    cdef int n = count
+    cdef int iters = iterations
+    cdef int n_bins = bins
+    cdef int n_threads = threads
+    cdef bint alias = sampler == 'alias'
+    cdef unsigned long long seed_value = get_seed(seed)
+    cdef Histogram hist
+    
+    with nogil:
+        hist = _null_histogram(deref(rates), scores, n, iters, n_bins,
+            n_threads, alias, seed_value)
+    
+    width = (hist.upper - hist.lower) / n_bins
+    edges = [ hist.lower + i * width for i in range(n_bins + 1) ]
+    
+    return edges, list(hist.counts)
+
+def analyse_importance(WeightedChoice choices, severity, observed, count,
+        iterations=100000, threads=1, seed=None):
+    ''' estimate the severity p-value for a gene by importance sampling
+    
+    Sites are sampled with rates exponentially tilted towards high severity
+    sites, so that the simulated totals are centred on the observed total. Each
+    simulation is reweighted by its likelihood ratio under the original and
+    tilted rates. This gives accurate p-values far below 1/iterations, which
+    plain simulation can't reach.
+    
     Args:
         choices: WeightedChoice object of mutation rates per position and alt
             allele for all possible SNVs within a gene.
@@ -43,11 +462,269 @@ def analyse(WeightedChoice choices, severity, observed, count,
             allele order as for the choices object.
         observed: summed severity score across the observed de novo mutations.
         count: number of observed de novo mutations.
-        iterations: number of iterations to run
+        iterations: number of simulations to run.
+        threads: number of threads to split the simulations across.
+        seed: seed for the random number generators, or None for a random seed.
+    
+    Returns:
+        tuple of (p_value, std_error), for the probability of a summed severity
+        greater than the observed under the null distribution, and the standard
+        error of the estimate.
+    '''
+    
+    cdef Chooser * rates = choices.thisptr
+    cdef vector[double] scores = severity
+    cdef double total = observed
+    cdef int n = count
+    cdef int iters = iterations
+    cdef int n_threads = threads
+    cdef unsigned long long seed_value = get_seed(seed)
+    cdef ImportanceResult result
+    
+    with nogil:
+        result = _analyse_importance(deref(rates), scores, total, n, iters,
+            n_threads, seed_value)
+    
+    return result.p_value, result.std_error
+
+def analyse_stratified(WeightedChoice choices, severity, strata, observed,
+        count, min_iterations=1000, max_iterations=100000000, z=2.575829,
+        precision=0.05, alpha=None, threads=1, sampler='alias', seed=None,
+        full_output=False):
+    ''' simulate the severity p-value for a gene, stratified by site class
+    
+    The de novos are split across strata (e.g. consequence classes) following
+    the multinomial distribution from the summed rates of each stratum. Every
+    split is weighted by its probability, and sites are only sampled within
+    strata. Strata where all sites have the same severity (e.g. truncating
+    sites, with the weighted scores) need no sampling, and splits which can't
+    cross the observed total need no simulations. This gives the same
+    precision as analyse() from fewer sampled sites.
+    
+    Args:
+        choices: WeightedChoice object of mutation rates per position and alt
+            allele for all possible SNVs within a gene.
+        severity: list of severity scores, matching the same position and alt
+            allele order as for the choices object.
+        strata: list of integer stratum labels for each site, such as
+            consequence class indices, in the same order as the choices object.
+        observed: summed severity score across the observed de novo mutations.
+        count: number of observed de novo mutations.
+        min_iterations: number of simulations before the first check.
+        max_iterations: maximum number of simulations to run.
+        z: standard normal deviate for the confidence interval around the
+            p-value, the default is for a 99% confidence interval.
+        precision: stop once the confidence interval width (either side of the
+            p-value) is below this proportion of the p-value.
+        alpha: significance threshold, stop once the confidence interval lower
+            bound exceeds this. None disables this check.
+        threads: number of threads to spread the strata splits across.
+        sampler: how to sample sites within strata, either 'alias' or
+            'cumulative', as for analyse().
+        seed: seed for the random number generators. Results are reproducible
+            for the same seed, whatever the number of threads. A random seed is
+            used if this is None.
+        full_output: whether to return details of the simulations, rather than
+            just the p-value.
     
     Returns:
         probability of getting the observed severity score (or greater) under
-        the null distribution.
+        the null distribution. If full_output is True, this returns a dict with
+        the 'p_value', the number of 'iterations' run, the number of sites
+        sampled ('draws'), the 'effective_iterations' (the number of analyse()
+        simulations with the same precision), and the 'seed' used.
+    '''
+    
+    if sampler not in ['alias', 'cumulative']:
+        raise ValueError('unknown sampler: {}'.format(sampler))
+    
+    seed = get_seed(seed)
+    
+    cdef Chooser * rates = choices.thisptr
+    cdef vector[double] scores = severity
+    cdef vector[int] labels = strata
+    cdef double total = observed
+    cdef int n = count
+    cdef int min_iters = min_iterations
+    cdef int max_iters = max_iterations
+    cdef double deviate = z
+    cdef double prec = precision
+    cdef double threshold = alpha if alpha is not None else 0.0
+    cdef int n_threads = threads
+    cdef bint alias = sampler == 'alias'
+    cdef unsigned long long seed_value = seed
+    cdef StratifiedResult result
+    
+    with nogil:
+        result = _analyse_stratified(deref(rates), scores, labels, total, n,
+            min_iters, max_iters, deviate, prec, threshold, n_threads, alias,
+            seed_value)
+    
+    if full_output:
+        return {'p_value': result.p_value, 'iterations': result.iterations,
+            'draws': result.draws, 'effective_iterations': result.effective,
+            'seed': seed}
+    
+    return result.p_value
+
+def analyse_exact(WeightedChoice choices, severity, observed, count,
+        resolution=0.01):
+    ''' calculate the severity p-value for a gene without simulation
+    
+    The null distribution for the summed severity of n de novos is the n-fold
+    convolution of the distribution for a single de novo. We round the severity
+    scores to a grid, and get the convolution via a fast fourier transform, so
+    this is quick for modest de novo counts, and is not limited by the number
+    of iterations.
+    
+    Args:
+        choices: WeightedChoice object of mutation rates per position and alt
+            allele for all possible SNVs within a gene.
+        severity: list of severity scores, matching the same position and alt
+            allele order as for the choices object.
+        observed: summed severity score across the observed de novo mutations.
+        count: number of observed de novo mutations.
+        resolution: width of the grid bins for severity scores. Finer grids are
+            more accurate, but slower and use more memory.
+    
+    Returns:
+        tuple of (p_value, lower, upper), where the p-value is the probability
+        of a summed severity greater than the observed under the null
+        distribution, and the lower and upper values bound the p-value, given
+        the largest error from rounding severity scores to the grid, and the
+        round-off error from the transforms. Tails below the round-off error
+        (around 1e-16 per bin) have a lower bound of zero.
     '''
     
-    return _analyse(deref(choices.thisptr), severity, observed, count, iterations)
+    result = _analyse_exact(deref(choices.thisptr), severity, observed, count,
+        resolution)
+    
+    return result.p_value, result.lower, result.upper
+
+def exact_null_distribution(WeightedChoice choices, severity, count,
+        resolution=0.01):
+    ''' get the exact null distribution of summed severity for a gene
+    
+    See analyse_exact() for details. This returns the distribution itself, so
+    it can be stored and reused for any observed total with the same count.
+    
+    Args:
+        choices: WeightedChoice object of mutation rates per position and alt
+            allele for all possible SNVs within a gene.
+        severity: list of severity scores, matching the same position and alt
+            allele order as for the choices object.
+        count: number of de novo mutations to sum severity across.
+        resolution: width of the grid bins for severity scores.
+    
+    Returns:
+        dict with the summed severity for the first bin ('offset'), the bin
+        width ('step'), the de novo 'count', the largest rounding error for a
+        severity score ('max_error'), and a numpy array of the probability for
+        each bin ('pmf').
+    '''
+    
+    cdef vector[double] scores = severity
+    cdef NullDistribution null = exact_null(deref(choices.thisptr), scores,
+        count, resolution)
+    
+    return {'offset': null.offset, 'step': null.step, 'count': null.count,
+        'max_error': null.max_error,
+        'pmf': numpy.array(null.pmf, dtype=numpy.float64)}
+
+def null_tail_probability(null, observed):
+    ''' get the p-value for an observed total from an exact null distribution
+    
+    Args:
+        null: dict for a null distribution, from exact_null_distribution()
+        observed: summed severity score across the observed de novo mutations.
+    
+    Returns:
+        tuple of (p_value, lower, upper), as for analyse_exact()
+    '''
+    
+    cdef NullDistribution dist
+    dist.offset = null['offset']
+    dist.step = null['step']
+    dist.count = null['count']
+    dist.max_error = null['max_error']
+    dist.pmf = null['pmf']
+    
+    result = tail_probability(dist, observed)
+    
+    return result.p_value, result.lower, result.upper
+
+def analyse_batch(WeightedChoice choices, severity, observed, counts,
+        method='simulate', min_iterations=1000, max_iterations=100000000,
+        z=2.575829, precision=0.05, alpha=None, threads=1, sampler='alias',
+        seed=None, resolution=0.01):
+    ''' get severity p-values for many observed totals and counts in a gene
+    
+    This is for asking the same gene many questions, such as for leave-one-out
+    analyses or cohort subsets. The null distribution only depends on the
+    number of de novos, so we simulate once for each distinct count, and
+    compare every observed total for that count against the same simulations.
+    With method='exact', we calculate one exact null distribution per count.
+    
+    Args:
+        choices: WeightedChoice object of mutation rates per position and alt
+            allele for all possible SNVs within a gene.
+        severity: list of severity scores, matching the same position and alt
+            allele order as for the choices object.
+        observed: list of summed severity scores
+        counts: list of de novo counts, one for each observed total
+        method: 'simulate' or 'exact'
+        resolution: width of the grid bins for severity scores, for the exact
+            method.
+        
+        The other arguments are as for analyse().
+    
+    Returns:
+        list of p-values, in the same order as the observed totals.
+    '''
+    
+    observed, counts = list(observed), list(counts)
+    if len(observed) != len(counts):
+        raise ValueError('need one count per observed total')
+    if method not in ['simulate', 'exact']:
+        raise ValueError('unknown method: {}'.format(method))
+    if sampler not in ['alias', 'cumulative']:
+        raise ValueError('unknown sampler: {}'.format(sampler))
+    
+    cdef Chooser * rates = choices.thisptr
+    cdef vector[double] scores = severity
+    cdef vector[vector[double]] all_scores = [severity]
+    cdef vector[vector[double]] totals
+    cdef int n
+    cdef int min_iters = min_iterations
+    cdef int max_iters = max_iterations
+    cdef double deviate = z
+    cdef double prec = precision
+    cdef double threshold = alpha if alpha is not None else 0.0
+    cdef int n_threads = threads
+    cdef bint alias = sampler == 'alias'
+    cdef unsigned long long seed_value = get_seed(seed)
+    cdef vector[vector[SimulationResult]] results
+    cdef NullDistribution null
+    
+    by_count = {}
+    for i, count in enumerate(counts):
+        by_count.setdefault(count, []).append(i)
+    
+    p_values = [None] * len(observed)
+    for count in sorted(by_count):
+        idx = by_count[count]
+        n = count
+        if method == 'exact':
+            null = exact_null(deref(rates), scores, n, resolution)
+            for i in idx:
+                p_values[i] = tail_probability(null, observed[i]).p_value
+        else:
+            totals = [[ observed[i] for i in idx ]]
+            with nogil:
+                results = _analyse_multi(deref(rates), all_scores, totals, n,
+                    min_iters, max_iters, deviate, prec, threshold, n_threads,
+                    alias, seed_value)
+            for i, result in zip(idx, results[0]):
+                p_values[i] = result['p_value']
+    
+    return p_values
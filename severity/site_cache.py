@@ -0,0 +1,323 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy
+from intervaltree import IntervalTree
+
+from severity.simulation import from_arrays, to_arrays
+
+BASES = 'ACGTN'
+BASE_CODES = dict( (x, i) for i, x in enumerate(BASES) )
+CONSEQUENCES = ['missense', 'nonsense', 'splice_lof']
+
+# arrays stored for each gene, and their data types
+ARRAYS = {'pos': numpy.int32, 'ref': numpy.uint8, 'alt': numpy.uint8,
+    'offset': numpy.int32, 'rate': numpy.float64, 'cq': numpy.uint8,
+    'cadd': numpy.float64, 'constrained_start': numpy.int32,
+    'constrained_end': numpy.int32}
+
+def file_signature(path):
+    ''' get a cheap signature for a file, without reading the full file
+    
+    Files like the CADD scores are far too large to checksum for every run, so
+    we use the filename, size and modification time instead.
+    
+    Args:
+        path: path to file
+    
+    Returns:
+        string of the file name, size and modification time
+    '''
+    if path is None:
+        return 'None'
+    
+    # folders (such as a CaddStore) are signed by their metadata file, which
+    # is written last
+    if os.path.isdir(path):
+        path = os.path.join(path, 'meta.json')
+    
+    stat = os.stat(path)
+    return '{}:{}:{}'.format(os.path.basename(path), stat.st_size,
+        int(stat.st_mtime))
+
+class SiteCache(object):
+    ''' on-disk cache of per-gene site tables
+    
+    Each gene gets a folder of numpy arrays for the positions, alleles, mutation
+    rates, consequence classes and CADD scores of every site/allele, along with
+    the constrained intervals. The arrays are memory-mapped when loaded. The
+    folder names include a checksum of the inputs, so changing any input leads
+    to new entries, rather than stale results.
+    '''
+    
+    def __init__(self, folder, build, inputs):
+        '''
+        Args:
+            folder: path to folder to store gene tables in
+            build: genome build e.g. 'grch37'
+            inputs: list of objects which determine the site tables, such as
+                the mutation rates, and signatures of the CADD and constraint
+                files. These are hashed via their repr().
+        '''
+        self.folder = folder
+        self.build = build
+        
+        # include the array types, so tables saved in an older layout are
+        # rebuilt, rather than loaded
+        layout = sorted( (k, numpy.dtype(v).str) for k, v in ARRAYS.items() )
+        key = repr([inputs, layout]).encode('utf8')
+        self.digest = hashlib.md5(key).hexdigest()
+        
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+    
+    def path(self, symbol, transcripts):
+        ''' get the path to the table for a gene
+        
+        Args:
+            symbol: HGNC symbol for the gene
+            transcripts: list of Transcript objects. The transcripts used for a
+                gene depend on which transcripts contain the de novos, so these
+                are part of the key.
+        
+        Returns:
+            path to the folder for the gene table
+        '''
+        names = ','.join(sorted( tx.get_name() for tx in transcripts ))
+        key = '{}:{}'.format(names, self.digest).encode('utf8')
+        digest = hashlib.md5(key).hexdigest()
+        
+        return os.path.join(self.folder, '{}.{}.{}'.format(symbol, self.build,
+            digest))
+    
+    def load(self, symbol, transcripts):
+        ''' load the table for a gene, or None if the gene hasn't been cached
+        '''
+        path = self.path(symbol, transcripts)
+        if not os.path.exists(path):
+            return None
+        
+        return load_site_table(path)
+    
+    def save(self, symbol, transcripts, table):
+        ''' save the table for a gene
+        '''
+        save_site_table(self.path(symbol, transcripts), table)
+
+class MemorySiteCache(object):
+    ''' in-memory cache of per-gene site tables, holding the most recently used
+    
+    This has the same interface as SiteCache, so can be passed to analyse_gene.
+    Tables missing from memory are loaded from an optional on-disk SiteCache.
+    The cache is safe to share between threads.
+    '''
+    
+    def __init__(self, max_genes=1000, backing=None):
+        '''
+        Args:
+            max_genes: number of gene tables to hold in memory
+            backing: optional SiteCache to load tables from, and save tables to
+        '''
+        self.max_genes = max_genes
+        self.backing = backing
+        self.tables = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def key(self, symbol, transcripts):
+        return (symbol, tuple(sorted( tx.get_name() for tx in transcripts )))
+    
+    def load(self, symbol, transcripts):
+        ''' load the table for a gene, or None if the gene hasn't been cached
+        '''
+        key = self.key(symbol, transcripts)
+        with self.lock:
+            if key in self.tables:
+                self.hits += 1
+                self.tables.move_to_end(key)
+                return self.tables[key]
+            self.misses += 1
+        
+        table = None
+        if self.backing is not None:
+            table = self.backing.load(symbol, transcripts)
+        if table is not None:
+            self.add(key, table)
+        
+        return table
+    
+    def save(self, symbol, transcripts, table):
+        ''' save the table for a gene
+        '''
+        if self.backing is not None:
+            self.backing.save(symbol, transcripts, table)
+        self.add(self.key(symbol, transcripts), table)
+    
+    def add(self, key, table):
+        with self.lock:
+            self.tables[key] = table
+            self.tables.move_to_end(key)
+            while len(self.tables) > self.max_genes:
+                self.tables.popitem(last=False)
+    
+    def __len__(self):
+        return len(self.tables)
+
+def save_site_table(path, table):
+    ''' write a site table to disk
+    
+    The table is written to a temporary folder, then renamed into place, so
+    concurrent workers never see a partially written table.
+    
+    Args:
+        path: path to folder for the table
+        table: dict of arrays (see ARRAYS), plus the 'chrom'
+    '''
+    
+    parent = os.path.dirname(os.path.abspath(path))
+    temp = tempfile.mkdtemp(dir=parent)
+    
+    for key, dtype in ARRAYS.items():
+        numpy.save(os.path.join(temp, key + '.npy'),
+            numpy.asarray(table[key], dtype=dtype))
+    
+    with open(os.path.join(temp, 'meta.json'), 'w') as handle:
+        json.dump({'chrom': table['chrom']}, handle)
+    
+    try:
+        os.rename(temp, path)
+    except OSError:
+        # another worker saved the same table first
+        shutil.rmtree(temp)
+
+def load_site_table(path):
+    ''' load a site table from disk, with memory-mapped arrays
+    
+    Args:
+        path: path to folder for the table
+    
+    Returns:
+        dict of arrays (see ARRAYS), plus the 'chrom'
+    '''
+    
+    table = {}
+    for key in ARRAYS:
+        table[key] = numpy.load(os.path.join(path, key + '.npy'), mmap_mode='r')
+    
+    with open(os.path.join(path, 'meta.json')) as handle:
+        table['chrom'] = json.load(handle)['chrom']
+    
+    return table
+
+def build_site_table(rates_by_cq, chrom, severity, constrained):
+    ''' construct a site table from the per-consequence site rates
+    
+    Args:
+        rates_by_cq: dict of WeightedChoice objects, indexed by consequence
+        chrom: chromosome for the gene
+        severity: list of CADD scores, in the same order as the sites from the
+            rates_by_cq objects, taking the consequences in sorted order.
+        constrained: IntervalTree of regions under regional constraint
+    
+    Returns:
+        dict of arrays (see ARRAYS), plus the 'chrom'
+    '''
+    
+    keys = ['pos', 'ref', 'alt', 'rate', 'offset']
+    columns = dict( (key, []) for key in keys + ['cq'] )
+    for cq in sorted(rates_by_cq):
+        arrays = to_arrays(rates_by_cq[cq])
+        for key, values in zip(keys, arrays):
+            columns[key].append(values)
+        columns['cq'].append(numpy.full(len(arrays[0]),
+            CONSEQUENCES.index(cq), dtype=numpy.uint8))
+    
+    table = dict( (key, numpy.concatenate(columns[key]) if len(columns[key]) > 0
+        else []) for key in columns )
+    table['cadd'] = severity
+    
+    intervals = sorted( (x.begin, x.end) for x in constrained )
+    table['constrained_start'] = [ x[0] for x in intervals ]
+    table['constrained_end'] = [ x[1] for x in intervals ]
+    
+    table = dict( (key, numpy.asarray(table[key], dtype=dtype))
+        for key, dtype in ARRAYS.items() )
+    table['chrom'] = chrom
+    
+    return table
+
+def table_to_rates(table):
+    ''' convert a site table into a site sampler
+    
+    Args:
+        table: dict of arrays for a site table
+    
+    Returns:
+        WeightedChoice object, with sites in the same order as the table
+    '''
+    
+    return from_arrays(table['pos'], table['ref'], table['alt'], table['rate'],
+        table['offset'])
+
+def table_to_constrained(table):
+    ''' get an IntervalTree of the constrained regions in a site table
+    '''
+    
+    return IntervalTree.from_tuples(zip(table['constrained_start'].tolist(),
+        table['constrained_end'].tolist()))
+
+def lookup_scores(table, sites):
+    ''' find the CADD scores for specific sites from a site table
+    
+    Args:
+        table: dict of arrays for a site table
+        sites: list of dicts with 'pos' and 'alt' keys
+    
+    Returns:
+        list of CADD scores for the sites, or None for sites missing from the
+        table.
+    '''
+    
+    # the sites are grouped by consequence, so aren't sorted by position
+    order = numpy.argsort(table['pos'], kind='mergesort')
+    positions = table['pos'][order]
+    
+    query = numpy.array([ x['pos'] for x in sites ], dtype=numpy.int64)
+    starts = numpy.searchsorted(positions, query, side='left')
+    ends = numpy.searchsorted(positions, query, side='right')
+    
+    scores = []
+    for site, start, end in zip(sites, starts, ends):
+        rows = order[start:end]
+        rows = rows[table['alt'][rows] == BASE_CODES.get(site['alt'], -1)]
+        scores.append(float(table['cadd'][rows[0]]) if len(rows) > 0 else None)
+    
+    return scores
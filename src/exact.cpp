@@ -0,0 +1,258 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#include <vector>
+#include <complex>
+#include <cmath>
+#include <algorithm>
+#include <stdexcept>
+#include <utility>
+#include <limits>
+
+#include "exact.h"
+
+// largest grid of summed severity bins we allow before asking for a coarser
+// resolution, this uses ~1 GB for the complex values in the transform.
+const long long MAX_GRID_SIZE = 67108864;
+
+void _fft(std::vector<std::complex<double>> &values, bool inverse) {
+    /**
+        in-place iterative radix-2 fast fourier transform
+        
+        @values vector of complex values to transform. The length must be a
+            power of two.
+        @inverse whether to run the inverse transform. This includes the
+            scaling by 1/n, so that a forward then inverse transform returns
+            the original values.
+    */
+    int n = values.size();
+    
+    // reorder the values by bit-reversed index
+    for (int i=1, j=0; i < n; i++) {
+        int bit = n >> 1;
+        for (; j & bit; bit >>= 1) { j ^= bit; }
+        j ^= bit;
+        if (i < j) { std::swap(values[i], values[j]); }
+    }
+    
+    // precompute the roots of unity directly, rather than by repeated
+    // multiplication, so rounding errors do not accumulate across the stages
+    const double pi = std::acos(-1.0);
+    double sign = (inverse) ? 1.0 : -1.0;
+    std::vector<std::complex<double>> roots(n / 2);
+    for (int k=0; k < n / 2; k++) {
+        roots[k] = std::polar(1.0, sign * 2.0 * pi * k / n);
+    }
+    
+    for (int len=2; len <= n; len <<= 1) {
+        int half = len >> 1;
+        int stride = n / len;
+        for (int i=0; i < n; i += len) {
+            for (int k=0; k < half; k++) {
+                std::complex<double> u = values[i + k];
+                std::complex<double> v = values[i + k + half] * roots[k * stride];
+                values[i + k] = u + v;
+                values[i + k + half] = u - v;
+            }
+        }
+    }
+    
+    if (inverse) {
+        for (auto &x : values) { x /= static_cast<double>(n); }
+    }
+}
+
+std::complex<double> int_power(std::complex<double> value, int exponent) {
+    /**
+        raise a complex value to a positive integer power by repeated squaring
+    */
+    std::complex<double> result(1.0, 0.0);
+    while (exponent > 0) {
+        if (exponent & 1) { result *= value; }
+        value *= value;
+        exponent >>= 1;
+    }
+    return result;
+}
+
+NullDistribution exact_null(Chooser &choices, std::vector<double> &severity,
+        int count, double resolution) {
+    /**
+        get the exact distribution of summed severity for n de novos
+        
+        Each severity score is rounded to a grid with the given resolution, so
+        the probability of a single de novo falling within each grid bin is the
+        summed rate of the sites in the bin, divided by the total rate. The
+        distribution for n de novos is the n-fold convolution of the single
+        de novo distribution, which we get by raising its fourier transform to
+        the nth power.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @count number of de novos to sum severity across
+        @resolution width of the grid bins for severity scores
+        @return NullDistribution with the probability of each summed bin
+    */
+    int len = choices.len();
+    int sev_len = severity.size();
+    if (len != sev_len) { throw std::invalid_argument("severity scores do not match rates!"); }
+    if (len == 0) { throw std::invalid_argument("no per-base/allele rates supplied!"); }
+    if (count <= 0) { throw std::invalid_argument("sampling zero de novos!"); }
+    if (resolution <= 0) { throw std::invalid_argument("resolution must be positive!"); }
+    
+    double lowest = *std::min_element(severity.begin(), severity.end());
+    double highest = *std::max_element(severity.begin(), severity.end());
+    int bins = static_cast<int>(std::round((highest - lowest) / resolution)) + 1;
+    
+    long long size = static_cast<long long>(bins - 1) * count + 1;
+    if (size > MAX_GRID_SIZE) {
+        throw std::invalid_argument("too many bins for exact distribution, "
+            "use a coarser resolution!");
+    }
+    
+    // find the distribution for a single de novo
+    std::vector<double> single(bins, 0.0);
+    double total = 0.0;
+    double max_error = 0.0;
+    for (int i=0; i < len; i++) {
+        double prob = choices.rate(i);
+        int k = static_cast<int>(std::round((severity[i] - lowest) / resolution));
+        single[k] += prob;
+        total += prob;
+        
+        double error = std::fabs(severity[i] - (lowest + k * resolution));
+        max_error = std::max(max_error, error);
+    }
+    
+    int n = 1;
+    while (n < size) { n <<= 1; }
+    
+    std::vector<std::complex<double>> values(n);
+    for (int k=0; k < bins; k++) { values[k] = single[k] / total; }
+    
+    _fft(values, false);
+    for (auto &x : values) { x = int_power(x, count); }
+    _fft(values, true);
+    
+    // convert back to probabilities, round-off from the transform can leave
+    // tiny negative values in bins which should be empty
+    std::vector<double> pmf(size);
+    for (int k=0; k < size; k++) { pmf[k] = std::max(0.0, values[k].real()); }
+    
+    return NullDistribution {lowest * count, resolution, count, max_error,
+        std::move(pmf)};
+}
+
+long long first_bin(double threshold) {
+    /**
+        find the first bin above a fractional bin index
+        
+        We allow a little slack, so that sums which exactly match the threshold
+        are not counted due to floating point noise.
+    */
+    double epsilon = 1e-6;
+    long long first = static_cast<long long>(std::floor(threshold + epsilon)) + 1;
+    return std::max(first, 0LL);
+}
+
+double tail_sum(std::vector<double> &pmf, double threshold) {
+    /**
+        sum the probabilities for bins with indices above a threshold
+        
+        @pmf probability mass per grid bin
+        @threshold fractional bin index, we sum across the bins above this.
+        @return summed probability
+    */
+    long long first = first_bin(threshold);
+    long long size = pmf.size();
+    double total = 0.0;
+    for (long long k=size - 1; k >= first; k--) { total += pmf[k]; }
+    
+    return std::min(total, 1.0);
+}
+
+double round_off(NullDistribution &null) {
+    /**
+        bound the round-off error in each bin of the null distribution
+        
+        The transforms and the powers leave noise of around machine epsilon
+        times the largest bin in every bin, growing with the log of the
+        transform length and with the number of de novos. This is far above
+        the true mass in the far tail, so tails below it aren't resolved.
+        
+        @null NullDistribution for the summed severity
+        @return largest expected absolute error in any single bin
+    */
+    long long size = null.pmf.size();
+    long long n = 1;
+    while (n < size) { n <<= 1; }
+    
+    double highest = *std::max_element(null.pmf.begin(), null.pmf.end());
+    double epsilon = std::numeric_limits<double>::epsilon();
+    
+    return epsilon * std::max(1.0, std::log2(n)) * highest * null.count;
+}
+
+ExactResult tail_probability(NullDistribution &null, double observed) {
+    /**
+        find the probability of a summed severity greater than the observed
+        
+        Each score can be up to max_error away from its grid value, so the
+        summed score can be up to count * max_error away from its summed grid
+        value. We use that to bound the p-value either side of the estimate.
+        The bounds also allow for the round-off error in each bin summed, so
+        the lower bound is zero once the tail is below the round-off error.
+        
+        @null NullDistribution for the summed severity
+        @observed observed summed severity
+        @return ExactResult with the p-value, and lower and upper bounds
+    */
+    double threshold = (observed - null.offset) / null.step;
+    double shift = (null.count * null.max_error) / null.step;
+    double noise = round_off(null);
+    long long size = null.pmf.size();
+    
+    auto error = [&](double x) {
+        return noise * std::max(size - first_bin(x), 0LL);
+    };
+    
+    double p_value = tail_sum(null.pmf, threshold);
+    double lower = tail_sum(null.pmf, threshold + shift) - error(threshold + shift);
+    double upper = tail_sum(null.pmf, threshold - shift) + error(threshold - shift);
+    
+    return ExactResult {p_value, std::max(lower, 0.0), std::min(upper, 1.0)};
+}
+
+ExactResult _analyse_exact(Chooser &choices, std::vector<double> severity,
+        double observed, int count, double resolution) {
+    /**
+        calculates the probability of observing n de novos with a combined
+        severity score greater than the observed severity total, without
+        simulation.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @observed observed summed severity
+        @count number of de novos to sum severity across
+        @resolution width of the grid bins for severity scores
+        @return ExactResult with the p-value, and lower and upper bounds
+    */
+    auto null = exact_null(choices, severity, count, resolution);
+    return tail_probability(null, observed);
+}
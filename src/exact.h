@@ -0,0 +1,56 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#ifndef SEVERITY_EXACT_H_
+#define SEVERITY_EXACT_H_
+
+#include <vector>
+#include <complex>
+
+#include "weighted_choice.h"
+
+struct NullDistribution {
+    // summed severity for the first bin, and the width of each bin
+    double offset;
+    double step;
+    
+    // number of de novos summed across
+    int count;
+    
+    // largest difference between a severity score and its grid value
+    double max_error;
+    
+    // probability mass for each bin of summed severity
+    std::vector<double> pmf;
+};
+
+struct ExactResult {
+    double p_value;
+    double lower;
+    double upper;
+};
+
+void _fft(std::vector<std::complex<double>> &values, bool inverse);
+NullDistribution exact_null(Chooser &choices, std::vector<double> &severity,
+    int count, double resolution);
+ExactResult tail_probability(NullDistribution &null, double observed);
+ExactResult _analyse_exact(Chooser &choices, std::vector<double> severity,
+    double observed, int count, double resolution=0.01);
+
+#endif // SEVERITY_EXACT_H_
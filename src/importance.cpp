@@ -0,0 +1,192 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#include <vector>
+#include <algorithm>
+#include <stdexcept>
+#include <cmath>
+
+#include "importance.h"
+#include "simulate.h"
+
+Tilt tilt_rates(std::vector<double> &probs, std::vector<double> &severity,
+        double theta) {
+    /**
+        exponentially tilt site probabilities towards higher severity scores
+        
+        The tilted probability for site i is p_i * exp(theta * s_i) / M(theta),
+        where M(theta) is the moment generating function for the severity of a
+        single de novo. We subtract the highest score before exponentiating,
+        to avoid overflow.
+        
+        @probs probability of sampling each site
+        @severity severity scores, index-aligned with the probabilities
+        @theta tilting parameter, zero leaves the probabilities unchanged
+        @return Tilt with the tilted weights, and log of M(theta)
+    */
+    double highest = *std::max_element(severity.begin(), severity.end());
+    
+    int len = probs.size();
+    std::vector<double> weights(len);
+    double total = 0.0;
+    for (int i=0; i < len; i++) {
+        weights[i] = probs[i] * std::exp(theta * (severity[i] - highest));
+        total += weights[i];
+    }
+    
+    for (auto &x : weights) { x /= total; }
+    double log_mgf = theta * highest + std::log(total);
+    
+    return Tilt {theta, log_mgf, weights};
+}
+
+double tilted_mean(Tilt &tilt, std::vector<double> &severity) {
+    /**
+        get the mean severity for a single de novo under the tilted weights
+    */
+    double mean = 0.0;
+    for (unsigned i=0; i < severity.size(); i++) {
+        mean += tilt.weights[i] * severity[i];
+    }
+    return mean;
+}
+
+Tilt find_tilt(std::vector<double> &probs, std::vector<double> &severity,
+        double target) {
+    /**
+        find the tilt which centres the severity for a single de novo on a target
+        
+        Centring the proposal distribution on the observed severity means
+        around half of the simulations exceed the observed total, rather than
+        a tiny fraction under the untilted rates.
+        
+        @probs probability of sampling each site
+        @severity severity scores, index-aligned with the probabilities
+        @target mean severity per de novo to tilt towards. This must be below
+            the highest severity score.
+        @return Tilt with the tilted weights, and log of M(theta)
+    */
+    Tilt tilt = tilt_rates(probs, severity, 0.0);
+    if (tilted_mean(tilt, severity) >= target) { return tilt; }
+    
+    // the tilted mean increases with theta, so find an upper bound for theta,
+    // then bisect between the bounds
+    double lower = 0.0;
+    double upper = 1.0;
+    for (int i=0; i < 100; i++) {
+        tilt = tilt_rates(probs, severity, upper);
+        if (tilted_mean(tilt, severity) >= target) { break; }
+        lower = upper;
+        upper *= 2;
+    }
+    
+    for (int i=0; i < 100; i++) {
+        double mid = (lower + upper) / 2;
+        tilt = tilt_rates(probs, severity, mid);
+        if (tilted_mean(tilt, severity) < target) {
+            lower = mid;
+        } else {
+            upper = mid;
+        }
+    }
+    
+    return tilt_rates(probs, severity, upper);
+}
+
+ImportanceResult _analyse_importance(Chooser &choices,
+        std::vector<double> severity, double observed, int count,
+        int iterations, int threads, unsigned long long seed) {
+    /**
+        estimate the probability of a summed severity above the observed total
+        by importance sampling
+        
+        We sample sites from rates exponentially tilted towards high severity
+        sites, so the observed total is reached often, even for tiny p-values.
+        Each simulated total S is reweighted by its likelihood ratio under the
+        original and tilted rates, which is exp(count * log(M(theta)) - theta * S).
+        The p-value is the mean of the weights for totals above the observed
+        total.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @observed observed summed severity
+        @count number of de novos to sum severity across
+        @iterations number of simulations to run
+        @threads number of threads to split the simulations across
+        @seed seed for the random number generators
+        @return ImportanceResult with the p-value and its standard error
+    */
+    check_inputs(choices, severity, count, threads);
+    if (iterations < 1) { throw std::invalid_argument("need at least one iteration!"); }
+    
+    // totals above the highest achievable total are impossible
+    double highest = *std::max_element(severity.begin(), severity.end());
+    if (observed >= highest * count) { return ImportanceResult {0.0, 0.0}; }
+    
+    int len = choices.len();
+    std::vector<double> probs(len);
+    double rate = 0.0;
+    for (int i=0; i < len; i++) {
+        probs[i] = choices.rate(i);
+        rate += probs[i];
+    }
+    for (auto &x : probs) { x /= rate; }
+    
+    Tilt tilt = find_tilt(probs, severity, observed / count);
+    AliasChooser table(tilt.weights);
+    double log_scale = count * tilt.log_mgf;
+    
+    // sum the weights within each block, then across blocks in order, so the
+    // result doesn't depend on how the blocks are split across threads
+    long long blocks = (iterations + BLOCK_SIZE - 1) / BLOCK_SIZE;
+    std::vector<double> sums(blocks, 0.0);
+    std::vector<double> squares(blocks, 0.0);
+    
+    run_blocks(0, iterations, count, threads, seed,
+        [&](int thread, long long block, Xoshiro256 &generator, int chunk) {
+            double sum = 0.0;
+            double square = 0.0;
+            for (int n=0; n < chunk; n++) {
+                double total = 0.0;
+                for (int i=0; i < count; i++) {
+                    total += severity[table.choice_index(generator)];
+                }
+                
+                if (total > observed) {
+                    double weight = std::exp(log_scale - tilt.theta * total);
+                    sum += weight;
+                    square += weight * weight;
+                }
+            }
+            sums[block] = sum;
+            squares[block] = square;
+        });
+    
+    double sum = 0.0;
+    double square = 0.0;
+    for (long long i=0; i < blocks; i++) {
+        sum += sums[i];
+        square += squares[i];
+    }
+    
+    double p_value = sum / iterations;
+    double variance = (square / iterations - p_value * p_value) / iterations;
+    
+    return ImportanceResult {p_value, std::sqrt(std::max(variance, 0.0))};
+}
@@ -0,0 +1,49 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#ifndef SEVERITY_IMPORTANCE_H_
+#define SEVERITY_IMPORTANCE_H_
+
+#include <vector>
+
+#include "weighted_choice.h"
+
+struct ImportanceResult {
+    double p_value;
+    double std_error;
+};
+
+struct Tilt {
+    // tilting parameter, and the log moment generating function at theta
+    double theta;
+    double log_mgf;
+    
+    // tilted site weights, index-aligned with the severity scores
+    std::vector<double> weights;
+};
+
+Tilt tilt_rates(std::vector<double> &probs, std::vector<double> &severity,
+    double theta);
+Tilt find_tilt(std::vector<double> &probs, std::vector<double> &severity,
+    double target);
+ImportanceResult _analyse_importance(Chooser &choices,
+    std::vector<double> severity, double observed, int count,
+    int iterations=100000, int threads=1, unsigned long long seed=0);
+
+#endif // SEVERITY_IMPORTANCE_H_
@@ -0,0 +1,95 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#ifndef SEVERITY_RNG_H_
+#define SEVERITY_RNG_H_
+
+#include <cstdint>
+#include <limits>
+
+inline std::uint64_t splitmix64(std::uint64_t &state) {
+    /**
+        step a splitmix64 generator, used to expand seeds into generator states
+    */
+    std::uint64_t z = (state += 0x9E3779B97F4A7C15ULL);
+    z = (z ^ (z >> 30)) * 0xBF58476D1CE4E5B9ULL;
+    z = (z ^ (z >> 27)) * 0x94D049BB133111EBULL;
+    return z ^ (z >> 31);
+}
+
+class Xoshiro256 {
+    /**
+        xoshiro256** random number generator
+        
+        This is several times quicker per draw than std::mt19937_64, and has a
+        32 byte state rather than 2.5 kB, so it is cheap to construct a new
+        generator for each block of simulations. Generators are keyed by a seed
+        and a stream number. Streams for the same seed are decorrelated by
+        hashing the pair with splitmix64, so independent streams can be
+        constructed directly for any thread, block or gene, without stepping
+        through the streams before it.
+        
+        This satisfies the UniformRandomBitGenerator requirements, so it can
+        also be used with the standard library distributions.
+    */
+    std::uint64_t s[4];
+    
+    static std::uint64_t rotl(std::uint64_t x, int k) {
+        return (x << k) | (x >> (64 - k));
+    }
+    
+ public:
+    typedef std::uint64_t result_type;
+    
+    Xoshiro256(std::uint64_t seed=0, std::uint64_t stream=0) {
+        std::uint64_t state = seed;
+        std::uint64_t key = splitmix64(state) ^ stream;
+        for (int i=0; i < 4; i++) { s[i] = splitmix64(key); }
+    }
+    
+    static constexpr result_type min() { return 0; }
+    static constexpr result_type max() {
+        return std::numeric_limits<result_type>::max();
+    }
+    
+    result_type operator()() {
+        std::uint64_t result = rotl(s[1] * 5, 7) * 9;
+        std::uint64_t t = s[1] << 17;
+        s[2] ^= s[0];
+        s[3] ^= s[1];
+        s[1] ^= s[2];
+        s[0] ^= s[3];
+        s[2] ^= t;
+        s[3] = rotl(s[3], 45);
+        return result;
+    }
+    
+    double uniform() {
+        /**
+            draw a double in [0, 1), from the top 53 bits of the next number
+        */
+        return ((*this)() >> 11) * (1.0 / 9007199254740992.0);
+    }
+    
+    void discard(unsigned long long n) {
+        for (unsigned long long i=0; i < n; i++) { (*this)(); }
+    }
+};
+
+#endif // SEVERITY_RNG_H_
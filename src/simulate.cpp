@@ -19,88 +19,505 @@
 
 #include <vector>
 #include <algorithm>
-#include <map>
 #include <stdexcept>
+#include <cmath>
+#include <thread>
+#include <atomic>
+#include <exception>
+#include <mutex>
 
 #include "simulate.h"
 
-std::map<int, std::map<std::string, double>> prepare_severity(Chooser &choices,
-    std::vector<double> &severity) {
+Histogram::Histogram(double lower, double upper, int bins) {
     /**
-        prepare severity scores, to map from site and alt to a given score
+        fixed size histogram for simulated severity totals
+        
+        @lower lowest value in the first bin
+        @upper highest value in the last bin
+        @bins number of bins
     */
+    if (bins < 1) { throw std::invalid_argument("need at least one bin!"); }
     
-    std::map<int, std::map<std::string, double>> sites;
+    this->lower = lower;
+    this->upper = upper;
+    counts.resize(bins, 0);
+}
+
+void Histogram::add(double value) {
+    /**
+        count a value in its bin, values outside the range go in the end bins
+    */
+    int bins = counts.size();
+    int bin = 0;
+    if (upper > lower) {
+        bin = static_cast<int>((value - lower) / (upper - lower) * bins);
+    }
+    bin = std::max(0, std::min(bin, bins - 1));
+    counts[bin] += 1;
+}
+
+void Histogram::merge(Histogram &other) {
+    /**
+        add the counts from another histogram with the same bins
+    */
+    for (unsigned i=0; i < counts.size(); i++) { counts[i] += other.counts[i]; }
+}
+
+template <class Sampler>
+long long _tail_count(Sampler &choices, std::vector<double> &severity,
+        double observed, int count, int iterations, Xoshiro256 &generator,
+        Histogram *histogram) {
+    /**
+        count how many simulated severity totals exceed the observed total
+        
+        @choices Chooser or AliasChooser object, which is only read from here
+        @severity severity scores, index-aligned with the choices object
+        @observed observed summed severity
+        @count number of de novos to sample per iteration
+        @iterations number of iterations to run
+        @generator random number generator for this thread
+        @histogram optional Histogram to count simulated totals in, this can be
+            a null pointer, if we only need the count above the observed total.
+        @return number of simulated totals greater than the observed total
+    */
+    long long hits = 0;
+    for (int n=0; n < iterations; n++) {
+        double total = 0.0;
+        for (int i=0; i < count; i++) {
+            total += severity[choices.choice_index(generator)];
+        }
+        
+        if (total > observed) { hits += 1; }
+        if (histogram != nullptr) { histogram->add(total); }
+    }
     
-    for (int i=0; i < choices.len(); i++) {
-        auto x = choices.iter(i);
-        sites[x.pos][x.alt] = severity[i];
+    return hits;
+}
+
+template <class Sampler>
+long long parallel_tail_count(Sampler &choices, std::vector<double> &severity,
+        double observed, int count, long long start, long long end,
+        int threads, unsigned long long seed,
+        std::vector<Histogram> &histograms) {
+    /**
+        split the simulations across threads, and merge the per-thread counts
+        
+        @start index of the first simulation to run
+        @end index after the last simulation to run
+        @threads number of threads to split the simulations across
+        @seed seed for the random number streams
+        @histograms Histograms for each thread, or an empty vector if we don't
+            need histograms.
+        @return number of simulated totals greater than the observed total
+    */
+    std::vector<Histogram *> hist(threads, nullptr);
+    if (!histograms.empty()) {
+        for (int i=0; i < threads; i++) { hist[i] = &histograms[i]; }
     }
     
-    return sites;
+    std::vector<long long> hits(threads, 0);
+    run_blocks(start, end, count, threads, seed,
+        [&](int thread, long long block, Xoshiro256 &generator, int iterations) {
+            hits[thread] += _tail_count(choices, severity, observed, count,
+                iterations, generator, hist[thread]);
+        });
+    
+    long long total = 0;
+    for (auto x : hits) { total += x; }
+    return total;
 }
 
-double _analyse(Chooser &choices, std::vector<double> severity, double observed,
-    int count, int iterations) {
+long long simulate_round(Chooser &choices, AliasChooser &table,
+        std::vector<double> &severity, double observed, int count,
+        long long start, long long end, int threads, unsigned long long seed,
+        std::vector<Histogram> &histograms, bool alias) {
     /**
-        simulates the probability of observing n de novos with a combined
-        severity score greater than or equal to the obsevered severity total.
+        run a round of simulations, with either the alias table or the Chooser
+    */
+    if (alias) {
+        return parallel_tail_count(table, severity, observed, count, start, end,
+            threads, seed, histograms);
+    }
+    return parallel_tail_count(choices, severity, observed, count, start, end,
+        threads, seed, histograms);
+}
+
+template <class Sampler>
+void _tail_counts(Sampler &choices, std::vector<double> &severity,
+        int n_scores, std::vector<std::vector<double>> &thresholds,
+        std::vector<char> &active, int count, int iterations,
+        Xoshiro256 &generator, std::vector<std::vector<long long>> &ranks) {
+    /**
+        count simulated totals against thresholds, for several severity scores
+        
+        Each iteration samples one set of sites, then sums each of the severity
+        scores across those sites, so the sampling cost is shared across all
+        the scores.
+        
+        @choices Chooser or AliasChooser object, which is only read from here
+        @severity severity scores in site-major order, so the n_scores values
+            for a site are next to each other.
+        @n_scores number of severity scores per site
+        @thresholds observed totals to compare against for each score, sorted
+            in ascending order.
+        @active whether each score still needs counts
+        @count number of de novos to sample per iteration
+        @iterations number of iterations to run
+        @generator random number generator for this thread
+        @ranks counts of how many thresholds each simulated total exceeds, for
+            each score. ranks[k][j] counts the totals for score k which exceed
+            exactly j thresholds. These are added to, rather than replaced.
+    */
+    std::vector<double> totals(n_scores);
+    for (int n=0; n < iterations; n++) {
+        std::fill(totals.begin(), totals.end(), 0.0);
+        for (int i=0; i < count; i++) {
+            std::size_t idx = choices.choice_index(generator);
+            const double *scores = &severity[idx * n_scores];
+            for (int k=0; k < n_scores; k++) { totals[k] += scores[k]; }
+        }
+        
+        for (int k=0; k < n_scores; k++) {
+            if (!active[k]) { continue; }
+            std::vector<double> &x = thresholds[k];
+            // the number of thresholds strictly below the simulated total
+            auto rank = std::lower_bound(x.begin(), x.end(), totals[k]) - x.begin();
+            ranks[k][rank] += 1;
+        }
+    }
+}
+
+template <class Sampler>
+void parallel_tail_counts(Sampler &choices, std::vector<double> &severity,
+        int n_scores, std::vector<std::vector<double>> &thresholds,
+        std::vector<char> &active, int count, long long start, long long end,
+        int threads, unsigned long long seed,
+        std::vector<std::vector<long long>> &ranks) {
+    /**
+        split the simulations across threads, and merge the per-thread ranks
+    */
+    std::vector<std::vector<std::vector<long long>>> per_thread(threads, ranks);
+    for (auto &thread_ranks : per_thread) {
+        for (auto &x : thread_ranks) { std::fill(x.begin(), x.end(), 0); }
+    }
+    
+    run_blocks(start, end, count, threads, seed,
+        [&](int thread, long long block, Xoshiro256 &generator, int iterations) {
+            _tail_counts(choices, severity, n_scores, thresholds, active, count,
+                iterations, generator, per_thread[thread]);
+        });
     
+    for (auto &thread_ranks : per_thread) {
+        for (unsigned k=0; k < ranks.size(); k++) {
+            for (unsigned j=0; j < ranks[k].size(); j++) {
+                ranks[k][j] += thread_ranks[k][j];
+            }
+        }
+    }
+}
+
+void check_inputs(Chooser &choices, std::vector<double> &severity, int count,
+        int threads) {
+    /**
+        check the inputs to the simulations, and raise an error if invalid
     */
     int len = choices.len();
     int sev_len = severity.size();
     if (len != sev_len) { throw std::invalid_argument("severity scores do not match rates!"); }
     if (len == 0) { throw std::invalid_argument("no per-base/allele rates supplied!"); }
     if (count == 0) { throw std::invalid_argument("sampling zero de novos!"); }
+    if (threads < 1) { throw std::invalid_argument("need at least one thread!"); }
+}
+
+SimulationResult _analyse(Chooser &choices, std::vector<double> severity,
+        double observed, int count, int min_iterations, int max_iterations,
+        double z, double precision, double alpha, int threads, bool alias,
+        unsigned long long seed) {
+    /**
+        simulates the probability of observing n de novos with a combined
+        severity score greater than the obsevered severity total.
+        
+        We run a small batch of simulations first, then check whether to stop.
+        If not, we double the number of simulations, and check again, until we
+        reach the maximum iterations. This means clearly null genes stop after
+        a few thousand iterations, while genes with low p-values run for
+        longer, in order to estimate the p-value precisely.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @observed observed summed severity
+        @count number of de novos to sum severity across
+        @min_iterations number of simulations before the first check
+        @max_iterations maximum number of simulations to run
+        @z standard normal deviate for the p-value confidence interval
+        @precision halt once the confidence interval width relative to the
+            p-value is below this
+        @alpha halt once the lower confidence interval bound exceeds this, as
+            the gene cannot reach this significance threshold. Values of zero
+            or below disable this check.
+        @threads number of threads to split the simulations across
+        @alias whether to sample with an alias table, or the Chooser
+        @seed seed for the random number generators
+        @return SimulationResult with the simulated p-value, and the number of
+            iterations run.
+    */
+    check_inputs(choices, severity, count, threads);
+    if (min_iterations < 1) { throw std::invalid_argument("need at least one iteration!"); }
+    if (max_iterations < min_iterations) {
+        throw std::invalid_argument("max_iterations is less than min_iterations!");
+    }
+    
+    // We sample indices from the choices object, and look up the severity at
+    // the same index. This requires at a given index position the data within
+    // the choices object and the severity vector are for the same site/alt.
     
-    // figure out how to map sites to severity scores. This requires at a given
-    // index position the data within the choices object and the severity vector
-    // are for the same site/alt allele.
-    auto scores = prepare_severity(choices, severity);
+    // the alias table is quicker to sample from, once it has been built
+    AliasChooser table;
+    if (alias) { table = AliasChooser(choices); }
     
-    double minimum_p = 1.0/(1.0 + static_cast<double>(iterations));
-    double p_value = minimum_p;
-    std::vector<double> dist;
+    // we only count the simulated totals above the observed total, so memory
+    // use doesn't grow with the number of iterations.
+    std::vector<Histogram> histograms;
     
-    while (iterations < 100000000) {
+    double p_value = 1.0;
+    long long hits = 0;
+    int simulated = 0;
+    int iterations = min_iterations;
+    
+    while (true) {
         
-        std::vector<double> current;
-        int increment = iterations - dist.size();
-        for (int n=0; n < increment; n++) {
-            double total = 0.0;
-            for (int i=0; i < count; i++) {
-                auto x = choices.choice();
-                total += scores[x.pos][x.alt];
-            }
+        // each block of simulations has its own random number stream, so
+        // later rounds continue from where earlier rounds stopped
+        hits += simulate_round(choices, table, severity, observed, count,
+            simulated, iterations, threads, seed, histograms, alias);
+        simulated = iterations;
+        
+        // estimate the probability from the number of simulated totals which
+        // exceed the observed total
+        p_value = (1.0 + hits)/(1.0 + simulated);
+        
+        if (simulated >= max_iterations) { break; }
+        if (_halt_permutation(p_value, simulated, z, precision)) { break; }
+        if (alpha > 0 && _futile_permutation(p_value, simulated, z, alpha)) { break; }
+        
+        // grow the iterations geometrically, for if we need to run more
+        iterations = static_cast<int>(std::min(2LL * simulated,
+            static_cast<long long>(max_iterations)));
+    }
+    
+    return SimulationResult {p_value, simulated};
+}
+
+std::vector<std::vector<SimulationResult>> _analyse_multi(Chooser &choices,
+        std::vector<std::vector<double>> severity,
+        std::vector<std::vector<double>> observed, int count,
+        int min_iterations, int max_iterations, double z, double precision,
+        double alpha, int threads, bool alias, unsigned long long seed) {
+    /**
+        simulate p-values for several severity scores from shared samples
+        
+        This runs the same simulations as _analyse(), but sums several severity
+        scores (e.g. from different weighting schemes) across each set of
+        sampled sites, and compares each score's totals against any number of
+        observed totals. Each observed total stops being checked once its
+        p-value halts, and the simulations run until every p-value has halted.
+        
+        With a single score and observed total, this gives the same p-value as
+        _analyse() for the same seed.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity vector of severity score vectors, each index-aligned with the
+            choices object
+        @observed vector of observed totals for each severity score
+        @count number of de novos to sum severity across
+        @return vector of SimulationResults for each severity score, in the same
+            order as the observed totals.
+    */
+    if (severity.empty()) { throw std::invalid_argument("no severity scores supplied!"); }
+    if (severity.size() != observed.size()) {
+        throw std::invalid_argument("severity scores do not match observed totals!");
+    }
+    for (auto &scores : severity) { check_inputs(choices, scores, count, threads); }
+    if (min_iterations < 1) { throw std::invalid_argument("need at least one iteration!"); }
+    if (max_iterations < min_iterations) {
+        throw std::invalid_argument("max_iterations is less than min_iterations!");
+    }
+    
+    int n_scores = severity.size();
+    int n_sites = choices.len();
+    
+    // store the scores in site-major order, so each sampled site only needs
+    // one memory access for all the scores
+    std::vector<double> flat(static_cast<std::size_t>(n_sites) * n_scores);
+    for (int k=0; k < n_scores; k++) {
+        for (int i=0; i < n_sites; i++) {
+            flat[static_cast<std::size_t>(i) * n_scores + k] = severity[k][i];
+        }
+    }
+    
+    // sort the observed totals, but keep track of their original order
+    std::vector<std::vector<double>> thresholds(n_scores);
+    std::vector<std::vector<int>> order(n_scores);
+    std::vector<std::vector<long long>> ranks(n_scores);
+    std::vector<std::vector<SimulationResult>> results(n_scores);
+    std::vector<std::vector<char>> halted(n_scores);
+    for (int k=0; k < n_scores; k++) {
+        int size = observed[k].size();
+        for (int j=0; j < size; j++) { order[k].push_back(j); }
+        std::sort(order[k].begin(), order[k].end(),
+            [&](int a, int b) { return observed[k][a] < observed[k][b]; });
+        for (auto j : order[k]) { thresholds[k].push_back(observed[k][j]); }
+        ranks[k].resize(size + 1, 0);
+        results[k].resize(size, SimulationResult {1.0, 0});
+        halted[k].resize(size, false);
+    }
+    
+    AliasChooser table;
+    if (alias) { table = AliasChooser(choices); }
+    
+    std::vector<char> active(n_scores, true);
+    int simulated = 0;
+    int iterations = min_iterations;
+    
+    while (true) {
+        if (alias) {
+            parallel_tail_counts(table, flat, n_scores, thresholds, active,
+                count, simulated, iterations, threads, seed, ranks);
+        } else {
+            parallel_tail_counts(choices, flat, n_scores, thresholds, active,
+                count, simulated, iterations, threads, seed, ranks);
+        }
+        simulated = iterations;
+        
+        bool running = false;
+        for (int k=0; k < n_scores; k++) {
+            if (!active[k]) { continue; }
             
-            current.push_back(total);
+            // totals which exceed more than j thresholds exceed threshold j
+            long long hits = 0;
+            active[k] = false;
+            for (int j=thresholds[k].size() - 1; j >= 0; j--) {
+                hits += ranks[k][j + 1];
+                if (halted[k][j]) { continue; }
+                
+                double p_value = (1.0 + hits)/(1.0 + simulated);
+                results[k][order[k][j]] = SimulationResult {p_value, simulated};
+                
+                halted[k][j] = simulated >= max_iterations
+                    || _halt_permutation(p_value, simulated, z, precision)
+                    || (alpha > 0 && _futile_permutation(p_value, simulated, z, alpha));
+                if (!halted[k][j]) { active[k] = true; }
+            }
+            running = running || active[k];
         }
         
-        // merge the two sorted lists into a sorted vector
-        std::vector<double> v(iterations);
-        std::merge(dist.begin(), dist.end(), current.begin(), current.end(),
-            v.begin());
-        dist = v;
+        if (!running) { break; }
         
-        // make sure the scores are sorted, so we can quickly find the position
-        std::sort(dist.begin(), dist.end());
+        iterations = static_cast<int>(std::min(2LL * simulated,
+            static_cast<long long>(max_iterations)));
+    }
+    
+    return results;
+}
+
+std::vector<SimulationResult> _analyse_genes(std::vector<GeneJob> &jobs,
+        int min_iterations, int max_iterations, double z, double precision,
+        double alpha, int threads, bool alias) {
+    /**
+        simulate p-values for many genes, spread across a pool of threads
         
-        // figure out where in the list a random probability would fall
-        std::vector<double>::iterator pos;
-        pos = std::upper_bound(dist.begin(), dist.end(), observed);
-        double position = pos - dist.begin();
+        Each gene runs on a single thread, with its own seed. Threads take the
+        next gene from a shared counter once they finish their current gene,
+        so threads stay busy until all genes are done. The genes are started
+        in order of descending cost (de novo count times the number of sites),
+        so a large gene doesn't start last, and run on its own at the end.
         
-        // estimate the probability from the position
-        p_value = (1.0 + (dist.size() - position))/(1.0 + dist.size());
+        @jobs vector of GeneJobs, with the sites, severity scores, observed
+            total, de novo count and seed for each gene
+        @threads number of threads to analyse genes with
+        @return vector of SimulationResults, in the same order as the jobs
+    */
+    if (threads < 1) { throw std::invalid_argument("need at least one thread!"); }
+    
+    int size = jobs.size();
+    std::vector<int> order(size);
+    for (int i=0; i < size; i++) { order[i] = i; }
+    std::stable_sort(order.begin(), order.end(), [&](int a, int b) {
+        return static_cast<double>(jobs[a].count) * jobs[a].severity.size() >
+            static_cast<double>(jobs[b].count) * jobs[b].severity.size(); });
+    
+    std::vector<SimulationResult> results(size);
+    std::atomic<int> next(0);
+    std::exception_ptr error = nullptr;
+    std::mutex error_lock;
+    
+    auto worker = [&]() {
+        while (true) {
+            int i = next++;
+            if (i >= size) { break; }
+            GeneJob &job = jobs[order[i]];
+            try {
+                results[order[i]] = _analyse(*job.choices, job.severity,
+                    job.observed, job.count, min_iterations, max_iterations, z,
+                    precision, alpha, 1, alias, job.seed);
+            } catch (...) {
+                // keep the first error, and stop the other threads taking
+                // more genes
+                std::lock_guard<std::mutex> lock(error_lock);
+                if (!error) { error = std::current_exception(); }
+                next = size;
+            }
+        }
+    };
+    
+    threads = std::max(1, std::min(threads, size));
+    std::vector<std::thread> workers;
+    for (int i=1; i < threads; i++) { workers.push_back(std::thread(worker)); }
+    worker();
+    for (auto &x : workers) { x.join(); }
+    
+    if (error) { std::rethrow_exception(error); }
+    
+    return results;
+}
+
+Histogram _null_histogram(Chooser &choices, std::vector<double> severity,
+        int count, int iterations, int bins, int threads, bool alias,
+        unsigned long long seed) {
+    /**
+        simulate the null distribution of summed severity, for diagnostics
         
-        double z = 2.575829;
-        double precision = 0.05;
-        if (_halt_permutation(p_value, iterations, z, precision)) { break; }
+        The simulated totals are counted into fixed bins spanning the lowest
+        and highest possible totals, so memory use doesn't depend on the
+        number of iterations.
         
-        iterations += 10000000;  // for if we need to run more iterations
-    }
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @count number of de novos to sum severity across
+        @iterations number of simulations to run
+        @bins number of histogram bins
+        @threads number of threads to split the simulations across
+        @alias whether to sample with an alias table, or the Chooser
+        @seed seed for the random number generators
+        @return Histogram of simulated severity totals
+    */
+    check_inputs(choices, severity, count, threads);
+    
+    double lower = *std::min_element(severity.begin(), severity.end()) * count;
+    double upper = *std::max_element(severity.begin(), severity.end()) * count;
+    std::vector<Histogram> histograms(threads, Histogram(lower, upper, bins));
     
-    return p_value;
+    AliasChooser table;
+    if (alias) { table = AliasChooser(choices); }
+    
+    // we only need the histogram, not the count above an observed total
+    double observed = upper;
+    simulate_round(choices, table, severity, observed, count, 0, iterations,
+        threads, seed, histograms, alias);
+    
+    for (int i=1; i < threads; i++) { histograms[0].merge(histograms[i]); }
+    
+    return histograms[0];
 }
 
 bool _halt_permutation(double p_val, int iterations, double z, double precision) {
@@ -127,3 +544,22 @@ bool _halt_permutation(double p_val, int iterations, double z, double precision)
     // confident that the p-value won't change much and can halt.
     return diff < precision;
 }
+
+bool _futile_permutation(double p_val, int iterations, double z, double alpha) {
+    /**
+        halt permutations if the P value cannot reach a significance threshold
+        
+        If the lower bound of the confidence interval around the p-value is
+        above the significance threshold, running more permutations won't make
+        the gene significant, so we can stop early.
+        
+        @p_val current simulated P value
+        @iterations iterations run in order to obtain the simulated P value
+        @z standard normal deviate (eg 1.96 for 95% CI)
+        @alpha significance threshold
+        @return whether to halt the permuations
+    */
+    double delta = z * sqrt((p_val * (1 - p_val))/iterations);
+    
+    return p_val - delta > alpha;
+}
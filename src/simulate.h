@@ -21,15 +21,102 @@
 #define SEVERITY_SIMULATE_H_
 
 #include <vector>
-#include <map>
+#include <algorithm>
+#include <thread>
 
+#include "rng.h"
 #include "weighted_choice.h"
 
-std::map<int, std::map<std::string, double>> prepare_severity(Chooser &choices,
-    std::vector<double> &severity);
-double _analyse(Chooser &choices, std::vector<double> severity, double observed,
-    int count, int iterations);
-bool _halt_permutation(double p_val, int iterations, double z=10.0,
+// number of simulations drawn from each random number stream
+const long long BLOCK_SIZE = 4096;
+
+class Histogram {
+ public:
+    double lower;
+    double upper;
+    std::vector<long long> counts;
+    
+    Histogram() {};
+    Histogram(double lower, double upper, int bins);
+    void add(double value);
+    void merge(Histogram &other);
+};
+
+struct SimulationResult {
+    double p_value;
+    int iterations;
+};
+
+struct GeneJob {
+    Chooser *choices;
+    std::vector<double> severity;
+    double observed;
+    int count;
+    unsigned long long seed;
+};
+
+template <class Work>
+void run_blocks(long long start, long long end, int count, int threads,
+        unsigned long long seed, Work work) {
+    /**
+        run simulations from start up to end in fixed blocks, across threads
+        
+        Simulation i always draws from stream i / BLOCK_SIZE for the seed, and
+        from the same place in that stream, whatever the number of threads, or
+        however the simulations are split into rounds. Seeded results are
+        therefore the same for any number of threads. Each simulation must use
+        exactly count random numbers, so we can skip to the right place when a
+        round starts partway through a block.
+        
+        @start index of the first simulation to run
+        @end index after the last simulation to run
+        @count number of random numbers used per simulation
+        @threads number of threads to split the blocks across
+        @seed seed for the random number streams
+        @work function taking the thread number, block number, generator and
+            number of simulations to run with the generator
+    */
+    long long first = start / BLOCK_SIZE;
+    long long last = (end + BLOCK_SIZE - 1) / BLOCK_SIZE;
+    
+    auto run = [&](int thread) {
+        for (long long block=first + thread; block < last; block += threads) {
+            long long lower = std::max(start, block * BLOCK_SIZE);
+            long long upper = std::min(end, (block + 1) * BLOCK_SIZE);
+            Xoshiro256 generator(seed, block);
+            generator.discard((lower - block * BLOCK_SIZE) * count);
+            work(thread, block, generator, static_cast<int>(upper - lower));
+        }
+    };
+    
+    std::vector<std::thread> workers;
+    for (int i=1; i < threads; i++) { workers.push_back(std::thread(run, i)); }
+    run(0);
+    for (auto &worker : workers) { worker.join(); }
+}
+
+void check_inputs(Chooser &choices, std::vector<double> &severity, int count,
+    int threads);
+SimulationResult _analyse(Chooser &choices, std::vector<double> severity,
+    double observed, int count, int min_iterations=1000,
+    int max_iterations=100000000, double z=2.575829, double precision=0.05,
+    double alpha=0.0, int threads=1, bool alias=true,
+    unsigned long long seed=0);
+std::vector<std::vector<SimulationResult>> _analyse_multi(Chooser &choices,
+    std::vector<std::vector<double>> severity,
+    std::vector<std::vector<double>> observed, int count,
+    int min_iterations=1000, int max_iterations=100000000, double z=2.575829,
+    double precision=0.05, double alpha=0.0, int threads=1, bool alias=true,
+    unsigned long long seed=0);
+std::vector<SimulationResult> _analyse_genes(std::vector<GeneJob> &jobs,
+    int min_iterations=1000, int max_iterations=100000000, double z=2.575829,
+    double precision=0.05, double alpha=0.0, int threads=1, bool alias=true);
+Histogram _null_histogram(Chooser &choices, std::vector<double> severity,
+    int count, int iterations, int bins=100, int threads=1, bool alias=true,
+    unsigned long long seed=0);
+bool _halt_permutation(double p_val, int iterations, double z=2.575829,
+    double precision=0.05);
+bool _futile_permutation(double p_val, int iterations, double z=2.575829,
     double alpha=0.01);
 
 #endif // SEVERITY_SIMULATE_H_
@@ -0,0 +1,352 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#include <vector>
+#include <map>
+#include <algorithm>
+#include <stdexcept>
+#include <cmath>
+#include <limits>
+#include <thread>
+#include <atomic>
+
+#include "stratified.h"
+#include "simulate.h"
+
+std::vector<Stratum> get_strata(Chooser &choices, std::vector<double> &severity,
+        std::vector<int> &labels, bool alias) {
+    /**
+        group sites into strata, such as by consequence class
+        
+        Strata where every site has the same severity don't need sampling, so
+        only their summed rate is kept. Those with the same constant severity
+        are merged, since de novos in either contribute the same score.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @labels stratum label for each site, index-aligned with the choices
+        @alias whether to build alias tables for sampling within strata
+        @return vector of Stratum objects, for strata with nonzero rates
+    */
+    std::map<int, int> index;
+    std::vector<Stratum> grouped;
+    for (unsigned i=0; i < labels.size(); i++) {
+        if (index.count(labels[i]) == 0) {
+            index[labels[i]] = grouped.size();
+            grouped.push_back(Stratum());
+        }
+        Stratum &stratum = grouped[index[labels[i]]];
+        stratum.rates.push_back(choices.rate(i));
+        stratum.severity.push_back(severity[i]);
+    }
+    
+    std::vector<Stratum> strata;
+    for (auto &stratum : grouped) {
+        stratum.rate = 0.0;
+        for (auto x : stratum.rates) {
+            stratum.rate += x;
+            stratum.cumulative.push_back(stratum.rate);
+        }
+        if (stratum.rate <= 0) { continue; }
+        
+        stratum.lower = std::numeric_limits<double>::infinity();
+        stratum.upper = -std::numeric_limits<double>::infinity();
+        bool missing = false;
+        for (auto x : stratum.severity) {
+            missing = missing || std::isnan(x);
+            stratum.lower = std::min(stratum.lower, x);
+            stratum.upper = std::max(stratum.upper, x);
+        }
+        
+        // sites without scores never give a higher total, so their strata
+        // can't be bounded, and always need sampling
+        if (missing) {
+            stratum.lower = -std::numeric_limits<double>::infinity();
+            stratum.upper = std::numeric_limits<double>::infinity();
+        }
+        stratum.constant = stratum.lower == stratum.upper;
+        
+        if (stratum.constant) {
+            auto same = std::find_if(strata.begin(), strata.end(),
+                [&](Stratum &x) { return x.constant && x.lower == stratum.lower; });
+            if (same != strata.end()) {
+                same->rate += stratum.rate;
+                continue;
+            }
+            stratum.rates.clear();
+            stratum.cumulative.clear();
+            stratum.severity.clear();
+        } else if (alias) {
+            stratum.table = AliasChooser(stratum.rates);
+        }
+        strata.push_back(stratum);
+    }
+    
+    return strata;
+}
+
+void enumerate_splits(std::vector<Stratum> &strata, unsigned stratum,
+        int remaining, std::vector<int> &counts, double log_weight,
+        double observed, double min_weight, std::vector<Split> &splits) {
+    /**
+        recursively find each way to split de novos across the strata
+    */
+    double total = 0.0;
+    for (auto &x : strata) { total += x.rate; }
+    double log_prob = std::log(strata[stratum].rate / total);
+    
+    int lowest = (stratum == strata.size() - 1) ? remaining : 0;
+    for (int n=lowest; n <= remaining; n++) {
+        counts[stratum] = n;
+        double weight = log_weight + n * log_prob - std::lgamma(n + 1.0);
+        if (stratum < strata.size() - 1) {
+            enumerate_splits(strata, stratum + 1, remaining - n, counts, weight,
+                observed, min_weight, splits);
+            continue;
+        }
+        
+        Split split {counts, std::exp(weight), 0.0, 0, false, 0.0, 0, 0};
+        if (split.weight < min_weight) { continue; }
+        
+        // find the range of totals possible for the split, using the lowest
+        // and highest severity in each stratum
+        double lower = 0.0;
+        double upper = 0.0;
+        for (unsigned k=0; k < strata.size(); k++) {
+            if (counts[k] == 0) { continue; }
+            if (strata[k].constant) {
+                split.fixed += counts[k] * strata[k].lower;
+            } else {
+                split.draws += counts[k];
+                lower += counts[k] * strata[k].lower;
+                upper += counts[k] * strata[k].upper;
+            }
+        }
+        lower += split.fixed;
+        upper += split.fixed;
+        
+        if (split.draws == 0 || lower > observed || upper <= observed) {
+            split.exact = true;
+            split.probability = (lower > observed) ? 1.0 : 0.0;
+        }
+        splits.push_back(split);
+    }
+}
+
+std::vector<Split> get_splits(std::vector<Stratum> &strata, int count,
+        double observed, double min_weight) {
+    /**
+        find the ways to split de novos across strata, with their probabilities
+        
+        The numbers of de novos in each stratum follow a multinomial
+        distribution, with probabilities from the summed rates of the strata.
+        The probability of a total above the observed total is known without
+        sampling for splits which only have de novos in constant strata, or
+        where every total for the split is either above or below the observed.
+        
+        @strata vector of Stratum objects
+        @count number of de novos
+        @observed observed summed severity
+        @min_weight splits less likely than this are dropped, as they can't
+            change the p-value meaningfully, and there can be many of them.
+        @return vector of Split objects
+    */
+    if (strata.empty()) { throw std::invalid_argument("no sites with nonzero rates!"); }
+    
+    std::vector<Split> splits;
+    std::vector<int> counts(strata.size(), 0);
+    enumerate_splits(strata, 0, count, counts, std::lgamma(count + 1.0),
+        observed, min_weight, splits);
+    
+    return splits;
+}
+
+long long simulate_split(std::vector<Stratum> &strata, Split &split,
+        double observed, long long start, long long end,
+        unsigned long long seed, bool alias) {
+    /**
+        simulate totals for a split, sampling within each non-constant stratum
+        
+        @start index of the first simulation to run for the split
+        @end index after the last simulation to run
+        @seed seed for the random number streams for the split
+        @return number of simulated totals greater than the observed total
+    */
+    long long hits = 0;
+    run_blocks(start, end, split.draws, 1, seed,
+        [&](int thread, long long block, Xoshiro256 &generator, int iterations) {
+            for (int n=0; n < iterations; n++) {
+                double total = split.fixed;
+                for (unsigned k=0; k < strata.size(); k++) {
+                    Stratum &stratum = strata[k];
+                    if (stratum.constant) { continue; }
+                    auto &cumulative = stratum.cumulative;
+                    for (int i=0; i < split.counts[k]; i++) {
+                        int idx;
+                        if (alias) {
+                            idx = stratum.table.choice_index(generator);
+                        } else {
+                            double number = generator.uniform() * stratum.rate;
+                            idx = std::lower_bound(cumulative.begin(),
+                                cumulative.end(), number) - cumulative.begin();
+                        }
+                        total += stratum.severity[idx];
+                    }
+                }
+                if (total > observed) { hits += 1; }
+            }
+        });
+    
+    return hits;
+}
+
+StratifiedResult _analyse_stratified(Chooser &choices,
+        std::vector<double> severity, std::vector<int> labels, double observed,
+        int count, int min_iterations, int max_iterations, double z,
+        double precision, double alpha, int threads, bool alias,
+        unsigned long long seed) {
+    /**
+        simulate the p-value for a gene, stratified by site class
+        
+        Rather than sampling each de novo from every site, we work through the
+        ways the de novos can split across the strata (e.g. consequence
+        classes), weighted by their multinomial probabilities, and only sample
+        sites within strata for each split. Each split gets simulations in
+        proportion to its probability, so the p-value has no more variance than
+        simple simulation. Strata with a constant severity (e.g. truncating
+        sites under the weighted scores) need no sampling at all, and splits
+        whose totals can't cross the observed total need no simulations.
+        
+        The halting rules are the same as for _analyse(), but use the effective
+        number of simulations, which is how many simple simulations would give
+        the same variance.
+        
+        @choices Chooser object with the per site/allele mutation rates
+        @severity severity scores, index-aligned with the choices object
+        @labels stratum label for each site, index-aligned with the choices
+        @observed observed summed severity
+        @count number of de novos to sum severity across
+        @min_iterations number of simulations before the first check. Later
+            checks come after each doubling.
+        @max_iterations maximum number of simulations to allocate
+        @z standard normal deviate for the p-value confidence interval
+        @precision halt once the confidence interval width relative to the
+            p-value is below this
+        @alpha halt once the lower confidence interval bound exceeds this
+        @threads number of threads to spread the splits across
+        @alias whether to sample with alias tables, or the cumulative rates
+        @seed seed for the random number generators
+        @return StratifiedResult with the p-value, the simulations run, the
+            number of sites sampled, and the effective number of simulations.
+    */
+    check_inputs(choices, severity, count, threads);
+    if (labels.size() != severity.size()) {
+        throw std::invalid_argument("strata do not match rates!");
+    }
+    if (min_iterations < 1) { throw std::invalid_argument("need at least one iteration!"); }
+    if (max_iterations < min_iterations) {
+        throw std::invalid_argument("max_iterations is less than min_iterations!");
+    }
+    
+    std::vector<Stratum> strata = get_strata(choices, severity, labels, alias);
+    std::vector<Split> splits = get_splits(strata, count, observed);
+    
+    // each split gets its own seed, so results don't depend on which thread
+    // runs each split
+    std::vector<int> uncertain;
+    std::vector<unsigned long long> seeds;
+    Xoshiro256 keys(seed);
+    for (unsigned i=0; i < splits.size(); i++) {
+        if (splits[i].exact) { continue; }
+        uncertain.push_back(i);
+        seeds.push_back(keys());
+    }
+    int size = uncertain.size();
+    
+    StratifiedResult result {1.0, 0, 0, 0.0};
+    long long iterations = min_iterations;
+    while (true) {
+        // top up each split to its share of the simulations
+        std::atomic<int> next(0);
+        auto worker = [&]() {
+            while (true) {
+                int i = next++;
+                if (i >= size) { break; }
+                Split &split = splits[uncertain[i]];
+                long long target = static_cast<long long>(
+                    std::ceil(iterations * split.weight));
+                if (target <= split.simulated) { continue; }
+                split.hits += simulate_split(strata, split, observed,
+                    split.simulated, target, seeds[i], alias);
+                split.simulated = target;
+            }
+        };
+        std::vector<std::thread> workers;
+        for (int i=1; i < std::min(threads, size); i++) {
+            workers.push_back(std::thread(worker));
+        }
+        worker();
+        for (auto &x : workers) { x.join(); }
+        
+        double p_value = 0.0;
+        double variance = 0.0;
+        result.iterations = 0;
+        result.draws = 0;
+        for (auto &split : splits) {
+            if (split.exact) {
+                p_value += split.weight * split.probability;
+                continue;
+            }
+            double estimate = static_cast<double>(split.hits) / split.simulated;
+            p_value += split.weight * estimate;
+            
+            // shrink the estimate away from zero and one for the variance, so
+            // splits with no hits (or no misses) don't look perfectly precise
+            double shrunk = (split.hits + 0.5) / (split.simulated + 1.0);
+            variance += split.weight * split.weight * shrunk * (1 - shrunk)
+                / split.simulated;
+            result.iterations += split.simulated;
+            result.draws += split.simulated * split.draws;
+        }
+        
+        if (size == 0) {
+            // the p-value is exact, since no splits needed simulating
+            result.p_value = p_value;
+            result.effective = std::numeric_limits<double>::infinity();
+            break;
+        }
+        
+        // add one to the hits and simulations, as for simple simulations, so
+        // the p-value can't be zero
+        p_value = (1.0 + iterations * p_value) / (1.0 + iterations);
+        result.p_value = p_value;
+        result.effective = p_value * (1 - p_value) / variance;
+        int effective = static_cast<int>(std::min(result.effective,
+            static_cast<double>(std::numeric_limits<int>::max())));
+        
+        if (iterations >= max_iterations) { break; }
+        if (_halt_permutation(p_value, effective, z, precision)) { break; }
+        if (alpha > 0 && _futile_permutation(p_value, effective, z, alpha)) { break; }
+        
+        iterations = std::min(2 * iterations,
+            static_cast<long long>(max_iterations));
+    }
+    
+    return result;
+}
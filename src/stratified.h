@@ -0,0 +1,81 @@
+// Copyright (c) 2017 Genome Research Ltd.
+//
+// Permission is hereby granted, free of charge, to any person obtaining a copy of
+// this software and associated documentation files (the "Software"), to deal in
+// the Software without restriction, including without limitation the rights to
+// use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+// of the Software, and to permit persons to whom the Software is furnished to do
+// so, subject to the following conditions:
+//
+// The above copyright notice and this permission notice shall be included in all
+// copies or substantial portions of the Software.
+//
+// THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+// IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+// FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+// COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+// IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+// CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+#ifndef SEVERITY_STRATIFIED_H_
+#define SEVERITY_STRATIFIED_H_
+
+#include <vector>
+
+#include "weighted_choice.h"
+
+struct StratifiedResult {
+    double p_value;
+    
+    // number of simulations run, and the number of sites sampled across them
+    long long iterations;
+    long long draws;
+    
+    // number of simple simulations which would give the same precision
+    double effective;
+};
+
+struct Stratum {
+    // rates and severity scores for the sites in the stratum, with the
+    // cumulative rates and an alias table to sample sites from
+    std::vector<double> rates;
+    std::vector<double> cumulative;
+    AliasChooser table;
+    std::vector<double> severity;
+    
+    // summed rate, and the lowest and highest severity in the stratum
+    double rate;
+    double lower;
+    double upper;
+    bool constant;
+};
+
+struct Split {
+    // number of de novos in each stratum, and the multinomial probability
+    std::vector<int> counts;
+    double weight;
+    
+    // summed severity from strata with constant severity, and the number of
+    // sites sampled from the other strata, per simulation
+    double fixed;
+    int draws;
+    
+    // whether the conditional probability is known without simulating
+    bool exact;
+    double probability;
+    
+    long long simulated;
+    long long hits;
+};
+
+std::vector<Stratum> get_strata(Chooser &choices, std::vector<double> &severity,
+    std::vector<int> &labels, bool alias);
+std::vector<Split> get_splits(std::vector<Stratum> &strata, int count,
+    double observed, double min_weight=1e-16);
+StratifiedResult _analyse_stratified(Chooser &choices,
+    std::vector<double> severity, std::vector<int> labels, double observed,
+    int count, int min_iterations=1000, int max_iterations=100000000,
+    double z=2.575829, double precision=0.05, double alpha=0.0, int threads=1,
+    bool alias=true, unsigned long long seed=0);
+
+#endif // SEVERITY_STRATIFIED_H_
@@ -2,6 +2,7 @@
 #include <vector>
 #include <chrono>
 #include <algorithm>
+#include <stdexcept>
 
 #include "weighted_choice.h"
 
@@ -50,18 +51,81 @@ AlleleChoice Chooser::choice() {
         @returns AlleleChoice struct containing the pos, ref and alt
     */
     
-    if (cumulative.empty()) {
+    return choice(generator);
+}
+
+AlleleChoice Chooser::choice(std::mt19937_64 &generator) {
+    /**
+        chooses a random element, using an external random number generator
+        
+        This doesn't modify the Chooser, so multiple threads can sample from
+        the same object, provided each thread has its own generator.
+        
+        @generator random number generator to draw from
+        @returns AlleleChoice struct containing the pos, ref and alt
+    */
+    
+    int offset = choice_index(generator);
+    if (offset < 0) {
         return AlleleChoice {-1, "N", "N", 0.0, 0};
     }
     
+    return sites[offset];
+}
+
+int Chooser::choice_index() {
+    /**
+        chooses the index of a random element using the probability weights
+        
+        @returns index of the chosen element, or -1 if there are no elements
+    */
+    
+    return choice_index(generator);
+}
+
+int Chooser::choice_index(std::mt19937_64 &generator) {
+    /**
+        chooses the index of a random element, using an external generator
+        
+        This avoids copying the chosen AlleleChoice, so is quicker when the
+        caller has data index-aligned with the Chooser, such as severity scores.
+        
+        @generator random number generator to draw from
+        @returns index of the chosen element, or -1 if there are no elements
+    */
+    
+    if (cumulative.empty()) {
+        return -1;
+    }
+    
     // get a random float between 0 and the cumulative sum
-    double number = dist(generator);
+    std::uniform_real_distribution<double> uniform(dist.param());
+    double number = uniform(generator);
     
     // figure out where in the list a random probability would fall
     auto pos = std::lower_bound(cumulative.begin(), cumulative.end(), number);
-    int offset = pos - cumulative.begin();
+    return pos - cumulative.begin();
+}
+
+int Chooser::choice_index(Xoshiro256 &generator) const {
+    /**
+        chooses the index of a random element, using a xoshiro256** generator
+        
+        This uses exactly one random number per draw, so the draws for a
+        simulation can be skipped over, by discarding numbers from the
+        generator.
+        
+        @generator random number generator to draw from
+        @returns index of the chosen element, or -1 if there are no elements
+    */
     
-    return sites[offset];
+    if (cumulative.empty()) {
+        return -1;
+    }
+    
+    double number = generator.uniform() * cumulative.back();
+    auto pos = std::lower_bound(cumulative.begin(), cumulative.end(), number);
+    return pos - cumulative.begin();
 }
 
 double Chooser::get_summed_rate() {
@@ -72,10 +136,15 @@ double Chooser::get_summed_rate() {
     return (sites.empty()) ? 0.0 : cumulative.back() ;
 }
 
-void Chooser::append(Chooser other) {
+void Chooser::append(const Chooser &other) {
+    /**
+        add the choices from another Chooser, without copying the other object
+    */
     
     double current = get_summed_rate();
     int len = other.sites.size();
+    sites.reserve(sites.size() + len);
+    cumulative.reserve(cumulative.size() + len);
     for (int i=0; i < len; i++) {
         cumulative.push_back(other.cumulative[i] + current);
         sites.push_back(other.sites[i]);
@@ -83,3 +152,193 @@ void Chooser::append(Chooser other) {
     
     reset_sampler();
 }
+
+void chooser_from_arrays(Chooser &choices, const std::int32_t *positions,
+        const std::uint8_t *refs, const std::uint8_t *alts, const double *rates,
+        const std::int32_t *offsets, int len) {
+    /**
+        add many sites to a Chooser at once, from arrays of per-site data
+        
+        Chooser::add_choice() resets the sampling distribution for every site,
+        whereas this sums the rates in one pass, and resets the distribution
+        once at the end. This can't be a Chooser method, since the Chooser is
+        declared by denovonear, so it is a friend function instead.
+        
+        @choices Chooser to add sites to
+        @positions chromosomal positions for each site
+        @refs reference allele codes, in the order A, C, G, T, N
+        @alts alternate allele codes
+        @rates mutation rate for each site
+        @offsets distance of each site from the nearest coding position
+        @len number of sites in the arrays
+    */
+    static const std::string bases[] = {"A", "C", "G", "T", "N"};
+    
+    choices.sites.reserve(choices.sites.size() + len);
+    choices.cumulative.reserve(choices.cumulative.size() + len);
+    
+    double total = choices.get_summed_rate();
+    for (int i=0; i < len; i++) {
+        if (refs[i] > 4 || alts[i] > 4) {
+            throw std::invalid_argument("unknown allele code!");
+        }
+        total += rates[i];
+        choices.cumulative.push_back(total);
+        choices.sites.push_back(AlleleChoice {positions[i], bases[refs[i]],
+            bases[alts[i]], rates[i], offsets[i]});
+    }
+    
+    choices.reset_sampler();
+}
+
+std::uint8_t encode_allele(const std::string &allele) {
+    /**
+        encode an allele as an index into "ACGTN". Multi-base alleles and
+        unknown bases are encoded as N.
+    */
+    static const std::string bases = "ACGTN";
+    if (allele.size() != 1) { return 4; }
+    auto code = bases.find(allele[0]);
+    return (code == std::string::npos) ? 4 : code;
+}
+
+void chooser_to_arrays(const Chooser &choices, std::int32_t *positions,
+        std::uint8_t *refs, std::uint8_t *alts, double *rates,
+        std::int32_t *offsets) {
+    /**
+        copy the per-site data from a Chooser into arrays
+        
+        This is the reverse of chooser_from_arrays(), so the sites can be read
+        without making a python object for every site.
+        
+        @choices Chooser to read sites from
+        @positions array to fill with chromosomal positions
+        @refs array to fill with reference allele codes, as indices into ACGTN
+        @alts array to fill with alternate allele codes
+        @rates array to fill with the mutation rate for each site
+        @offsets array to fill with the distance from the nearest coding
+            position for each site
+    */
+    for (int i=0; i < choices.len(); i++) {
+        const AlleleChoice &site = choices.sites[i];
+        positions[i] = site.pos;
+        refs[i] = encode_allele(site.ref);
+        alts[i] = encode_allele(site.alt);
+        rates[i] = site.prob;
+        offsets[i] = site.offset;
+    }
+}
+
+void seed_chooser(Chooser &choices, std::uint64_t seed) {
+    /**
+        reseed the random number generator within a Chooser
+        
+        The Chooser seeds its own generator from std::random_device, so draws
+        from Chooser::choice() can't otherwise be reproduced.
+        
+        @choices Chooser to reseed
+        @seed seed for the generator
+    */
+    choices.generator.seed(seed);
+}
+
+AliasChooser::AliasChooser(Chooser &choices) {
+    /**
+        build a Walker/Vose alias table from the rates in a Chooser
+        
+        The alias table samples in constant time, whereas the Chooser does a
+        binary search through the cumulative rates for each draw. Build this
+        once all the choices have been added, since the table doesn't change
+        if more choices are added to the Chooser.
+        
+        @choices Chooser object, with per site/allele probabilities
+    */
+    
+    int len = choices.len();
+    std::vector<double> weights(len);
+    for (int i=0; i < len; i++) { weights[i] = choices.rate(i); }
+    
+    build(weights);
+}
+
+AliasChooser::AliasChooser(std::vector<double> &weights) {
+    /**
+        build a Walker/Vose alias table from a vector of weights
+        
+        @weights vector of weights, these don't need to sum to one.
+    */
+    
+    build(weights);
+}
+
+void AliasChooser::build(std::vector<double> scaled) {
+    /**
+        construct the alias table
+        
+        @scaled vector of weights, which gets scaled to a mean of one
+    */
+    
+    int len = scaled.size();
+    double total = 0.0;
+    for (auto x : scaled) { total += x; }
+    
+    // scale the probabilities so the mean is one, then split the buckets into
+    // those below and above the mean
+    std::vector<int> small;
+    std::vector<int> large;
+    for (int i=0; i < len; i++) {
+        scaled[i] *= len / total;
+        if (scaled[i] < 1.0) {
+            small.push_back(i);
+        } else {
+            large.push_back(i);
+        }
+    }
+    
+    threshold.resize(len, 1.0);
+    alias.resize(len);
+    for (int i=0; i < len; i++) { alias[i] = i; }
+    
+    // fill each small bucket with the excess from a large bucket
+    while (!small.empty() && !large.empty()) {
+        int lo = small.back();
+        small.pop_back();
+        int hi = large.back();
+        
+        threshold[lo] = scaled[lo];
+        alias[lo] = hi;
+        
+        scaled[hi] = (scaled[hi] + scaled[lo]) - 1.0;
+        if (scaled[hi] < 1.0) {
+            large.pop_back();
+            small.push_back(hi);
+        }
+    }
+    
+    // any remaining buckets are full, up to rounding error, so they keep the
+    // default threshold of one
+}
+
+int AliasChooser::choice_index(Xoshiro256 &generator) const {
+    /**
+        chooses the index of a random element using the probability weights
+        
+        This uses a single random number, the integer part picks the bucket,
+        and the fractional part decides whether to use the bucket or its alias.
+        It doesn't modify the object, so threads can share an AliasChooser,
+        provided each has its own generator.
+        
+        @generator random number generator to draw from
+        @returns index of the chosen element, or -1 if there are no elements
+    */
+    
+    int len = alias.size();
+    if (len == 0) {
+        return -1;
+    }
+    
+    double number = generator.uniform() * len;
+    int bucket = std::min(static_cast<int>(number), len - 1);
+    
+    return (number - bucket < threshold[bucket]) ? bucket : alias[bucket];
+}
@@ -1,10 +1,13 @@
 #ifndef DENOVONEAR_WEIGHTED_CHOICE_H_
 #define DENOVONEAR_WEIGHTED_CHOICE_H_
 
+#include <cstdint>
 #include <random>
 #include <vector>
 #include <string>
 
+#include "rng.h"
+
 struct AlleleChoice {
     int pos;
     std::string ref;
@@ -21,15 +24,53 @@ class Chooser {
     std::uniform_real_distribution<double> dist;
     std::mt19937_64 generator;
     void reset_sampler();
+    
+    // bulk construction from arrays, see weighted_choice.cpp
+    friend void chooser_from_arrays(Chooser &choices,
+        const std::int32_t *positions, const std::uint8_t *refs,
+        const std::uint8_t *alts, const double *rates,
+        const std::int32_t *offsets, int len);
+    friend void chooser_to_arrays(const Chooser &choices,
+        std::int32_t *positions, std::uint8_t *refs, std::uint8_t *alts,
+        double *rates, std::int32_t *offsets);
+    friend void seed_chooser(Chooser &choices, std::uint64_t seed);
 
  public:
     Chooser();
     void add_choice(int site, double prob, std::string ref="N", std::string alt="N", int offset=0);
     AlleleChoice choice();
+    AlleleChoice choice(std::mt19937_64 &generator);
+    int choice_index();
+    int choice_index(std::mt19937_64 &generator);
+    int choice_index(Xoshiro256 &generator) const;
     double get_summed_rate();
-    int len() { return sites.size() ;};
+    int len() const { return sites.size() ;};
     AlleleChoice iter(int pos) { return sites[pos]; };
-    void append(Chooser other);
+    const AlleleChoice &site(int pos) const { return sites[pos]; };
+    double rate(int pos) const { return sites[pos].prob; };
+    void append(const Chooser &other);
 };
 
+class AliasChooser {
+    // probability of keeping each bucket, and the alternative for each bucket
+    std::vector<double> threshold;
+    std::vector<int> alias;
+    void build(std::vector<double> scaled);
+
+ public:
+    AliasChooser() {};
+    AliasChooser(Chooser &choices);
+    AliasChooser(std::vector<double> &weights);
+    int choice_index(Xoshiro256 &generator) const;
+    int len() const { return alias.size(); };
+};
+
+void chooser_from_arrays(Chooser &choices, const std::int32_t *positions,
+    const std::uint8_t *refs, const std::uint8_t *alts, const double *rates,
+    const std::int32_t *offsets, int len);
+void chooser_to_arrays(const Chooser &choices, std::int32_t *positions,
+    std::uint8_t *refs, std::uint8_t *alts, double *rates,
+    std::int32_t *offsets);
+void seed_chooser(Chooser &choices, std::uint64_t seed);
+
 #endif  // DENOVONEAR_WEIGHTED_CHOICE_H_
@@ -0,0 +1,100 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from severity.cadd_store import merge_regions, convert_cadd, CaddStore
+from severity.open_severity import get_severity
+
+from tests.utils import CADD
+
+class TestCaddStore(unittest.TestCase):
+    ''' unit test the memory-mapped CADD score store
+    '''
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        
+        lines = []
+        for pos, ref in zip(range(100, 120), 'ACGTACGTACGTACGTACGT'):
+            for alt in 'ACGT':
+                if alt != ref:
+                    score = pos / 10.0 + 'ACGT'.index(alt)
+                    lines.append('1\t{}\t{}\t{}\t0.1\t{}'.format(pos, ref, alt,
+                        score))
+        
+        convert_cadd(CADD(lines), {'1': [(100, 104), (110, 112), (103, 105)]},
+            self.folder)
+        self.store = CaddStore(self.folder)
+    
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    
+    def test_merge_regions(self):
+        ''' check overlapping and adjacent regions are merged
+        '''
+        self.assertEqual(merge_regions([(10, 20), (5, 8), (9, 9), (30, 40),
+            (35, 36)]), [(5, 20), (30, 40)])
+    
+    def test_lookup(self):
+        ''' check we get scores for specific alleles
+        '''
+        scores = self.store.lookup('1', [100, 105, 112, 100], ['C', 'A', 'G', 'T'])
+        expected = [11.0, 10.5, 13.2, 13.0]
+        self.assertTrue(numpy.allclose(scores, expected))
+    
+    def test_lookup_missing(self):
+        ''' check we raise errors for alleles missing from the store
+        '''
+        # position outside the regions
+        with self.assertRaises(KeyError):
+            self.store.lookup('1', [100, 107], ['C', 'C'])
+        
+        # alt allele matches the ref allele
+        with self.assertRaises(KeyError):
+            self.store.lookup('1', [100], ['A'])
+        
+        # chromosome not in the store
+        with self.assertRaises(KeyError):
+            self.store.lookup('2', [100], ['C'])
+        
+        # position before the first region
+        with self.assertRaises(KeyError):
+            self.store.lookup('1', [10], ['C'])
+        
+        # alt allele is N, which has no score
+        with self.assertRaises(KeyError):
+            self.store.lookup('1', [100], ['N'])
+        
+        # indel alleles have no score
+        with self.assertRaises(KeyError):
+            self.store.lookup('1', [100, 101], ['C', 'CA'])
+    
+    def test_get_severity(self):
+        ''' check get_severity can read scores from the store
+        '''
+        sites = [{'pos': 111, 'alt': 'A'}, {'pos': 101, 'alt': 'T'}]
+        scores = get_severity(self.store, '1', sites, None, None)
+        self.assertTrue(numpy.allclose(scores, [11.1, 13.1]))
@@ -0,0 +1,59 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import re
+import subprocess
+import sys
+import unittest
+
+CODE = '''
+import sys
+import severity, severity.regional_constraint
+print(' '.join(sorted(sys.modules)))
+print(severity.__version__)
+'''
+
+class TestImport(unittest.TestCase):
+    ''' check the package imports quickly
+    '''
+    
+    def test_import(self):
+        ''' check slow modules aren't imported with the package
+        
+        This runs in a fresh interpreter, since the test runner may already
+        have imported the slow modules.
+        '''
+        folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([sys.executable, '-c', CODE],
+            cwd=folder).decode('utf8').splitlines()
+        
+        modules = set(output[0].split())
+        
+        self.assertNotIn('pkg_resources', modules)
+        self.assertNotIn('scipy', modules)
+        self.assertNotIn('numpy', modules)
+        self.assertNotIn('sqlite3', modules)
+        
+        # the package version should match the version in setup.py
+        with open(os.path.join(folder, 'setup.py')) as handle:
+            version = re.search('version="(.+?)"', handle.read()).group(1)
+        self.assertEqual(output[1], version)
@@ -0,0 +1,102 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import tempfile
+import time
+import unittest
+
+import numpy
+
+from denovonear.weights import WeightedChoice
+
+from severity.null_cache import NullCache
+from severity.simulation import (analyse_exact, exact_null_distribution,
+    null_tail_probability)
+
+class TestNullCache(unittest.TestCase):
+    ''' unit test the on-disk cache of null distributions
+    '''
+    
+    def setUp(self):
+        self.temp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.temp.close()
+        
+        self.rates = WeightedChoice()
+        self.rates.add_choice(200, 1e-5, 'A', 'G')
+        self.rates.add_choice(201, 2e-5, 'C', 'T')
+        self.rates.add_choice(202, 1e-5, 'C', 'G')
+        self.severity = [5.0, 10.0, 5.5]
+    
+    def tearDown(self):
+        os.remove(self.temp.name)
+    
+    def test_null_tail_probability(self):
+        ''' check p-values from a stored distribution match analyse_exact
+        '''
+        null = exact_null_distribution(self.rates, self.severity, 3)
+        for observed in [10, 15, 20, 25.3, 30, 40]:
+            self.assertEqual(null_tail_probability(null, observed),
+                analyse_exact(self.rates, self.severity, observed, 3))
+    
+    def test_cache(self):
+        ''' check storing and loading distributions
+        '''
+        cache = NullCache(self.temp.name)
+        key = cache.key([1e-5, 2e-5, 1e-5], self.severity, 3, 0.01)
+        self.assertIsNone(cache.get(key))
+        
+        null = exact_null_distribution(self.rates, self.severity, 3)
+        cache.put(key, null, 'TEST')
+        
+        # the stored distribution can be read by a new connection
+        loaded = NullCache(self.temp.name).get(key)
+        self.assertEqual(loaded['count'], 3)
+        self.assertTrue(numpy.array_equal(loaded['pmf'], null['pmf']))
+        self.assertEqual(null_tail_probability(loaded, 15),
+            null_tail_probability(null, 15))
+        
+        # keys differ for different inputs
+        self.assertNotEqual(key, cache.key([1e-5, 2e-5, 1e-5], self.severity,
+            2, 0.01))
+        self.assertNotEqual(key, cache.key([1e-5, 2e-5, 1e-5], [5, 10, 6], 3,
+            0.01))
+    
+    def test_evict(self):
+        ''' check the least recently used distributions are removed
+        '''
+        null = exact_null_distribution(self.rates, self.severity, 3)
+        cache = NullCache(self.temp.name)
+        cache.put('a', null)
+        
+        # allow space for two distributions, and use the first distribution,
+        # so the second is the least recently used
+        cache.max_bytes = cache.connect().execute(
+            'SELECT size FROM nulls').fetchone()[0] * 2
+        cache.put('b', null)
+        time.sleep(0.01)
+        cache.get('a')
+        cache.put('c', null)
+        
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('c'))
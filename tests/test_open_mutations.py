@@ -19,10 +19,12 @@ IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
+import gzip
 import unittest
 import tempfile
 
-from severity.open_mutations import open_mutations, parse_header, parse
+from severity.open_mutations import (open_mutations, iter_genes, parse_header,
+    parse)
 
 class TestOpenMutationsPy(unittest.TestCase):
     ''' unit test functions to open mutations
@@ -159,6 +161,20 @@ class TestOpenMutationsPy(unittest.TestCase):
         # check that variants that do not alter protein sequence are excluded
         self.assertEqual(open_mutations(temp.name), {})
     
+    def test_open_mutations_trailing_whitespace(self):
+        ''' test that the consequence filter matches the parsed consequence
+        '''
+        
+        # the consequence is the final column, with trailing whitespace
+        lines = [['symbol', 'chrom', 'pos', 'ref', 'alt', 'consequence'],
+            ['TEST', '1', '200', 'A', 'C', 'missense_variant \r']]
+        
+        temp = self.write_temp(lines)
+        
+        self.assertEqual(open_mutations(temp.name), {'TEST':
+            [{'chrom': '1', 'pos': 200, 'ref': 'A', 'alt': 'C',
+                'consequence': 'missense_variant'}]})
+    
     def test_open_mutations_consequence_noninteger_positions(self):
         ''' test that we fail if the nucleotide position is not an integer
         '''
@@ -171,6 +187,67 @@ class TestOpenMutationsPy(unittest.TestCase):
         with self.assertRaises(ValueError):
             open_mutations(temp.name)
     
+    def test_open_mutations_gzipped(self):
+        ''' test that we can load gzipped files
+        '''
+        
+        lines = [['symbol', 'chrom', 'pos', 'ref', 'alt', 'consequence'],
+            ['TEST', '1', '200', 'A', 'C', 'missense_variant']]
+        
+        temp = tempfile.NamedTemporaryFile(suffix='.gz')
+        with gzip.open(temp.name, 'wt') as handle:
+            for x in lines:
+                handle.write('\t'.join(x) + '\n')
+        
+        self.assertEqual(open_mutations(temp.name), {'TEST':
+            [{'chrom': '1', 'pos': 200, 'ref': 'A', 'alt': 'C',
+                'consequence': 'missense_variant'}]})
+    
+    def test_open_mutations_as_array(self):
+        ''' test that we can load mutations into structured arrays
+        '''
+        
+        lines = [['symbol', 'chrom', 'pos', 'ref', 'alt', 'consequence'],
+            ['TEST', '1', '200', 'A', 'C', 'missense_variant'],
+            ['TEST', '1', '300', 'A', 'CG', 'frameshift_variant'],
+            ['TEST2', 'X', '400', 'G', 'T', 'stop_gained']]
+        
+        temp = self.write_temp(lines)
+        
+        genes = open_mutations(temp.name, indels=True, as_array=True)
+        self.assertEqual(sorted(genes), ['TEST', 'TEST2'])
+        
+        data = genes['TEST']
+        self.assertEqual(data['pos'].tolist(), [200, 300])
+        self.assertEqual(data['alt'].tolist(), ['C', 'CG'])
+        self.assertEqual(data[0]['consequence'], 'missense_variant')
+        self.assertEqual(genes['TEST2'][0]['chrom'], 'X')
+    
+    def test_iter_genes(self):
+        ''' test that we can iterate through mutations gene by gene
+        '''
+        
+        lines = [['symbol', 'chrom', 'pos', 'ref', 'alt', 'consequence'],
+            ['TEST', '1', '200', 'A', 'C', 'missense_variant'],
+            ['TEST', '1', '250', 'A', 'C', 'synonymous_variant'],
+            ['TEST', '1', '300', 'A', 'C', 'stop_gained'],
+            ['TEST2', '1', '400', 'A', 'C', 'missense_variant']]
+        
+        temp = self.write_temp(lines)
+        
+        genes = list(iter_genes(temp.name))
+        self.assertEqual([ x[0] for x in genes ], ['TEST', 'TEST2'])
+        self.assertEqual(genes, list(open_mutations(temp.name).items()))
+        
+        genes = list(iter_genes(temp.name, as_array=True))
+        self.assertEqual(genes[0][1]['pos'].tolist(), [200, 300])
+        
+        # genes must be on consecutive lines
+        lines.append(['TEST', '1', '500', 'A', 'C', 'missense_variant'])
+        temp = self.write_temp(lines)
+        with self.assertRaises(ValueError):
+            list(iter_genes(temp.name))
+    
     def test_parse_header(self):
         ''' test that we can parse the header correctly
         '''
@@ -0,0 +1,110 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import random
+import unittest
+
+from intervaltree import IntervalTree
+
+from severity.open_severity import (get_spans, fetch_scores, get_severity,
+    in_regions, weight_scores)
+from severity.weights import weights as WEIGHTS
+
+from tests.utils import CADD
+
+class TestOpenSeverityPy(unittest.TestCase):
+    ''' unit test functions to load CADD scores
+    '''
+    
+    def setUp(self):
+        self.cadd = CADD([ '1\t{}\tA\t{}\t0.1\t{}'.format(pos, alt, pos / 100.0)
+            for pos in range(100, 300) for alt in 'CGT' ])
+    
+    def test_get_spans(self):
+        ''' check that positions are merged into spans
+        '''
+        positions = [5, 1, 2, 3, 10, 200]
+        self.assertEqual(get_spans(positions, max_gap=1),
+            [(1, 3), (5, 5), (10, 10), (200, 200)])
+        self.assertEqual(get_spans(positions, max_gap=5),
+            [(1, 10), (200, 200)])
+        self.assertEqual(get_spans(positions, max_gap=1000), [(1, 200)])
+        self.assertEqual(get_spans([]), [])
+    
+    def test_fetch_scores(self):
+        ''' check we only keep scores at the requested positions
+        '''
+        scores = fetch_scores(self.cadd, '1', [100, 150], max_gap=1000)
+        self.assertEqual(self.cadd.fetches, 1)
+        self.assertEqual(sorted(scores), [(100, 'C'), (100, 'G'), (100, 'T'),
+            (150, 'C'), (150, 'G'), (150, 'T')])
+        self.assertEqual(scores[(150, 'G')], 1.5)
+        
+        scores = fetch_scores(self.cadd, '1', [100, 150], max_gap=10)
+        self.assertEqual(self.cadd.fetches, 3)
+        self.assertEqual(len(scores), 6)
+    
+    def test_get_severity(self):
+        ''' check get_severity matches scores to sites, in the site order
+        '''
+        sites = [{'pos': 150, 'alt': 'T'}, {'pos': 101, 'alt': 'C'}]
+        self.assertEqual(get_severity(self.cadd, '1', sites, None, None),
+            [1.5, 1.01])
+        
+        # check we can use scores that were already fetched
+        scores = fetch_scores(self.cadd, '1', [101, 150])
+        fetches = self.cadd.fetches
+        self.assertEqual(get_severity(self.cadd, '1', sites, None, None,
+            scores=scores), [1.5, 1.01])
+        self.assertEqual(self.cadd.fetches, fetches)
+    
+    def test_in_regions(self):
+        ''' check we find positions within half-open regions
+        '''
+        regions = IntervalTree.from_tuples([(10, 20), (15, 25), (40, 41)])
+        positions = [5, 10, 19, 24, 25, 39, 40, 41]
+        self.assertEqual(in_regions(positions, regions).tolist(),
+            [False, True, True, True, False, False, True, False])
+        
+        self.assertEqual(in_regions(positions, IntervalTree()).tolist(),
+            [False] * len(positions))
+    
+    def test_weight_scores(self):
+        ''' check vectorised weights match per-site IntervalTree queries
+        '''
+        constrained = IntervalTree.from_tuples([(100, 150)])
+        
+        random.seed(1)
+        scores = [ random.uniform(0, 50) for _ in range(1000) ] + [5.0, 40.0]
+        positions = [ random.randint(50, 200) for _ in scores ]
+        truncating = [ random.random() < 0.1 for _ in scores ]
+        
+        expected = []
+        for score, pos, lof in zip(scores, positions, truncating):
+            if lof:
+                expected.append(WEIGHTS['truncating'])
+                continue
+            constraint = 'constrained' if constrained[pos] else 'unconstrained'
+            expected.append(list(WEIGHTS['altering'][constraint][score])[0].data)
+        
+        weighted = weight_scores(scores, positions, truncating, WEIGHTS,
+            constrained)
+        self.assertEqual(weighted.tolist(), expected)
@@ -0,0 +1,136 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from intervaltree import IntervalTree
+
+from severity.regional_constraint import (build_constraint_index,
+    write_constraint_index, open_constraint, ConstraintIndex,
+    get_constrained_positions, chisq_sf)
+
+class Transcript(object):
+    ''' mimic a denovonear Transcript, with the CDS starting at position 1000
+    '''
+    def get_position_on_chrom(self, pos):
+        return 1000 + pos
+    
+    def get_strand(self):
+        return '+'
+
+def construct_gene_object(ensembl, tx):
+    ''' mimic constructing transcripts, where some can't be built
+    '''
+    if tx == 'BROKEN':
+        raise ValueError('cannot build transcript')
+    return Transcript()
+
+class TestRegionalConstraint(unittest.TestCase):
+    ''' unit test functions for regional constraint
+    '''
+    
+    def test_chisq_sf(self):
+        ''' check the chi-squared tail matches scipy.stats.chi2.sf(x, df=1)
+        '''
+        expected = [(0, 1.0), (1, 0.31731050786291115),
+            (3.841458820694124, 0.05), (10, 0.001565402258002549),
+            (50, 1.537459794428033e-12), (200, 2.0884875837625688e-45)]
+        for chisq, p_value in expected:
+            self.assertAlmostEqual(chisq_sf(chisq) / p_value, 1.0, places=10)
+        
+        self.assertEqual(chisq_sf(-1), 1.0)
+
+class TestConstraintIndex(unittest.TestCase):
+    ''' unit test the precomputed regional constraint index
+    '''
+    
+    def setUp(self):
+        self.temp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        self.temp.close()
+        
+        genes = {'ABC': {'chrom': '1', 'cds_length': 900,
+                'regions': IntervalTree.from_tuples([(300, 400), (100, 200)])},
+            'DEF': {'chrom': '2', 'cds_length': 600, 'regions': IntervalTree()}}
+        write_constraint_index(genes, self.temp.name)
+        self.index = open_constraint(self.temp.name)
+    
+    def tearDown(self):
+        os.remove(self.temp.name)
+    
+    def test_open_constraint(self):
+        ''' check we open an index as a ConstraintIndex
+        '''
+        self.assertTrue(isinstance(self.index, ConstraintIndex))
+    
+    def test_intervals(self):
+        ''' check we get sorted region starts and ends for a gene
+        '''
+        starts, ends = self.index.intervals('ABC')
+        self.assertEqual(starts.tolist(), [100, 300])
+        self.assertEqual(ends.tolist(), [200, 400])
+        
+        starts, ends = self.index.intervals('DEF')
+        self.assertEqual(starts.tolist(), [])
+        
+        self.assertEqual(self.index.regions('ABC'),
+            IntervalTree.from_tuples([(100, 200), (300, 400)]))
+    
+    def test_genes(self):
+        ''' check gene lookups, including genes missing from the index
+        '''
+        self.assertTrue('ABC' in self.index)
+        self.assertFalse('GHI' in self.index)
+        self.assertEqual(self.index.cds_length('ABC'), 900)
+        self.assertEqual(self.index.cds_length('GHI', default=1500), 1500)
+        self.assertEqual(self.index.regions('GHI'), IntervalTree())
+    
+    def test_get_constrained_positions(self):
+        ''' check get_constrained_positions uses the index, without Ensembl
+        '''
+        self.assertEqual(get_constrained_positions(None, self.index, 'ABC'),
+            self.index.regions('ABC'))
+    
+    @mock.patch('severity.regional_constraint.construct_gene_object',
+        construct_gene_object)
+    def test_build_constraint_index(self):
+        ''' check genes which fail are skipped, and the others are indexed
+        '''
+        region = {'pos': '1-10', 'ratio': 0.1, 'chisq': 50}
+        constraint = {'ABC': {'tx': 'ENST1', 'chrom': '1', 'regions': [region]},
+            'DEF': {'tx': 'BROKEN', 'chrom': '2', 'regions': [region]},
+            'GHI': {'tx': 'ENST3', 'chrom': '3', 'regions': [region]}}
+        
+        with self.assertLogs('severity.regional_constraint', 'WARNING') as logs:
+            build_constraint_index(None, constraint, self.temp.name)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('DEF', logs.output[0])
+        
+        index = open_constraint(self.temp.name)
+        self.assertTrue('ABC' in index)
+        self.assertFalse('DEF' in index)
+        self.assertTrue('GHI' in index)
+        self.assertEqual(index.cds_length('ABC'), 30)
+        self.assertEqual(index.regions('GHI'),
+            IntervalTree.from_tuples([(1000, 1030)]))
+
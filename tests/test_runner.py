@@ -0,0 +1,140 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+import os
+import tempfile
+import unittest
+
+from intervaltree import IntervalTree
+
+from severity.regional_constraint import write_constraint_index, open_constraint
+from severity.runner import cds_length, schedule, gene_seed, load_completed
+
+class TestRunner(unittest.TestCase):
+    ''' unit test the helpers for running the analysis across genes
+    '''
+    
+    def setUp(self):
+        # regional constraint regions, in the format from
+        # load_regional_constraint()
+        self.constraint = {
+            'ABC': {'regions': [{'pos': '1-100'}, {'pos': '101-250'}]},
+            'DEF': {'regions': [{'pos': '1-1000'}]}}
+    
+    def test_cds_length(self):
+        ''' check we estimate coding lengths from the last constrained codon
+        '''
+        self.assertEqual(cds_length(self.constraint, 'ABC'), 750)
+        self.assertEqual(cds_length(self.constraint, 'DEF'), 3000)
+        
+        # genes without regional constraint get the default length
+        self.assertEqual(cds_length(self.constraint, 'GHI'), 1500)
+        self.assertEqual(cds_length(self.constraint, 'GHI', default=10), 10)
+    
+    def test_cds_length_index(self):
+        ''' check we get coding lengths from a regional constraint index
+        '''
+        temp = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        temp.close()
+        try:
+            genes = {'ABC': {'chrom': '1', 'cds_length': 900,
+                'regions': IntervalTree.from_tuples([(100, 200)])}}
+            write_constraint_index(genes, temp.name)
+            index = open_constraint(temp.name)
+            
+            self.assertEqual(cds_length(index, 'ABC'), 900)
+            self.assertEqual(cds_length(index, 'GHI'), 1500)
+        finally:
+            os.remove(temp.name)
+    
+    def test_schedule(self):
+        ''' check genes are ordered by descending cost, then by symbol
+        '''
+        de_novos = {'ABC': [1, 2, 3], 'DEF': [1], 'GHI': [1, 2],
+            'JKL': [1, 2], '': [1, 2, 3, 4], '.': [1]}
+        jobs = schedule(de_novos, self.constraint)
+        
+        # ABC costs 3 * 750, while DEF (1 * 3000), and GHI and JKL (2 * the
+        # default 1500) tie, so are sorted by symbol. Genes without symbols
+        # are dropped.
+        self.assertEqual([ x[0] for x in jobs ], ['DEF', 'GHI', 'JKL', 'ABC'])
+        self.assertEqual(jobs[-1], ('ABC', [1, 2, 3]))
+    
+    def test_gene_seed(self):
+        ''' check per-gene seeds are stable across runs, and differ by gene
+        '''
+        # these values must not change between runs or versions, otherwise
+        # resumed runs wouldn't reproduce the earlier results
+        self.assertEqual(gene_seed(10, 'ABC'), 17130438649486750624)
+        self.assertEqual(gene_seed(10, 'ABC'), gene_seed(10, 'ABC'))
+        self.assertNotEqual(gene_seed(10, 'ABC'), gene_seed(10, 'DEF'))
+        self.assertNotEqual(gene_seed(10, 'ABC'), gene_seed(11, 'ABC'))
+        self.assertTrue(0 <= gene_seed(10, 'ABC') < 2**64)
+    
+    def test_load_completed(self):
+        ''' check resuming drops a partial last line, and keeps complete lines
+        '''
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, 'results.txt')
+        
+        self.assertEqual(load_completed(path), set())
+        
+        header = 'symbol\tseverity_p_value\tseed\titerations\n'
+        complete = header + 'ABC\t0.5\t1\t1000\nDEF\t0.1\t2\t2000\n'
+        with open(path, 'w') as handle:
+            handle.write(complete + 'GHI\t0.')
+        
+        self.assertEqual(load_completed(path), set(['ABC', 'DEF']))
+        with open(path) as handle:
+            self.assertEqual(handle.read(), complete)
+        
+        # only the output file remains, without any temporary files
+        self.assertEqual(os.listdir(folder), ['results.txt'])
+        
+        # complete files are left as they are
+        self.assertEqual(load_completed(path), set(['ABC', 'DEF']))
+        with open(path) as handle:
+            self.assertEqual(handle.read(), complete)
+        
+        os.remove(path)
+        os.rmdir(folder)
+    
+    def test_load_completed_old_header(self):
+        ''' check we refuse to resume output files with different columns
+        '''
+        temp = tempfile.NamedTemporaryFile(mode='w', suffix='.txt')
+        old = 'symbol\tseverity_p_value\nABC\t0.5\n'
+        temp.write(old)
+        temp.flush()
+        
+        with self.assertRaises(ValueError):
+            load_completed(temp.name)
+        
+        # the file is left as it was
+        with open(temp.name) as handle:
+            self.assertEqual(handle.read(), old)
+        
+        # a file with only a header has no completed genes
+        temp = tempfile.NamedTemporaryFile(mode='w', suffix='.txt')
+        temp.write('symbol\tseverity_p_value\tseed\titerations\n')
+        temp.flush()
+        self.assertEqual(load_completed(temp.name), set())
@@ -0,0 +1,125 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import threading
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from severity.server import AnalysisService, make_server
+
+# requests which wait here only finish once four are running at the same time
+BARRIER = threading.Barrier(4, timeout=10)
+
+def analyse(request):
+    ''' mimic analysing a gene, with a short delay
+    '''
+    if request['symbol'] == 'ERROR':
+        raise ValueError('cannot analyse gene')
+    if request.get('wait', False):
+        BARRIER.wait()
+    time.sleep(request.get('delay', 0))
+    return {'p_value': 0.5, 'symbol': request['symbol'],
+        'count': len(request['de_novos'])}
+
+class TestServer(unittest.TestCase):
+    ''' drive the analysis server over HTTP
+    '''
+    
+    def setUp(self):
+        self.service = AnalysisService(analyse, workers=4,
+            stats_hooks={'extra': lambda: 5})
+        self.server = make_server(self.service, port=0)
+        self.url = 'http://{}:{}'.format(*self.server.server_address)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.service.shutdown()
+    
+    def post(self, data):
+        body = data if isinstance(data, bytes) else json.dumps(data).encode('utf8')
+        with urlopen(self.url + '/analyse', body) as response:
+            return json.loads(response.read().decode('utf8'))
+    
+    def get(self, path):
+        with urlopen(self.url + path) as response:
+            return json.loads(response.read().decode('utf8'))
+    
+    def test_analyse(self):
+        ''' check we get results for a request
+        '''
+        result = self.post({'symbol': 'TEST', 'de_novos': [{'pos': 100}]})
+        self.assertEqual(result, {'p_value': 0.5, 'symbol': 'TEST', 'count': 1})
+    
+    def test_concurrent(self):
+        ''' check requests are analysed concurrently
+        '''
+        # each request blocks until all four are running, so this would time
+        # out with an error if the requests were analysed one at a time
+        results = []
+        def run():
+            results.append(self.post({'symbol': 'TEST', 'de_novos': [],
+                'wait': True}))
+        
+        threads = [ threading.Thread(target=run) for _ in range(4) ]
+        for x in threads:
+            x.start()
+        for x in threads:
+            x.join()
+        
+        self.assertEqual(len(results), 4)
+        self.assertFalse(BARRIER.broken)
+    
+    def test_errors(self):
+        ''' check failed analyses and bad requests give HTTP errors
+        '''
+        with self.assertRaises(HTTPError) as context:
+            self.post({'symbol': 'ERROR', 'de_novos': []})
+        self.assertEqual(context.exception.code, 500)
+        
+        with self.assertRaises(HTTPError) as context:
+            self.post(b'not json')
+        self.assertEqual(context.exception.code, 400)
+        
+        with self.assertRaises(HTTPError) as context:
+            self.get('/unknown')
+        self.assertEqual(context.exception.code, 404)
+    
+    def test_stats(self):
+        ''' check we track the number of requests and their latency
+        '''
+        self.post({'symbol': 'TEST', 'de_novos': []})
+        self.post({'symbol': 'TEST', 'de_novos': [], 'delay': 0.1})
+        with self.assertRaises(HTTPError):
+            self.post({'symbol': 'ERROR', 'de_novos': []})
+        
+        stats = self.get('/stats')
+        self.assertEqual(stats['requests'], 3)
+        self.assertEqual(stats['errors'], 1)
+        self.assertEqual(stats['extra'], 5)
+        self.assertTrue(stats['p95_latency'] >= 0.1)
+        self.assertTrue(stats['throughput'] > 0)
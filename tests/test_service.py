@@ -0,0 +1,106 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+
+from intervaltree import IntervalTree
+
+try:
+    import pysam
+except ImportError:
+    pysam = None
+
+from severity.cadd_store import convert_cadd, CaddStore
+from severity.regional_constraint import write_constraint_index
+from severity.site_cache import MemorySiteCache
+from severity.service import open_cadd, make_analyser
+
+class TestService(unittest.TestCase):
+    ''' check the analysis service can be set up from small input files
+    '''
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        
+        self.cadd = os.path.join(self.folder, 'cadd')
+        convert_cadd(None, {}, self.cadd)
+        
+        self.constraint = os.path.join(self.folder, 'constraint.db')
+        genes = {'ABC': {'chrom': '1', 'cds_length': 900,
+            'regions': IntervalTree.from_tuples([(100, 200)])}}
+        write_constraint_index(genes, self.constraint)
+        
+        self.args = argparse.Namespace(cadd=self.cadd,
+            constraint=self.constraint, cache=os.path.join(self.folder, 'cache'),
+            site_cache=os.path.join(self.folder, 'sites'), max_genes=10,
+            genome_build='grch37')
+    
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    
+    def test_open_cadd(self):
+        ''' check we open converted CADD scores from a folder
+        '''
+        self.assertIsInstance(open_cadd(self.cadd), CaddStore)
+    
+    @unittest.skipIf(pysam is None, 'needs pysam to open tabix files')
+    def test_open_cadd_tabix(self):
+        ''' check we open CADD scores from a tabix-indexed file
+        '''
+        path = os.path.join(self.folder, 'cadd.tsv')
+        with open(path, 'w') as handle:
+            handle.write('1\t100\tA\tC\t0.1\t10.0\n')
+        path = pysam.tabix_index(path, seq_col=0, start_col=1, end_col=1)
+        
+        cadd = open_cadd(path)
+        self.assertEqual(list(cadd.fetch('1', 99, 100)),
+            ['1\t100\tA\tC\t0.1\t10.0'])
+    
+    def test_make_analyser(self):
+        ''' check we get an analyse function, and the site cache it uses
+        '''
+        analyse, site_cache = make_analyser(self.args)
+        
+        self.assertTrue(callable(analyse))
+        self.assertIsInstance(site_cache, MemorySiteCache)
+        self.assertEqual(site_cache.max_genes, 10)
+        self.assertEqual(len(site_cache), 0)
+        self.assertEqual(site_cache.backing.folder, self.args.site_cache)
+        self.assertEqual(site_cache.backing.build, 'grch37')
+        self.assertTrue(os.path.exists(self.args.site_cache))
+        
+        # the on-disk tables depend on the input files, so a different CADD
+        # file gives a different cache key
+        other = argparse.Namespace(**vars(self.args))
+        other.cadd = self.constraint
+        _, other_cache = make_analyser(other)
+        self.assertNotEqual(site_cache.backing.digest, other_cache.backing.digest)
+    
+    def test_make_analyser_without_site_cache(self):
+        ''' check the site tables are only held in memory without a cache folder
+        '''
+        self.args.site_cache = None
+        _, site_cache = make_analyser(self.args)
+        self.assertIsNone(site_cache.backing)
@@ -21,10 +21,35 @@ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import unittest
 import tempfile
+import warnings
 from random import randint, uniform, seed
 
 from denovonear.weights import WeightedChoice
-from severity.simulation import analyse
+import numpy
+
+from severity.simulation import (analyse, analyse_batch, analyse_exact,
+    analyse_importance, analyse_stratified, analyse_genes, null_histogram,
+    from_arrays, to_arrays, set_seed)
+
+def random_gene():
+    ''' make a WeightedChoice with about 2000 random sites, and their scores
+    
+    The random module is reseeded first, so each call gives the same sites.
+    
+    Returns:
+        tuple of the WeightedChoice, the list of site positions, and the list
+        of severity scores for the sites
+    '''
+    seed(0)
+    rates = WeightedChoice()
+    pos = sorted(set([ randint(1000, 3000) for x in range(2000) ]))
+    
+    for x in pos:
+        rates.add_choice(x, uniform(1e-10, 1e-7), 'A', 'G')
+    
+    severity = [ randint(0, 40) for x in pos ]
+    
+    return rates, pos, severity
 
 class TestSimulationsPy(unittest.TestCase):
     ''' unit test functions for simulations
@@ -43,12 +68,139 @@ class TestSimulationsPy(unittest.TestCase):
         
         # define a test where the observed score will fall at the midpoint of
         # the simulated null distribution
-        p = analyse(rates, severity, 8, 1, iterations=100000)
+        p = analyse(rates, severity, 8, 1, min_iterations=100000)
         self.assertAlmostEqual(p, 0.5, places=2)
         
         # now check when we sample two de novo mutations
-        p = analyse(rates, severity, 15, 2, iterations=100000)
+        p = analyse(rates, severity, 15, 2, min_iterations=100000)
+        self.assertAlmostEqual(p, 0.25, places=2)
+    
+    def test_analyse_threads(self):
+        ''' test that splitting the simulations across threads works
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        
+        severity = [5, 10, 5]
+        
+        p = analyse(rates, severity, 8, 1, min_iterations=100000, threads=4)
+        self.assertAlmostEqual(p, 0.5, places=2)
+        
+        # check an iteration count which doesn't split evenly across threads
+        p = analyse(rates, severity, 15, 2, min_iterations=100003, threads=3)
         self.assertAlmostEqual(p, 0.25, places=2)
+        
+        with self.assertRaises(ValueError):
+            analyse(rates, severity, 8, 1, min_iterations=100000, threads=0)
+    
+    def test_analyse_samplers(self):
+        ''' test that both site samplers give the same results
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        rates.add_choice(203, 4e-5, 'C', 'G')
+        
+        severity = [5, 10, 5, 20]
+        
+        for sampler in ['alias', 'cumulative']:
+            p = analyse(rates, severity, 8, 1, min_iterations=100000, sampler=sampler)
+            self.assertAlmostEqual(p, 0.75, places=2)
+            
+            p = analyse(rates, severity, 12, 1, min_iterations=100000, sampler=sampler)
+            self.assertAlmostEqual(p, 0.5, places=2)
+        
+        with self.assertRaises(ValueError):
+            analyse(rates, severity, 8, 1, min_iterations=100000, sampler='unknown')
+    
+    def test_analyse_seed(self):
+        ''' test that simulations are reproducible for a given seed
+        '''
+        
+        rates, _, severity = random_gene()
+        
+        first = analyse(rates, severity, 100, 4, seed=10, threads=2,
+            full_output=True)
+        second = analyse(rates, severity, 100, 4, seed=10, threads=2,
+            full_output=True)
+        self.assertEqual(first, second)
+        self.assertEqual(first['seed'], 10)
+        self.assertTrue(first['iterations'] >= 1000)
+        
+        # a different seed gives a different result
+        third = analyse(rates, severity, 100, 4, seed=11, threads=2)
+        self.assertNotEqual(first['p_value'], third)
+        
+        # without a seed, we pick and report a random seed
+        result = analyse(rates, severity, 100, 4, full_output=True)
+        self.assertEqual(result, analyse(rates, severity, 100, 4,
+            seed=result['seed'], full_output=True))
+    
+    def test_analyse_iterations_alias(self):
+        ''' test the deprecated iterations argument still sets min_iterations
+        '''
+        
+        rates, _, severity = random_gene()
+        
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            result = analyse(rates, severity, 100, 4, iterations=5000, seed=10,
+                full_output=True)
+        
+        self.assertEqual(len(caught), 1)
+        self.assertTrue(issubclass(caught[0].category, DeprecationWarning))
+        self.assertEqual(result, analyse(rates, severity, 100, 4,
+            min_iterations=5000, seed=10, full_output=True))
+    
+    def test_seed_threads(self):
+        ''' test that seeded results don't depend on the number of threads
+        '''
+        
+        rates, _, severity = random_gene()
+        
+        # use iteration counts which don't fall on block boundaries, so later
+        # rounds start partway through a block
+        expected = analyse(rates, severity, 110, 4, seed=10,
+            min_iterations=5000, full_output=True)
+        self.assertTrue(expected['iterations'] > 5000)
+        for threads in [2, 3, 8]:
+            self.assertEqual(expected, analyse(rates, severity, 110, 4, seed=10,
+                min_iterations=5000, threads=threads, full_output=True))
+        
+        hist = null_histogram(rates, severity, 4, iterations=10001, seed=3)
+        self.assertEqual(hist, null_histogram(rates, severity, 4,
+            iterations=10001, seed=3, threads=3))
+        
+        importance = analyse_importance(rates, severity, 150, 4,
+            iterations=10001, seed=3)
+        self.assertEqual(importance, analyse_importance(rates, severity, 150, 4,
+            iterations=10001, seed=3, threads=3))
+    
+    def test_set_seed(self):
+        ''' test that seeding WeightedChoice objects makes choices reproducible
+        '''
+        
+        seed(0)
+        pos = list(range(1000, 2000))
+        probs = [ uniform(1e-10, 1e-7) for x in pos ]
+        arrays = [pos, [0] * len(pos), [2] * len(pos), probs]
+        
+        first = from_arrays(*arrays, seed=5)
+        second = from_arrays(*arrays, seed=5)
+        draws = [ first.choice() for x in range(100) ]
+        self.assertEqual(draws, [ second.choice() for x in range(100) ])
+        
+        # reseeding restarts the draws
+        set_seed(first, 5)
+        self.assertEqual(draws, [ first.choice() for x in range(100) ])
+        
+        set_seed(first, 6)
+        self.assertNotEqual(draws, [ first.choice() for x in range(100) ])
     
     def test_analyse_extreme_p_value(self):
         ''' test when the observed severity score exceeds all possible values
@@ -68,15 +220,44 @@ class TestSimulationsPy(unittest.TestCase):
         # observed score will always be theoretically achieveable in the null
         # distribution, since the observed score is calculated from the
         # existsing scores.
-        p = analyse(rates, severity, 20, 1, iterations=100000)
+        p = analyse(rates, severity, 20, 1, min_iterations=100000)
         self.assertAlmostEqual(p, 1e-6, places=4)
     
+    def test_analyse_iteration_limits(self):
+        ''' test that we respect the minimum and maximum iterations
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        
+        severity = [5, 10, 5]
+        
+        # an unachievable score never halts for precision, so the p-value
+        # depends on the maximum iterations.
+        p = analyse(rates, severity, 20, 1, min_iterations=1000,
+            max_iterations=5000)
+        self.assertAlmostEqual(p, 1/5001.0, places=10)
+        
+        # a p-value which can't be significant still gives a sensible estimate
+        # when we stop early
+        p = analyse(rates, severity, 8, 1, min_iterations=1000, alpha=0.01)
+        self.assertAlmostEqual(p, 0.5, places=1)
+        
+        with self.assertRaises(ValueError):
+            analyse(rates, severity, 8, 1, min_iterations=0)
+        
+        with self.assertRaises(ValueError):
+            analyse(rates, severity, 8, 1, min_iterations=1000,
+                max_iterations=100)
+    
     def test_analyse_empty(self):
         ''' check we raise an error if the rates and severity are empty
         '''
         
         with self.assertRaises(ValueError):
-            analyse(WeightedChoice(), [], 8, 1, iterations=10000)
+            analyse(WeightedChoice(), [], 8, 1, min_iterations=10000)
     
     def test_analyse_sample_zero(self):
         ''' test we raise an error if the de novo count is zero
@@ -87,7 +268,7 @@ class TestSimulationsPy(unittest.TestCase):
         
         severity = [5, 10]
         with self.assertRaises(ValueError):
-            analyse(rates, severity, 0, 0, iterations=10000)
+            analyse(rates, severity, 0, 0, min_iterations=10000)
     
     def test_analyse_mismatch(self):
         ''' test for error when the rates and severity lengths are different
@@ -100,21 +281,389 @@ class TestSimulationsPy(unittest.TestCase):
         severity = [5, 10, 5]
         
         with self.assertRaises(ValueError):
-            analyse(rates, severity, 8, 1, iterations=100000)
+            analyse(rates, severity, 8, 1, min_iterations=100000)
     
     def test_analyse_bigger(self):
         ''' test a more realistically sized data set
         '''
         
+        rates, _, severity = random_gene()
+        
+        p = analyse(rates, severity, 150, 4, min_iterations=10000)
+        self.assertAlmostEqual(p, 3e-4, places=2)
+    
+    def test_analyse_multiple_scores(self):
+        ''' test analysing several severity score lists from shared simulations
+        '''
+        
+        rates, _, first = random_gene()
+        second = [ x * 2 for x in first ]
+        
+        # a single score list gives the same result as the standard analysis
+        single = analyse(rates, first, 100, 4, seed=10, threads=2,
+            full_output=True)
+        multi = analyse(rates, [first], [100], 4, seed=10, threads=2,
+            full_output=True)
+        self.assertEqual(multi['p_value'], [single['p_value']])
+        self.assertEqual(multi['iterations'], [single['iterations']])
+        
+        # each score list matches analysing it by itself. Scaled scores with
+        # scaled observed totals share the same sampled sites, so the p-values
+        # match exactly.
+        p_values = analyse(rates, [first, second, first], [100, 200, 80], 4,
+            seed=10, threads=2)
+        self.assertEqual(p_values[0], single['p_value'])
+        self.assertEqual(p_values[1], single['p_value'])
+        self.assertEqual(p_values[2], analyse(rates, first, 80, 4, seed=10,
+            threads=2))
+        
+        with self.assertRaises(ValueError):
+            analyse(rates, [first, second], [100], 4)
+        
+        with self.assertRaises(ValueError):
+            analyse(rates, [first, second[:-1]], [100, 200], 4)
+    
+    def test_analyse_batch(self):
+        ''' test analysing many observed totals and counts in one call
+        '''
+        
+        rates, _, severity = random_gene()
+        
+        observed = [100, 30, 120, 60, 100]
+        counts = [4, 1, 4, 2, 4]
+        
+        # each p-value matches the analysis for a single total and count
+        p_values = analyse_batch(rates, severity, observed, counts, seed=10)
+        for p, total, count in zip(p_values, observed, counts):
+            self.assertEqual(p, analyse(rates, severity, total, count, seed=10))
+        
+        p_values = analyse_batch(rates, severity, observed, counts,
+            method='exact')
+        for p, total, count in zip(p_values, observed, counts):
+            self.assertEqual(p, analyse_exact(rates, severity, total, count)[0])
+        
+        self.assertEqual(analyse_batch(rates, severity, [], []), [])
+        
+        with self.assertRaises(ValueError):
+            analyse_batch(rates, severity, [100, 30], [4])
+        
+        with self.assertRaises(ValueError):
+            analyse_batch(rates, severity, [100], [4], method='unknown')
+    
+    def test_from_arrays(self):
+        ''' test constructing WeightedChoice objects from arrays
+        '''
+        
         seed(0)
         rates = WeightedChoice()
         pos = sorted(set([ randint(1000, 3000) for x in range(2000) ]))
+        probs = [ uniform(1e-10, 1e-7) for x in pos ]
+        alts = [ randint(0, 3) for x in pos ]
         
-        for x in pos:
-            rates.add_choice(x, uniform(1e-10, 1e-7), 'A', 'G')
+        for x, prob, alt in zip(pos, probs, alts):
+            rates.add_choice(x, prob, 'A', 'ACGT'[alt], 1)
         
+        # use read-only arrays, as from memory-mapped files
+        arrays = [numpy.array(pos, dtype=numpy.int32),
+            numpy.zeros(len(pos), dtype=numpy.uint8),
+            numpy.array(alts, dtype=numpy.uint8), numpy.array(probs)]
+        for x in arrays:
+            x.flags.writeable = False
+        
+        choices = from_arrays(*arrays, offsets=[1] * len(pos))
+        self.assertEqual(list(choices), list(rates))
+        
+        # the sampled sites match, so seeded results are the same
         severity = [ randint(0, 40) for x in pos ]
+        self.assertEqual(analyse(choices, severity, 100, 4, seed=1),
+            analyse(rates, severity, 100, 4, seed=1))
         
-        p = analyse(rates, severity, 150, 4, iterations=10000)
-        self.assertAlmostEqual(p, 3e-4, places=2)
+        self.assertEqual(len(from_arrays([], [], [], [])), 0)
         
+        with self.assertRaises(ValueError):
+            from_arrays([100, 101], [0, 0], [1, 1], [1e-8])
+        
+        with self.assertRaises(ValueError):
+            from_arrays([100], [0], [5], [1e-8])
+    
+    def test_to_arrays(self):
+        ''' test getting arrays of the per-site data from WeightedChoice objects
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G', 1)
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 3e-5, 'T', 'AC')
+        
+        positions, refs, alts, probs, offsets = to_arrays(rates)
+        self.assertEqual(positions.tolist(), [200, 201, 202])
+        self.assertEqual(refs.tolist(), [0, 1, 3])
+        self.assertEqual(alts.tolist(), [2, 3, 4])
+        self.assertEqual(probs.tolist(), [1e-5, 2e-5, 3e-5])
+        self.assertEqual(offsets.tolist(), [1, 0, 0])
+        
+        # converting back gives the same sites
+        rates, _, _ = random_gene()
+        self.assertEqual(list(from_arrays(*to_arrays(rates))), list(rates))
+        
+        self.assertEqual([ len(x) for x in to_arrays(WeightedChoice()) ],
+            [0, 0, 0, 0, 0])
+    
+    def test_analyse_genes(self):
+        ''' test analysing many genes in a single call
+        '''
+        
+        seed(0)
+        genes = []
+        for i in range(20):
+            rates = WeightedChoice()
+            pos = sorted(set([ randint(1000, 3000) for x in range(randint(1, 500)) ]))
+            for x in pos:
+                rates.add_choice(x, uniform(1e-10, 1e-7), 'A', 'G')
+            severity = [ randint(0, 40) for x in pos ]
+            count = randint(1, 5)
+            genes.append((rates, severity, 20 * count, count))
+        
+        # each gene matches analyse() with the seed for the gene, regardless of
+        # the number of threads
+        for threads in [1, 3]:
+            result = analyse_genes(genes, threads=threads, seed=5,
+                full_output=True)
+            self.assertEqual(result['seed'].tolist(), list(range(5, 25)))
+            for i, (rates, severity, observed, count) in enumerate(genes):
+                expected = analyse(rates, severity, observed, count, seed=5 + i,
+                    full_output=True)
+                self.assertEqual(result['p_value'][i], expected['p_value'])
+                self.assertEqual(result['iterations'][i], expected['iterations'])
+        
+        p_values = analyse_genes(genes, threads=2, seed=5)
+        self.assertEqual(p_values.tolist(), result['p_value'].tolist())
+        self.assertEqual(len(analyse_genes([])), 0)
+        
+        # errors in any gene are raised
+        genes.append((WeightedChoice(), [], 10, 1))
+        with self.assertRaises(ValueError):
+            analyse_genes(genes, threads=2)
+    
+    def test_null_histogram(self):
+        ''' test that we count simulated totals into histogram bins
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        
+        severity = [5, 10, 5]
+        
+        # two de novos can sum to 10, 15 or 20, with probabilities of 0.25,
+        # 0.5 and 0.25, which fall in the first, middle and last bins
+        edges, counts = null_histogram(rates, severity, 2, iterations=100000,
+            bins=3, threads=2)
+        
+        self.assertEqual(len(edges), 4)
+        self.assertAlmostEqual(edges[0], 10)
+        self.assertAlmostEqual(edges[-1], 20)
+        self.assertEqual(sum(counts), 100000)
+        
+        proportions = [ x / 100000.0 for x in counts ]
+        for observed, expected in zip(proportions, [0.25, 0.5, 0.25]):
+            self.assertAlmostEqual(observed, expected, places=2)
+        
+        with self.assertRaises(ValueError):
+            null_histogram(rates, severity, 2, bins=0)
+    
+    def test_analyse_exact(self):
+        ''' test that we calculate exact p-values correctly
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        
+        severity = [5, 10, 5]
+        
+        # the scores fall exactly on the grid, so the bounds match the p-value,
+        # up to the round-off error
+        p, lower, upper = analyse_exact(rates, severity, 8, 1)
+        self.assertEqual(p, 0.5)
+        self.assertAlmostEqual(lower, p, places=12)
+        self.assertAlmostEqual(upper, p, places=12)
+        
+        p, lower, upper = analyse_exact(rates, severity, 15, 2)
+        self.assertAlmostEqual(p, 0.25, places=10)
+        self.assertAlmostEqual(lower, p, places=10)
+        self.assertAlmostEqual(upper, p, places=10)
+        
+        # the p-value for an unachievable score is zero, rather than limited by
+        # the number of iterations
+        p, _, _ = analyse_exact(rates, severity, 20, 1)
+        self.assertEqual(p, 0.0)
+    
+    def test_analyse_exact_off_grid(self):
+        ''' test the p-value bounds when scores do not fall on the grid
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        
+        severity = [5.0, 10.004, 9.996]
+        
+        # a coarse grid rounds both high scores to 10, so the p-value is
+        # uncertain, but the bounds include the true p-value of 0.5
+        p, lower, upper = analyse_exact(rates, severity, 10.0, 1)
+        self.assertAlmostEqual(lower, 0.0, places=10)
+        self.assertAlmostEqual(upper, 0.75, places=10)
+        self.assertTrue(lower <= p <= upper)
+        
+        # a finer grid gives the exact answer
+        p, lower, upper = analyse_exact(rates, severity, 10.0, 1, resolution=0.001)
+        self.assertAlmostEqual(p, 0.5, places=10)
+        self.assertAlmostEqual(lower, upper, places=10)
+    
+    def test_analyse_exact_far_tail(self):
+        ''' test that tails below the round-off error aren't reported as exact
+        '''
+        
+        seed(1)
+        probs = [ uniform(1e-10, 1e-7) for x in range(3000) ]
+        severity = [ randint(0, 40) for x in probs ]
+        rates = WeightedChoice()
+        for i, prob in enumerate(probs):
+            rates.add_choice(i, prob, 'A', 'G')
+        
+        # find the null distribution by direct convolution
+        single = numpy.zeros(41)
+        numpy.add.at(single, severity, probs)
+        single /= single.sum()
+        pmf = numpy.ones(1)
+        for _ in range(20):
+            pmf = numpy.convolve(pmf, single)
+        
+        for observed in [700, 760, 790]:
+            expected = pmf[observed + 1:].sum()
+            p, lower, upper = analyse_exact(rates, severity, observed, 20,
+                resolution=1)
+            self.assertTrue(lower <= expected <= upper)
+            
+            if expected < 1e-15:
+                self.assertEqual(lower, 0.0)
+                self.assertTrue(upper < 1e-13)
+            else:
+                self.assertAlmostEqual(p / expected, 1.0, places=3)
+    
+    def test_analyse_exact_matches_simulation(self):
+        ''' test that the exact p-value matches simulated p-values
+        '''
+        
+        rates, _, severity = random_gene()
+        
+        exact, _, _ = analyse_exact(rates, severity, 100, 4)
+        simulated = analyse(rates, severity, 100, 4, min_iterations=100000)
+        self.assertAlmostEqual(exact, simulated, places=2)
+    
+    def test_analyse_exact_errors(self):
+        ''' check we raise errors for invalid inputs to the exact analysis
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        
+        with self.assertRaises(ValueError):
+            analyse_exact(WeightedChoice(), [], 8, 1)
+        
+        with self.assertRaises(ValueError):
+            analyse_exact(rates, [5, 10, 5], 8, 1)
+        
+        with self.assertRaises(ValueError):
+            analyse_exact(rates, [5, 10], 0, 0)
+        
+        with self.assertRaises(ValueError):
+            analyse_exact(rates, [5, 10], 8, 1, resolution=0)
+    
+    def test_analyse_importance(self):
+        ''' test that importance sampling matches the exact p-values
+        '''
+        
+        rates, _, severity = random_gene()
+        
+        # check a p-value far below what simple simulations could reach
+        exact, _, _ = analyse_exact(rates, severity, 390, 10)
+        p, std_error = analyse_importance(rates, severity, 390, 10,
+            iterations=100000, threads=2)
+        self.assertTrue(exact < 1e-10)
+        self.assertTrue(abs(p - exact) < 4 * std_error)
+        self.assertTrue(std_error < 0.05 * exact)
+        
+        # observed totals below the null mean don't need any tilting
+        exact, _, _ = analyse_exact(rates, severity, 60, 4)
+        p, std_error = analyse_importance(rates, severity, 60, 4)
+        self.assertAlmostEqual(p, exact, places=2)
+        
+        # totals above the highest possible total are impossible
+        self.assertEqual(analyse_importance(rates, severity, 400, 10), (0.0, 0.0))
+    
+    def test_analyse_stratified(self):
+        ''' test that stratified simulations match the exact p-values
+        '''
+        
+        rates, pos, _ = random_gene()
+        
+        # give a fifth of sites a constant score, like truncating sites with the
+        # weighted scores
+        strata = [ int(uniform(0, 1) < 0.2) for x in pos ]
+        severity = [ 30.0 if label else randint(0, 40) for label in strata ]
+        
+        for observed, count in [(100, 4), (300, 10)]:
+            exact, _, _ = analyse_exact(rates, severity, observed, count)
+            result = analyse_stratified(rates, severity, strata, observed,
+                count, seed=1, full_output=True)
+            self.assertTrue(abs(result['p_value'] - exact) < 0.1 * exact)
+            
+            # the constant stratum isn't sampled, and each simulation has less
+            # variance than a simple simulation, so the p-value is as precise
+            # from fewer sampled sites
+            simple = analyse(rates, severity, observed, count, seed=1,
+                full_output=True)
+            self.assertTrue(result['draws'] < simple['iterations'] * count)
+            self.assertTrue(result['effective_iterations'] > result['iterations'])
+        
+        # seeded results don't depend on the number of threads
+        first = analyse_stratified(rates, severity, strata, 300, 10, seed=1,
+            full_output=True)
+        self.assertEqual(first, analyse_stratified(rates, severity, strata, 300,
+            10, seed=1, threads=3, full_output=True))
+        
+        p = analyse_stratified(rates, severity, strata, 300, 10,
+            sampler='cumulative')
+        self.assertTrue(abs(p - first['p_value']) < 0.1 * p)
+        
+        with self.assertRaises(ValueError):
+            analyse_stratified(rates, severity, strata[:-1], 300, 10)
+    
+    def test_analyse_stratified_constant(self):
+        ''' test that strata with constant scores give exact p-values
+        '''
+        
+        rates = WeightedChoice()
+        rates.add_choice(200, 1e-5, 'A', 'G')
+        rates.add_choice(201, 2e-5, 'C', 'T')
+        rates.add_choice(202, 1e-5, 'C', 'G')
+        
+        severity = [5, 10, 5]
+        strata = [0, 1, 2]
+        
+        # the first and last strata share a score, so are treated as one
+        result = analyse_stratified(rates, severity, strata, 8, 1,
+            full_output=True)
+        self.assertEqual(result['p_value'], 0.5)
+        self.assertEqual(result['iterations'], 0)
+        
+        # two de novos need a total above 15, so both in the second stratum
+        p = analyse_stratified(rates, severity, strata, 15, 2)
+        self.assertAlmostEqual(p, 0.25)
+
@@ -0,0 +1,148 @@
+"""
+Copyright (c) 2017 Genome Research Ltd.
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of
+this software and associated documentation files (the "Software"), to deal in
+the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS
+FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER
+IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import shutil
+import tempfile
+import unittest
+
+from intervaltree import IntervalTree
+
+from denovonear.weights import WeightedChoice
+
+from severity.site_cache import (SiteCache, MemorySiteCache,
+    build_site_table, table_to_rates, table_to_constrained, lookup_scores)
+
+class Transcript(object):
+    ''' minimal transcript, only needs a name for the cache key
+    '''
+    def __init__(self, name):
+        self.name = name
+    def get_name(self):
+        return self.name
+
+class TestSiteCache(unittest.TestCase):
+    ''' unit test the on-disk cache of per-gene site tables
+    '''
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        
+        missense = WeightedChoice()
+        missense.add_choice(100, 1e-8, 'A', 'G', 0)
+        missense.add_choice(101, 2e-8, 'C', 'T', 1)
+        nonsense = WeightedChoice()
+        nonsense.add_choice(102, 3e-8, 'G', 'T', 2)
+        
+        self.rates = {'missense': missense, 'nonsense': nonsense}
+        self.severity = [5.5, 10.25, 35.0]
+        self.constrained = IntervalTree.from_tuples([(100, 102)])
+    
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+    
+    def test_build_site_table(self):
+        ''' check we can convert a table back to the sites and regions
+        '''
+        table = build_site_table(self.rates, '1', self.severity,
+            self.constrained)
+        
+        sites = list(table_to_rates(table))
+        self.assertEqual([ x['pos'] for x in sites ], [100, 101, 102])
+        self.assertEqual([ x['alt'] for x in sites ], ['G', 'T', 'T'])
+        self.assertEqual([ x['offset'] for x in sites ], [0, 1, 2])
+        self.assertEqual(table['cadd'].tolist(), self.severity)
+        self.assertEqual(table_to_constrained(table), self.constrained)
+    
+    def test_lookup_scores(self):
+        ''' check we find scores for sites, or None if not in the table
+        '''
+        table = build_site_table(self.rates, '1', self.severity,
+            self.constrained)
+        sites = [{'pos': 102, 'alt': 'T'}, {'pos': 100, 'alt': 'C'}]
+        self.assertEqual(lookup_scores(table, sites), [35.0, None])
+    
+    def test_lookup_scores_unsorted(self):
+        ''' check we find scores when sites share positions, and aren't sorted
+        '''
+        missense = WeightedChoice()
+        missense.add_choice(200, 1e-8, 'A', 'G', 0)
+        missense.add_choice(100, 1e-8, 'A', 'C', 0)
+        missense.add_choice(100, 1e-8, 'A', 'G', 0)
+        nonsense = WeightedChoice()
+        nonsense.add_choice(100, 1e-8, 'A', 'T', 0)
+        
+        # scores keep their full precision, rather than rounding to float32
+        severity = [1.1, 2.123456789, 3.3, 4.4]
+        table = build_site_table({'missense': missense, 'nonsense': nonsense},
+            '1', severity, IntervalTree())
+        
+        sites = [{'pos': 100, 'alt': 'T'}, {'pos': 100, 'alt': 'C'},
+            {'pos': 200, 'alt': 'G'}, {'pos': 100, 'alt': 'AT'},
+            {'pos': 150, 'alt': 'G'}]
+        self.assertEqual(lookup_scores(table, sites),
+            [4.4, 2.123456789, 1.1, None, None])
+    
+    def test_cache(self):
+        ''' check saving and loading tables from the cache
+        '''
+        cache = SiteCache(self.folder, 'grch37', ['rates'])
+        transcripts = [Transcript('ENST01'), Transcript('ENST02')]
+        
+        self.assertIsNone(cache.load('ABC', transcripts))
+        
+        table = build_site_table(self.rates, '1', self.severity,
+            self.constrained)
+        cache.save('ABC', transcripts, table)
+        
+        loaded = cache.load('ABC', transcripts[::-1])
+        self.assertEqual(loaded['chrom'], '1')
+        for key in table:
+            if key != 'chrom':
+                self.assertEqual(loaded[key].tolist(), table[key].tolist())
+        
+        # different transcripts, or different inputs don't use the saved table
+        self.assertIsNone(cache.load('ABC', transcripts[:1]))
+        cache = SiteCache(self.folder, 'grch37', ['other_rates'])
+        self.assertIsNone(cache.load('ABC', transcripts))
+    
+    def test_memory_cache(self):
+        ''' check the in-memory cache keeps the most recently used genes
+        '''
+        backing = SiteCache(self.folder, 'grch37', ['rates'])
+        cache = MemorySiteCache(max_genes=2, backing=backing)
+        transcripts = [Transcript('ENST01')]
+        table = build_site_table(self.rates, '1', self.severity,
+            self.constrained)
+        
+        for symbol in ['A', 'B']:
+            cache.save(symbol, transcripts, table)
+        cache.load('A', transcripts)
+        cache.save('C', transcripts, table)
+        
+        # B was least recently used, so was dropped from memory
+        self.assertEqual(len(cache), 2)
+        self.assertEqual([ x[0] for x in cache.tables ], ['A', 'C'])
+        
+        # but it can still be loaded from the backing cache
+        self.assertEqual(cache.load('B', transcripts)['chrom'], '1')
+        self.assertIsNone(cache.load('D', transcripts))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)